@@ -0,0 +1,79 @@
+"""
+Benchmark per-turn history loading as sessions grow.
+
+Fills a throwaway database with sessions of increasing length and times
+`get_session_history`, which every agent turn calls once. With a bounded
+window the per-call cost should stay flat regardless of session size.
+
+Usage:
+    python scripts/bench_history.py [--sizes 100,1000,10000,50000] [--runs 50]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Point LiteClaw at a scratch WORK_DIR before anything imports the settings
+os.environ["WORK_DIR"] = tempfile.mkdtemp(prefix="liteclaw_bench_")
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from liteclaw.db import transaction  # noqa: E402
+from liteclaw.memory import get_session_history  # noqa: E402
+
+
+def fill_session(session_id: str, count: int):
+    """Insert `count` messages shaped like a real tool-using conversation."""
+    rows = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            rows.append((session_id, "user", f"[User (123)]: request number {i}", None, None, None))
+        elif kind == 1:
+            calls = json.dumps([{"id": f"call_{i}", "type": "function",
+                                 "function": {"name": "execute_command", "arguments": "{\"command\": \"ls\"}"}}])
+            rows.append((session_id, "assistant", None, calls, None, None))
+        elif kind == 2:
+            rows.append((session_id, "tool", "file_a\nfile_b\n" * 20, None, f"call_{i - 1}", "execute_command"))
+        else:
+            rows.append((session_id, "assistant", f"Done with request {i - 3}.", None, None, None))
+
+    with transaction() as c:
+        c.execute("INSERT OR IGNORE INTO sessions (session_id) VALUES (?)", (session_id,))
+        c.executemany(
+            "INSERT INTO messages (session_id, role, content, tool_calls, tool_call_id, name) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000,50000", help="Comma-separated session lengths")
+    parser.add_argument("--runs", type=int, default=50, help="Timed calls per session")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    print(f"WORK_DIR: {os.environ['WORK_DIR']}")
+    print(f"{'messages':>10} {'loaded':>8} {'avg ms/turn':>12} {'p95 ms':>8}")
+
+    for size in sizes:
+        session_id = f"bench-{size}"
+        fill_session(session_id, size)
+        get_session_history(session_id)  # Warm up page cache
+
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            history = get_session_history(session_id)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings.sort()
+        avg = sum(timings) / len(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"{size:>10} {len(history):>8} {avg:>12.3f} {p95:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Check that inbound de-duplication has no reset boundary.
+
+The old processed-message set was wiped once it passed 1000 ids, so a
+redelivery arriving right after the wipe was processed a second time.
+This drives a DedupeStore through that boundary (and through LRU eviction,
+a restart, and concurrent redeliveries) and fails if any duplicate would be
+processed twice.
+
+Usage:
+    python scripts/check_dedupe.py [--capacity 1000] [--threads 16]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+
+# Point LiteClaw at a scratch WORK_DIR before anything imports the settings
+os.environ["WORK_DIR"] = tempfile.mkdtemp(prefix="liteclaw_dedupe_")
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from liteclaw.dedupe import DedupeStore  # noqa: E402
+
+
+def check(name: str, ok: bool) -> bool:
+    print(f"{'ok' if ok else 'FAIL':>4}  {name}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--capacity", type=int, default=1000, help="In-memory capacity (the old set was cleared at 1000)")
+    parser.add_argument("--threads", type=int, default=16, help="Concurrent redeliveries of one id")
+    args = parser.parse_args()
+    capacity = args.capacity
+    results = []
+
+    # 1. Across the old clear: ids seen just before the boundary are still duplicates just after it
+    store = DedupeStore("check-memory", capacity=capacity, ttl=3600)
+    for i in range(capacity):
+        store.seen(f"m{i}")
+    store.seen(f"m{capacity}") # Where the old set was wiped
+    redelivered = [f"m{i}" for i in range(capacity - 10, capacity + 1)]
+    results.append(check("no duplicate processed across the reset boundary", all(store.seen(k) for k in redelivered)))
+    results.append(check("memory bounded by capacity", store.metrics()["size"] <= capacity))
+    results.append(check("a new id is still processed", not store.seen("fresh")))
+
+    # 2. Persisted: an id evicted from the LRU, or seen before a restart, is still a duplicate
+    store = DedupeStore("check-persist", capacity=10, ttl=3600, persist=True)
+    for i in range(capacity + 1):
+        store.seen(f"p{i}")
+    results.append(check("id evicted from memory still a duplicate", store.seen("p0")))
+    restarted = DedupeStore("check-persist", capacity=10, ttl=3600, persist=True)
+    results.append(check("id seen before a restart still a duplicate", restarted.seen(f"p{capacity}")))
+
+    # 3. Concurrent redeliveries of one id: exactly one is processed
+    for persist in (False, True):
+        store = DedupeStore(f"check-threads-{persist}", capacity=capacity, ttl=3600, persist=persist)
+        barrier = threading.Barrier(args.threads)
+        outcomes = []
+
+        def deliver():
+            barrier.wait()
+            outcomes.append(store.seen("same-id"))
+
+        threads = [threading.Thread(target=deliver) for _ in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        results.append(check(f"{args.threads} concurrent redeliveries processed once (persist={persist})", outcomes.count(False) == 1))
+
+    print(f"WORK_DIR: {os.environ['WORK_DIR']}")
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
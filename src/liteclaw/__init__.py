@@ -1,5 +1,5 @@
 from .main import app
-from .agent import process_message, stream_process_message
+from .agent import process_message, stream_process_message, aprocess_message, astream_process_message, astream_events
 from .memory import create_session, add_message, get_session_history
 from .meta_memory import get_soul_memory, update_soul_memory, get_personality_memory, update_personality_memory
 
@@ -7,6 +7,9 @@ __all__ = [
     "app",
     "process_message",
     "stream_process_message",
+    "aprocess_message",
+    "astream_process_message",
+    "astream_events",
     "create_session",
     "add_message",
     "get_session_history",
@@ -1,15 +1,19 @@
 import json
-import os
-import requests
-from typing import List, Dict, Any, Generator
+from typing import List, Dict, Any, Generator, AsyncGenerator, Optional, Tuple
 from .config import settings
-from .tools import execute_command, get_system_info
-from .memory import add_message, get_session_history
-from .meta_memory import get_soul_memory, update_soul_memory, get_personality_memory, update_personality_memory, get_subconscious_memory, get_learning_memory, AGENT_FILE
-from .llm import get_full_model_name, configure_bedrock_env
-
-import litellm
+from .memory import MessageBuffer
+from .context import ContextManager
+from .meta_memory import get_soul_memory, get_personality_memory, get_subconscious_memory, get_learning_memory, get_agent_profile, get_memory_generation, get_memory_signature
+from .llm import configure_bedrock_env, get_model_profile
+from .cancel import CancelToken, TurnCancelled
+from .llm_cache import llm_cache
+from .router import create_router
+from .tool_registry import TOOL_EXECUTOR, ToolContext, get_tool, get_tool_schemas, run_tool, arun_tool
+
+import asyncio
 import threading
+import time
+import uuid
 
 # Singleton Vision Registry
 GLOBAL_VISION_AGENT = None
@@ -75,12 +79,40 @@ BASE_SYSTEM_PROMPT = """
     - The user should only need to give the command. YOU do all the work.
 """
 
+# Seconds between stat checks for edits made outside LiteClaw (e.g. by hand).
+# In-process writes through meta_memory invalidate the prompt immediately.
+PROMPT_CACHE_STAT_INTERVAL = 5.0
+
+_prompt_cache = {"prompt": None, "signature": None, "generation": -1, "checked_at": 0.0}
+_prompt_cache_lock = threading.Lock()
+
 def get_system_prompt():
-    prompt = ""
+    """
+    Return the assembled system prompt, rebuilding it only when a memory file changes.
+    The identity and fixed directives come first and the evolving memories last,
+    so the prompt prefix stays byte-identical across turns for provider-side caching.
+    """
+    now = time.monotonic()
+    generation = get_memory_generation()
+    with _prompt_cache_lock:
+        cache = dict(_prompt_cache)
+    if (cache["prompt"] is not None and cache["generation"] == generation
+            and now - cache["checked_at"] < PROMPT_CACHE_STAT_INTERVAL):
+        return cache["prompt"]
+
+    signature = get_memory_signature()
+    if cache["prompt"] is not None and cache["signature"] == signature and cache["generation"] == generation:
+        prompt = cache["prompt"]
+    else:
+        prompt = _build_system_prompt()
+
+    with _prompt_cache_lock:
+        _prompt_cache.update(prompt=prompt, signature=signature, generation=generation, checked_at=now)
+    return prompt
+
+def _build_system_prompt():
     # 1. Load Agent Profile (Identity)
-    if os.path.exists(AGENT_FILE):
-        with open(AGENT_FILE, "r", encoding="utf-8") as f:
-            prompt = f.read()
+    prompt = get_agent_profile()
     
     # 2. Add Fixed Technical Directives
     prompt += f"\n\n{BASE_SYSTEM_PROMPT}"
@@ -107,290 +139,169 @@ def get_system_prompt():
 
 SYSTEM_PROMPT = get_system_prompt()
 
-# Tool Definitions
-TOOLS = [
-    {
-        "type": "function",
-        "function": {
-            "name": "execute_command",
-            "description": "Run a shell command on the host system (Windows PowerShell).",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "command": {"type": "string", "description": "The command to execute."}
-                },
-                "required": ["command"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "get_system_info",
-            "description": "Discover system details, including available browsers and screen resolution. Use this before assuming specific software exists or for 'exploring' the machine.",
-            "parameters": {"type": "object", "properties": {}}
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "update_soul",
-            "description": "Update persistent memory about the user (preferences, key details).",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "content": {"type": "string", "description": "The new information to remember about the user."}
-                },
-                "required": ["content"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "update_personality",
-            "description": "Update your own persistent personality, emotional state, and internal rules based on interactions.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "content": {"type": "string", "description": "The updated PERSONALITY.md content including new traits, emotions, or rules."}
-                },
-                "required": ["content"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "update_subconscious",
-            "description": "Store innovative ideas, error patterns, technical realizations, or experimental computer tasks for future autonomous action. Use this to 'learn' from your environment.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "content": {"type": "string", "description": "The new content for your subconscious memory."}
-                },
-                "required": ["content"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "delegate_task",
-            "description": "Delegate a complex, high-intensity, or background task to a sub-agent. Once delegated, YOU MUST STOP and wait; do not attempt the task yourself.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "sub_agent_name": {"type": "string"},
-                    "task": {"type": "string"}
-                },
-                "required": ["sub_agent_name", "task"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "list_sub_agents",
-            "description": "List all sub-agents and their statuses.",
-            "parameters": {"type": "object", "properties": {}}
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "kill_sub_agent",
-            "description": "Gracefully terminate a specific sub-agent by name. Use this instead of system commands to stop sub-agents.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "sub_agent_name": {"type": "string", "description": "Name of the sub-agent to terminate."}
-                },
-                "required": ["sub_agent_name"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "message_sub_agent",
-            "description": "Send a message or instruction to another active sub-agent (including the Vision agent).",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "sub_agent_name": {"type": "string", "description": "Name of the target sub-agent or 'vision'."},
-                    "message": {"type": "string", "description": "The message or new goal to send."}
-                },
-                "required": ["sub_agent_name", "message"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "kill_all_sub_agents",
-            "description": "Terminate all active sub-agents in the current session.",
-            "parameters": {"type": "object", "properties": {}}
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "create_session",
-            "description": "Create a new independent session.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "session_id": {"type": "string"}
-                },
-                "required": ["session_id"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "fetch_url_content",
-            "description": "Fetch text content from a URL.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "url": {"type": "string"}
-                },
-                "required": ["url"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "manage_skills",
-            "description": "Download, read, or list community skills.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "action": {"type": "string", "enum": ["download", "read", "list"]},
-                    "skill_name": {"type": "string", "description": "Name of the skill module."},
-                    "url": {"type": "string", "description": "URL for download action."}
-                },
-                "required": ["action"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "manage_cron_job",
-            "description": "Create, list, or delete scheduled cron jobs.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "action": {"type": "string", "enum": ["create", "list", "delete"]},
-                    "name": {"type": "string", "description": "Name of the job (for create)"},
-                    "schedule_type": {"type": "string", "enum": ["cron", "interval", "webhook"], "description": "Type of schedule"},
-                    "schedule_value": {"type": "string", "description": "Cron string (e.g. '* * * * *') or seconds (e.g. '60')"},
-                    "task": {"type": "string", "description": "The prompt/task for the agent to execute"},
-                    "job_id": {"type": "string", "description": "Job ID (for delete)"}
-                },
-                "required": ["action"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "send_media",
-            "description": "Send an image, video, gif, or document to the user.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "url_or_path": {"type": "string", "description": "Absolute local path or remote URL of the media file."},
-                    "caption": {"type": "string", "description": "Optional caption for the media."},
-                    "type": {"type": "string", "enum": ["image", "video", "gif", "document", "audio"], "description": "Type of media."}
-                },
-                "required": ["url_or_path", "type"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "search_and_send_gif",
-            "description": "Search for a hilarious GIF on Giphy and send it to the user.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "query": {"type": "string", "description": "The search term (e.g., 'hilarious cat', 'victory dance')."},
-                    "caption": {"type": "string", "description": "Optional caption for the GIF."}
-                },
-                "required": ["query"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "vision_task",
-            "description": "PRIMARY tool for controlling the computer. Use this to click, type, and interact with ANY application on the screen (Windows, Apps, Browsers). Use this when asked to 'open a browser', 'use VS Code', 'check my email', etc.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "goal": {"type": "string", "description": "The goal or instruction for the vision agent."},
-                    "max_steps": {"type": "integer", "default": 40, "description": "Maximum steps allowed."},
-                    "is_correction": {"type": "boolean", "default": False, "description": "If true, this goal is treated as an immediate correction/feedback for the CURRENTLY running task."}
-                },
-                "required": ["goal"]
-            }
-        }
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "take_break",
-            "description": "Take a rest for a specified duration to ensure system stability and mental clarity. Use this when tasks are completed or you need to pause.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "duration_minutes": {"type": "integer", "default": 30, "description": "Duration of the break in minutes (min 30)."}
-                },
-                "required": ["duration_minutes"]
-            }
-        }
-    },
-
-    {
-        "type": "function",
-        "function": {
-            "name": "update_learning",
-            "description": "Store best practices, refined workflows, lessons learned, and self-organization strategies evolved from your work. Use this to continuously improve your professional standards.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "content": {"type": "string", "description": "The new content for your learning memory."}
-                },
-                "required": ["content"]
-            }
-        }
-    }
-]
 
 
+# --- Tool batching ---
+
+def _is_parallel_safe(func_name: str, args_str: str) -> bool:
+    spec = get_tool(func_name)
+    if not spec or not spec.parallel_safe:
+        return False
+    try:
+        return spec.is_parallel_safe(json.loads(args_str))
+    except Exception:
+        return False
+
+def _group_tool_calls(tool_calls: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    Split one step's tool calls into execution groups, keeping call order.
+    Consecutive parallel-safe calls share a group; any other call is a group of its own.
+    Repeats of an identical (name, arguments) call are marked `_duplicate` on a copy.
+    """
+    groups = []
+    seen = set()
+    last_safe = False
+    for tc in tool_calls:
+        key = (tc["function"]["name"], tc["function"]["arguments"])
+        if key in seen:
+            tc = {**tc, "_duplicate": True}
+        seen.add(key)
+
+        safe = _is_parallel_safe(*key)
+        if safe and last_safe:
+            groups[-1].append(tc)
+        else:
+            groups.append([tc])
+        last_safe = safe
+    return groups
+
+def _tool_message(tc: Dict[str, Any], content: Any, skipped: bool = False) -> Dict[str, Any]:
+    msg = {
+        "tool_call_id": tc["id"],
+        "role": "tool",
+        "name": tc["function"]["name"],
+        "content": str(content)
+    }
+    if skipped:
+        # Popped before persisting; tells the caller not to count this result
+        msg["skipped"] = True
+    return msg
+
+def _duplicate_message(tc: Dict[str, Any]) -> Dict[str, Any]:
+    func_name = tc["function"]["name"]
+    return _tool_message(tc, f"Skipped: duplicate of an earlier {func_name} call in this batch.", skipped=True)
+
+def _drain(gen: Generator) -> tuple:
+    """Run a generator to completion on a worker thread. Returns (yielded lines, return value)."""
+    lines = []
+    try:
+        while True:
+            lines.append(next(gen))
+    except StopIteration as stop:
+        return lines, stop.value
+
+def _merge_tool_call_deltas(tool_calls: List[Dict[str, Any]], deltas) -> None:
+    """Accumulate streamed tool-call fragments into complete tool_calls entries."""
+    for tc_delta in deltas:
+        idx = tc_delta.index
+        if idx >= len(tool_calls):
+            tool_calls.append({
+                "id": tc_delta.id,
+                "type": "function",
+                "function": {"name": "", "arguments": ""}
+            })
+        if tc_delta.id:
+            tool_calls[idx]["id"] = tc_delta.id
+        if tc_delta.function.name:
+            tool_calls[idx]["function"]["name"] += tc_delta.function.name
+        if tc_delta.function.arguments:
+            tool_calls[idx]["function"]["arguments"] += tc_delta.function.arguments
+
+def _replay_tool_calls(tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Tool calls of a cached step, with fresh ids so they never clash with earlier ones in the history."""
+    return [
+        {**tc, "id": f"call_{uuid.uuid4().hex[:24]}", "function": dict(tc["function"])}
+        for tc in tool_calls
+    ]
+
+HALT_MESSAGE = "\n\n" + "="*40 + "\n[SYSTEM HALT - TOO MANY FAILURES]\n" + "="*40 + "\n⛔ You have failed 3 times in a row. EXECUTION STOPPED.\n\nREQUIRED ACTION:\n1. 🛑 STOP blindly retrying.\n2. 🧠 ENTER 'THINKING MODE': Analyze the last 3 errors step-by-step.\n3. 🔍 IDENTIFY the root cause (Is it syntax? Authority? Wrong tool? Missing dependency?)\n4. 📝 PLAN a corrected approach.\n5. RESTART execution with the new plan.\n"
+
+class _ToolStep:
+    """Records one step's tool results: batch stopping and the consecutive-failure tracker."""
+    def __init__(self, messages: List[Dict[str, Any]], writer: MessageBuffer):
+        self.messages = messages
+        self.writer = writer
+        self.stopped = False
+        self.consecutive_failures = 0
+        self.halt_msg = None
+
+    def skip(self, group: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Every call still needs a result for the next request to be valid
+        return [_tool_message(tc, "Skipped: batch stopped before this call ran.", skipped=True) for tc in group]
+
+    def record(self, tool_msg: Dict[str, Any]) -> Optional[str]:
+        """Store one tool result. Returns a progress line when the failure halt triggers."""
+        skipped = tool_msg.pop("skipped", False)
+        self.messages.append(tool_msg)
+        self.writer.add(tool_msg)
+        if self.stopped or skipped:
+            return None
+
+        # e.g. delegate_task: the sub-agent owns the rest of the work
+        spec = get_tool(tool_msg["name"])
+        if spec and spec.stops_batch:
+            self.stopped = True
+
+        # --- GLOBAL FAILURE TRACKER ---
+        last_content = str(tool_msg["content"]).lower()
+        is_failure = "error" in last_content or "failed" in last_content or "exception" in last_content
+        
+        if is_failure:
+            self.consecutive_failures += 1
+        else:
+            self.consecutive_failures = 0 # Reset on success
+            
+        # CHECK THRESHOLD (3 Failures)
+        if self.consecutive_failures >= 3:
+            # Append a system message to FORCE the AI to stop and think
+            self.halt_msg = {"role": "user", "content": HALT_MESSAGE}
+            self.stopped = True # Stop processing further tools in this batch to force reflection
+            return f">>> [SYSTEM]: ⛔ 3 Consecutive Failures Detected ({self.consecutive_failures}). Triggering Analysis Mode.\n"
+        return None
+
+    def finish(self):
+        # The halt goes after all tool results so the call/result block stays contiguous
+        if self.halt_msg:
+            self.messages.append(self.halt_msg)
+            self.writer.add(self.halt_msg)
+
 class LiteClawAgent:
-    def __init__(self):
-        self.model = settings.LLM_MODEL
-        self.api_key = settings.LLM_API_KEY
-        self.base_url = settings.LLM_BASE_URL
-        self.provider = settings.LLM_PROVIDER
+    def __init__(self, cache: bool = False, profile: str = "interactive"):
+        # Opt-in reuse of identical LLM steps (cacheable cron jobs)
+        self.cache = cache
+        # Which model this agent runs on: chats get the main model, background work a cheaper one
+        self.profile = get_model_profile(profile)
+        self.model = self.profile.model
+        self.api_key = self.profile.api_key
+        self.base_url = self.profile.base_url
+        self.provider = self.profile.provider
 
         # Configure Bedrock env if needed (no-op for other providers)
         configure_bedrock_env()
 
         # Normalize model name for LiteLLM routing
-        self.full_model_name = get_full_model_name(self.provider, self.model, self.base_url)
+        self.full_model_name = self.profile.full_model_name
 
-    def process_message(self, user_message: str, session_id: str = "default", platform: str = "whatsapp") -> str:
-        # Check for Break Time
-        import time
+        # Token-budgeted history with a rolling summary of evicted turns
+        self.context = ContextManager(self.full_model_name, self.api_key, self.base_url, get_model_profile("summarization"))
+
+        # This model first, then the main model for a light profile, then LLM_FALLBACKS, with failover and hedging
+        self.router = create_router(
+            self.provider, self.model, self.api_key, self.base_url, self.profile.priority, self.profile.fallback_model
+        )
+
+    def _check_break(self, user_message: str) -> Optional[str]:
+        """Return the 'on a break' reply if the agent is resting, else None."""
         now = time.time()
         if settings.BREAK_UNTIL > now:
             remaining = int((settings.BREAK_UNTIL - now) / 60)
@@ -400,449 +311,412 @@ class LiteClawAgent:
                 settings.BREAK_UNTIL = 0 # Force wake up
             else:
                 return f"I am currently on a scheduled break for another {remaining} minutes to maintain peak cognitive performance. Please reach out after that, or say 'wake up' if it's an emergency."
+        return None
+
+    def _start_turn(self, user_message: str, session_id: str) -> Tuple[List[Dict[str, Any]], MessageBuffer]:
+        """Build the prompt for a turn and a write buffer holding the user message."""
+        current_system_prompt = get_system_prompt()
+        history = self.context.build_history(session_id, current_system_prompt, user_message)
+        messages = [{"role": "system", "content": current_system_prompt}] + history
+        user_msg_obj = {"role": "user", "content": user_message}
+        messages.append(user_msg_obj)
+        # Persisted with the first completed step (or when the turn ends)
+        writer = MessageBuffer(session_id)
+        writer.add(user_msg_obj)
+        return messages, writer
+
+    def _completion_kwargs(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # Model, key and base URL are filled in by the router per endpoint
+        return {
+            "messages": messages,
+            "tools": get_tool_schemas(),
+            "tool_choice": "auto",
+            "stream": True,
+            # Final chunk reports token usage (turn usage events, TPM accounting)
+            "stream_options": {"include_usage": True},
+        }
+
+    def _cache_lookup(self, messages: List[Dict[str, Any]]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """(key, cached step) for the next LLM call. The key is None when this agent does not cache."""
+        if not (self.cache and llm_cache.enabled):
+            return None, None
+        key = llm_cache.key(self.full_model_name, messages, get_tool_schemas())
+        return key, llm_cache.get(key)
+
+    def process_message(self, user_message: str, session_id: str = "default", platform: str = "whatsapp", cancel: Optional[CancelToken] = None, recipient: Optional[str] = None) -> str:
+        # Check for Break Time
+        on_break = self._check_break(user_message)
+        if on_break:
+            return on_break
 
         response_content = ""
 
-        for chunk in self.stream_process_message(user_message, session_id, platform):
+        for chunk in self.stream_process_message(user_message, session_id, platform, cancel, recipient):
             print(chunk, end="", flush=True)
             if not chunk.startswith(">>> "):
                 response_content += chunk
         return response_content
 
-    def stream_process_message(self, user_message: str, session_id: str = "default", platform: str = "whatsapp") -> Generator[str, None, None]:
-        current_system_prompt = get_system_prompt()
-        history = get_session_history(session_id)
-        messages = [{"role": "system", "content": current_system_prompt}] + history
-        user_msg_obj = {"role": "user", "content": user_message}
-        messages.append(user_msg_obj)
-        add_message(session_id, user_msg_obj)
+    def stream_process_message(self, user_message: str, session_id: str = "default", platform: str = "whatsapp", cancel: Optional[CancelToken] = None, recipient: Optional[str] = None) -> Generator[str, None, None]:
+        """
+        Run one turn, yielding reply text and `>>> ` progress lines. With a
+        `cancel` token the turn stops between LLM chunks and tool calls, aborts
+        an in-flight LLM stream and raises TurnCancelled once it is cancelled.
+        `recipient` is the chat tools message when it is not `session_id`
+        (a sub-agent works in its own session but talks to the parent's user).
+        """
+        messages, writer = self._start_turn(user_message, session_id)
+        try:
+            yield from self._run_turn(messages, writer, ToolContext(self, session_id, platform, cancel, recipient))
+        finally:
+            writer.flush()
+
+    def _call_tool(self, tc: Dict[str, Any], ctx: ToolContext) -> Generator[str, None, Dict[str, Any]]:
+        """Run one tool call with its progress framing. Returns the `role: tool` message."""
+        func_name = tc["function"]["name"]
+        func_args_str = tc["function"]["arguments"]
+
+        yield f">>> --- 🛠️ Tool Call: {func_name} ---\n"
+        yield f">>> Arguments: {func_args_str}\n"
+
+        try:
+            func_args = json.loads(func_args_str)
+            spec = get_tool(func_name)
+            if spec:
+                tool_output = yield from run_tool(spec, func_args, ctx)
+            else:
+                tool_output = f"Unknown tool: {func_name}"
+            yield f">>> --- ✅ Done: {func_name} ---\n\n"
+            return _tool_message(tc, tool_output)
+        except TurnCancelled:
+            raise
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            error_msg = f"Error: {str(e)}"
+            yield f">>> [CRITICAL TOOL ERROR]: {error_msg}\n"
+            return _tool_message(tc, error_msg)
+
+    def _run_tool_group(self, group: List[Dict[str, Any]], ctx: ToolContext) -> Generator[str, None, List[Dict[str, Any]]]:
+        """
+        Run one group from _group_tool_calls. A single call streams its progress live;
+        a parallel group runs on TOOL_EXECUTOR and replays each call's buffered
+        progress in the original call order, so the output stays deterministic.
+        """
+        runnable = [tc for tc in group if not tc.get("_duplicate")]
+        parallel = len(runnable) > 1
+        if parallel:
+            yield f">>> [Parallel]: Running {len(runnable)} read-only tools concurrently...\n"
+            futures = {tc["id"]: TOOL_EXECUTOR.submit(_drain, self._call_tool(tc, ctx)) for tc in runnable}
+
+        tool_msgs = []
+        for tc in group:
+            if tc.get("_duplicate"):
+                yield f">>> [Skipped duplicate call: {tc['function']['name']}]\n"
+                tool_msgs.append(_duplicate_message(tc))
+            elif parallel:
+                lines, tool_msg = futures[tc["id"]].result()
+                for line in lines:
+                    yield line
+                tool_msgs.append(tool_msg)
+            else:
+                tool_msg = yield from self._call_tool(tc, ctx)
+                tool_msgs.append(tool_msg)
+        return tool_msgs
 
+    def _run_turn(self, messages: List[Dict[str, Any]], writer: MessageBuffer, ctx: ToolContext) -> Generator[str, None, None]:
+        cancel = ctx.cancel
         while True:
             try:
-                # Robustness: Retry mechanism for API flakiness
-                max_retries = 3
-                retry_count = 0
-                response = None
-                
-                while retry_count < max_retries:
-                    try:
-                        response = litellm.completion(
-                            model=self.full_model_name,
-                            messages=messages,
-                            api_key=self.api_key,
-                            base_url=self.base_url,
-                            tools=TOOLS,
-                            tool_choice="auto",
-                            stream=True
-                        )
-                        break # Success
-                    except Exception as e:
-                        retry_count += 1
-                        yield f">>> [System]: Connection hiccup ({str(e)}). Retrying {retry_count}/{max_retries}...\n"
-                        import time
-                        time.sleep(2)
-                        if retry_count >= max_retries:
-                            raise e
-
+                if cancel:
+                    cancel.raise_if_cancelled()
                 full_content = ""
                 tool_calls = []
-                
-                for chunk in response:
-                    delta = chunk.choices[0].delta
-                    if delta.content:
-                        full_content += delta.content
-                        yield delta.content
-                    
-                    if delta.tool_calls:
-                        for tc_delta in delta.tool_calls:
-                            idx = tc_delta.index
-                            if idx >= len(tool_calls):
-                                tool_calls.append({
-                                    "id": tc_delta.id,
-                                    "type": "function",
-                                    "function": {"name": "", "arguments": ""}
-                                })
-                            if tc_delta.id:
-                                tool_calls[idx]["id"] = tc_delta.id
-                            if tc_delta.function.name:
-                                tool_calls[idx]["function"]["name"] += tc_delta.function.name
-                            if tc_delta.function.arguments:
-                                tool_calls[idx]["function"]["arguments"] += tc_delta.function.arguments
+
+                cache_key, cached = self._cache_lookup(messages)
+                if cached:
+                    full_content = cached["content"]
+                    tool_calls = _replay_tool_calls(cached["tool_calls"])
+                    if full_content:
+                        yield full_content
+                else:
+                    # Robustness: retries and failover across endpoints (see router.py)
+                    started = time.monotonic()
+                    response = yield from self.router.open(self._completion_kwargs(messages), cancel)
+
+                    for chunk in response:
+                        if cancel:
+                            cancel.raise_if_cancelled()
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta
+                        if delta.content:
+                            full_content += delta.content
+                            yield delta.content
+
+                        if delta.tool_calls:
+                            _merge_tool_call_deltas(tool_calls, delta.tool_calls)
+
+                    if cache_key and (full_content or tool_calls):
+                        llm_cache.put(cache_key, self.full_model_name, {"content": full_content, "tool_calls": tool_calls}, time.monotonic() - started)
 
                 if full_content:
                     assistant_msg = {"role": "assistant", "content": full_content}
                     messages.append(assistant_msg)
-                    add_message(session_id, assistant_msg)
+                    writer.add(assistant_msg)
 
                 if tool_calls:
-                    executed_calls = set()
                     assistant_msg_tools = {"role": "assistant", "content": None, "tool_calls": tool_calls}
                     messages.append(assistant_msg_tools)
-                    add_message(session_id, assistant_msg_tools)
-
-                    stop_batch = False
-                    consecutive_failures = 0
-                    screenshot_sent_this_turn = False  # Track if browser already sent a screenshot
-
-                    for tc in tool_calls:
-                        if stop_batch: break
-                        
-                        func_name = tc["function"]["name"]
-                        func_args_str = tc["function"]["arguments"]
-                        call_key = (func_name, func_args_str)
-                        
-                        if call_key in executed_calls:
-                            yield f">>> [Skipped duplicate call: {func_name}]\n"
-                            continue
-                        executed_calls.add(call_key)
-                        
-                        yield f">>> --- 🛠️ Tool Call: {func_name} ---\n"
-                        yield f">>> Arguments: {func_args_str}\n"
-                        
-                        try:
-                            func_args = json.loads(func_args_str)
-                            
-                            if func_name == "execute_command":
-                                yield f">>> [Shell]: Executing command...\n"
-                                tool_output = execute_command(func_args.get("command"))
-                                display_output = (str(tool_output)[:500] + '...') if tool_output and len(str(tool_output)) > 500 else str(tool_output)
-                                yield f">>> [Result]: {display_output}\n"
-                            
-                            elif func_name == "get_system_info":
-                                yield f">>> [System]: Discovering environment...\n"
-                                tool_output = get_system_info()
-                                yield f">>> [Result]: {tool_output}\n"
-                            
-                            elif func_name == "update_soul":
-                                yield f">>> [Soul]: Updating user memory...\n"
-                                tool_output = update_soul_memory(func_args.get("content"))
-                                yield f">>> [Result]: {tool_output}\n"
-
-                            elif func_name == "update_personality":
-                                yield f">>> [Personality]: Evolving...\n"
-                                tool_output = update_personality_memory(func_args.get("content"))
-                                yield f">>> [Result]: {tool_output}\n"
-
-                            elif func_name == "update_subconscious":
-                                yield f">>> [Subconscious]: Storing insight...\n"
-                                from .meta_memory import update_subconscious_memory
-                                tool_output = update_subconscious_memory(func_args.get("content"))
-                                yield f">>> [Result]: {tool_output}\n"
-                            
-                            elif func_name == "update_learning":
-                                yield f">>> [Learning]: Evolving best practices...\n"
-                                from .meta_memory import update_learning_memory
-                                tool_output = update_learning_memory(func_args.get("content"))
-                                yield f">>> [Result]: {tool_output}\n"
-
-
-                            # ... [Other tool handlers remain here, simply consolidated logic below] ...
-
-                            elif func_name == "delegate_task":
-                                from .subagent import sub_agent_manager
-                                from .main import WHATSAPP_BRIDGE_URL
-                                import httpx
-                                
-                                sub_agent_name = func_args.get("sub_agent_name")
-                                task = func_args.get("task")
-                                yield f">>> [Sub-Agent]: Delegating background task to '{sub_agent_name}'...\n"
-                                tool_output = sub_agent_manager.delegate_task(session_id, sub_agent_name, task, platform=platform)
-                                yield f"🔔 [System]: Background agent '{sub_agent_name}' has been started for task: {task[:100]}...\n"
-                                yield f">>> [Status]: {tool_output}\n"
-                                
-                                # Send immediate notification to user via their platform
-                                try:
-                                    import asyncio
-                                    async def notify_user():
-                                        async with httpx.AsyncClient(timeout=10.0) as client:
-                                            await client.post(f"{WHATSAPP_BRIDGE_URL}/whatsapp/send", json={
-                                                "to": session_id,
-                                                "message": f"[LiteClaw] 🤖 **Sub-Agent '{sub_agent_name}' Started**\n\n📋 Task: {task[:200]}{'...' if len(task) > 200 else ''}\n\n⏳ Working in the background... I'll notify you when it's done!",
-                                                "platform": platform
-                                            })
-                                    
-                                    # Run the async notification
-                                    try:
-                                        loop = asyncio.get_event_loop()
-                                        if loop.is_running():
-                                            asyncio.ensure_future(notify_user())
-                                        else:
-                                            asyncio.run(notify_user())
-                                    except RuntimeError:
-                                        asyncio.run(notify_user())
-                                    
-                                    yield f">>> [Notification]: Sent 'sub-agent started' message to user via {platform.title()}\n"
-                                except Exception as e:
-                                    yield f">>> [Notification Warning]: Could not notify user: {e}\n"
-                                
-                                # STOP EXECUTION after delegation to prevent Redundant Work
-                                stop_batch = True 
-
-                            # ... [Handling other tool calls logic] ...
-                            elif func_name == "list_sub_agents":
-                                from .subagent import sub_agent_manager
-                                yield f">>> [Sub-Agent]: Listing background agents...\n"
-                                sub_agents = sub_agent_manager.list_sub_agents(session_id)
-                                tool_output = json.dumps(sub_agents, indent=2)
-                                yield f">>> [Found]: {len(sub_agents)} sub-agents.\n"
-                            
-                            elif func_name == "kill_sub_agent":
-                                from .subagent import sub_agent_manager
-                                sub_agent_name = func_args.get("sub_agent_name")
-                                yield f">>> [Sub-Agent]: Terminating '{sub_agent_name}'...\n"
-                                tool_output = sub_agent_manager.kill_sub_agent(session_id, sub_agent_name)
-                                yield f">>> [Result]: {tool_output}\n"
-                            
-                            elif func_name == "message_sub_agent":
-                                from .subagent import sub_agent_manager
-                                sub_agent_name = func_args.get("sub_agent_name")
-                                text = func_args.get("message")
-                                # Identify sender
-                                sender = getattr(self, "name", "Session Agent")
-                                yield f">>> [Comm]: Sending message to '{sub_agent_name}'...\n"
-                                tool_output = sub_agent_manager.message_sub_agent(session_id, sub_agent_name, sender, text)
-                                yield f">>> [Result]: {tool_output}\n"
-
-                            elif func_name == "kill_all_sub_agents":
-                                from .subagent import sub_agent_manager
-                                yield f">>> [Sub-Agent]: Terminating all sub-agents...\n"
-                                tool_output = sub_agent_manager.kill_all_sub_agents(session_id)
-                                yield f">>> [Result]: {tool_output}\n"
-
-
-                            elif func_name == "create_session":
-                                from .memory import create_session
-                                new_sid = func_args.get("session_id")
-                                success = create_session(new_sid, parent_session_id=session_id)
-                                tool_output = f"Session '{new_sid}' created." if success else "Error creating session."
-                                yield f">>> [Session]: {tool_output}\n"
-
-                            elif func_name == "fetch_url_content":
-                                from .web_utils import fetch_url_content
-                                tool_output = fetch_url_content(func_args.get("url"))
-                                yield f">>> [Web]: Fetched {len(tool_output)} chars.\n"
-
-                            elif func_name == "manage_skills":
-                                from .web_utils import download_skill, get_skill_content, list_skills
-                                action = func_args.get("action")
-                                if action == "download":
-                                    tool_output = download_skill(func_args.get("url"), func_args.get("skill_name"))
-                                elif action == "read":
-                                     tool_output = get_skill_content(func_args.get("skill_name"))
-                                elif action == "list":
-                                    tool_output = ", ".join(list_skills())
-                                yield f">>> [Skills]: {action} complete.\n"
-                            
-                            elif func_name == "manage_cron_job":
-                                from .scheduler import cron_manager
-                                action = func_args.get("action")
-                                
-                                if action == "create":
-                                    yield f">>> [Cron]: Creating job '{func_args.get('name')}'...\n"
-                                    job_id = cron_manager.create_job(
-                                        func_args.get("name"), 
-                                        func_args.get("schedule_type"), 
-                                        func_args.get("schedule_value"), 
-                                        func_args.get("task")
-                                    )
-                                    tool_output = f"Job created with ID: {job_id}. Type: {func_args.get('schedule_type')}"
-                                    if func_args.get('schedule_type') == 'webhook':
-                                        tool_output += f"\nWebhook URL: /cron/webhook/{job_id}"
-                                    
-                                elif action == "list":
-                                    yield f">>> [Cron]: Listing jobs...\n"
-                                    jobs = cron_manager.list_jobs()
-                                    tool_output = json.dumps(jobs, indent=2, default=str)
-                                    yield f">>> [Found]: {len(jobs)} jobs.\n"
-                                    
-                                elif action == "delete":
-                                    yield f">>> [Cron]: Deleting job '{func_args.get('job_id')}'...\n"
-                                    cron_manager.delete_job(func_args.get("job_id"))
-                                    tool_output = "Job deleted."
-                                else:
-                                    tool_output = "Invalid action."
-
-                            elif func_name == "send_media":
-                                media_type = func_args.get('type')
-                                
-                                yield f">>> [Media]: Sending {media_type}...\n"
-                                from .main import WHATSAPP_BRIDGE_URL
-                                import requests
-                                
-                                caption = func_args.get("caption") or ""
-                                if caption:
-                                    caption = f"[LiteClaw] {caption}"
-                                else:
-                                    caption = "[LiteClaw]"
-
-                                media_payload = {
-                                    "to": session_id,
-                                    "url_or_path": func_args.get("url_or_path"),
-                                    "caption": caption,
-                                    "type": media_type,
-                                    "platform": platform,
-                                    "is_media": True
-                                }
-                                
-                                try:
-                                    resp = requests.post(f"{WHATSAPP_BRIDGE_URL}/whatsapp/send", json=media_payload)
-                                    tool_output = f"Media sent successfully. Status: {resp.status_code}"
-                                except Exception as e:
-                                    tool_output = f"Failed to send media: {str(e)}"
-                                yield f">>> [Media Result]: {tool_output}\n"
-
-                            elif func_name == "vision_task":
-                                global GLOBAL_VISION_AGENT
-                                goal = func_args.get("goal")
-                                
-                                if GLOBAL_VISION_AGENT and GLOBAL_VISION_AGENT.is_running:
-                                    if func_args.get("is_correction"):
-                                        # IMMEDIATE FEEDBACK
-                                        yield f">>> [Vision]: Injecting immediate correction...\n"
-                                        GLOBAL_VISION_AGENT.add_feedback(goal)
-                                        tool_output = f"Correction injected: '{goal}'"
-                                    else:
-                                        # QUEUE GOAL
-                                        yield f">>> [Vision]: Agent busy. Injecting goal into active queue...\n"
-                                        GLOBAL_VISION_AGENT.add_goal(goal)
-                                        tool_output = f"Goal '{goal}' queued. Position in queue: {len(GLOBAL_VISION_AGENT.goal_queue)}"
-                                    yield f">>> [Result]: {tool_output}\n"
-                                else:
-                                    # START NEW AGENT
-                                    yield f">>> [Vision]: Starting new Vision Agent for goal: {goal}...\n"
-                                    from .vision_agent import VisionAgent
-                                    
-                                    # Create & Register Singleton
-                                    GLOBAL_VISION_AGENT = VisionAgent(
-                                        goal=goal,
-                                        session_id=session_id,
-                                        platform=platform,
-                                        max_steps=func_args.get("max_steps", 15)
-                                    )
-                                    
-                                    # Run in Background Thread (Daemon-like)
-                                    def run_vision_bg():
-                                        result = GLOBAL_VISION_AGENT.run()
-                                        print(f"[Vision Thread] Finished. Result: {result}")
-                                        
-                                    t = threading.Thread(target=run_vision_bg, daemon=True)
-                                    t.start()
-                                    
-                                    tool_output = f"Vision Agent started. Goal '{goal}' is processing in background."
-                                    yield f">>> [Result]: {tool_output}\n"
-
-                            elif func_name == "search_and_send_gif":
-                                yield f">>> [GIF]: Searching for '{func_args.get('query')}'...\n"
-                                from .main import WHATSAPP_BRIDGE_URL
-                                import requests
-                                import random
-                                
-                                query = func_args.get("query")
-                                caption = func_args.get("caption") or ""
-                                giphy_key = settings.GIPHY_API_KEY
-                                
-                                if not giphy_key:
-                                    tool_output = "GIPHY_API_KEY is not configured. Ask the user to run onboarding or set it in config.json."
-                                else:
-                                    try:
-                                        # Search Giphy
-                                        giphy_url = "https://api.giphy.com/v1/gifs/search"
-                                        params = {
-                                            "api_key": giphy_key,
-                                            "q": query,
-                                            "limit": 20,
-                                            "rating": "pg"
-                                        }
-                                        r = requests.get(giphy_url, params=params)
-                                        data = r.json()
-                                        gifs = data.get('data', [])
-                                        
-                                        if not gifs:
-                                            tool_output = f"No GIFs found for '{query}'"
-                                        else:
-                                            best_gif = random.choice(gifs)['images']['original']['url']
-                                            
-                                            # Tag caption
-                                            final_caption = f"[LiteClaw] {caption}" if caption else "[LiteClaw]"
-                                            
-                                            media_payload = {
-                                                "to": session_id,
-                                                "url_or_path": best_gif,
-                                                "caption": final_caption,
-                                                "type": "gif",
-                                                "platform": platform,
-                                                "is_media": True
-                                            }
-                                            
-                                            resp = requests.post(f"{WHATSAPP_BRIDGE_URL}/whatsapp/send", json=media_payload)
-                                            tool_output = f"Hilarious GIF sent! (Query: {query})"
-                                    except Exception as e:
-                                        tool_output = f"Giphy Search Error: {str(e)}"
-                                
-                                yield f">>> [GIF Result]: {tool_output}\n"
-                            
-                            elif func_name == "take_break":
-                                import time
-                                duration = max(30, func_args.get("duration_minutes", 30))
-                                settings.BREAK_UNTIL = time.time() + (duration * 60)
-                                tool_output = f"Break scheduled for {duration} minutes. I will be resting until {time.ctime(settings.BREAK_UNTIL)}."
-                                yield f">>> [System]: {tool_output}\n"
-
-                            else:
-                                tool_output = f"Unknown tool: {func_name}"
-
-
-                            yield f">>> --- ✅ Done: {func_name} ---\n\n"
-                            
-                            tool_msg = {"tool_call_id": tc["id"], "role": "tool", "name": func_name, "content": tool_output}
-                            messages.append(tool_msg)
-                            add_message(session_id, tool_msg)
-
-                        except Exception as e:
-                            import traceback
-                            traceback.print_exc()
-                            error_msg = f"Error: {str(e)}"
-                            yield f">>> [CRITICAL TOOL ERROR]: {error_msg}\n"
-                            tool_msg = {"tool_call_id": tc["id"], "role": "tool", "name": func_name, "content": error_msg}
-                            messages.append(tool_msg)
-                            add_message(session_id, tool_msg)
-
-                        # --- GLOBAL FAILURE TRACKER ---
-                        # Check the content of the last added message (success or error)
-                        last_content = str(messages[-1]["content"]).lower()
-                        is_failure = "error" in last_content or "failed" in last_content or "exception" in last_content
-                        
-                        if is_failure:
-                            consecutive_failures += 1
+                    writer.add(assistant_msg_tools)
+
+                    step = _ToolStep(messages, writer)
+                    for group in _group_tool_calls(tool_calls):
+                        if cancel:
+                            cancel.raise_if_cancelled()
+                        if step.stopped:
+                            tool_msgs = step.skip(group)
                         else:
-                            consecutive_failures = 0 # Reset on success
-                            
-                        # CHECK THRESHOLD (3 Failures)
-                        if consecutive_failures >= 3:
-                            yield f">>> [SYSTEM]: ⛔ 3 Consecutive Failures Detected ({consecutive_failures}). Triggering Analysis Mode.\n"
-                            
-                            # Append a system message to FORCE the AI to stop and think
-                            halt_msg = {
-                                "role": "user", 
-                                "content": "\n\n" + "="*40 + "\n[SYSTEM HALT - TOO MANY FAILURES]\n" + "="*40 + "\n⛔ You have failed 3 times in a row. EXECUTION STOPPED.\n\nREQUIRED ACTION:\n1. 🛑 STOP blindly retrying.\n2. 🧠 ENTER 'THINKING MODE': Analyze the last 3 errors step-by-step.\n3. 🔍 IDENTIFY the root cause (Is it syntax? Authority? Wrong tool? Missing dependency?)\n4. 📝 PLAN a corrected approach.\n5. RESTART execution with the new plan.\n"
-                            }
-                            messages.append(halt_msg)
-                            add_message(session_id, halt_msg)
-                            
-                            stop_batch = True # Stop processing further tools in this batch to force reflection
+                            tool_msgs = yield from self._run_tool_group(group, ctx)
+                        for tool_msg in tool_msgs:
+                            notice = step.record(tool_msg)
+                            if notice:
+                                yield notice
+                    step.finish()
                     
+                    # Checkpoint: the step and all of its tool results land together
+                    writer.flush()
                     continue 
 
                 break
 
             except Exception as e:
+                if cancel and cancel.cancelled:
+                    # Includes errors from the stream or subprocess that the cancel aborted
+                    raise TurnCancelled(cancel.reason) from e
                 import traceback
                 traceback.print_exc()
                 yield f">>> [CRITICAL AI ERROR]: {str(e)}\n"
                 break
 
+    # --- Async core ---
+    # Same turn as above, driven from the event loop: the LLM stream uses
+    # litellm.acompletion and only blocking work (history build, DB flushes,
+    # tool handlers) is offloaded to threads. Used by the FastAPI endpoints.
+
+    async def aprocess_message(self, user_message: str, session_id: str = "default", platform: str = "whatsapp") -> str:
+        on_break = self._check_break(user_message)
+        if on_break:
+            return on_break
+
+        response_content = ""
+        async for chunk in self.astream_process_message(user_message, session_id, platform):
+            print(chunk, end="", flush=True)
+            if not chunk.startswith(">>> "):
+                response_content += chunk
+        return response_content
+
+    async def astream_process_message(self, user_message: str, session_id: str = "default", platform: str = "whatsapp") -> AsyncGenerator[str, None]:
+        """Text form of astream_events: reply tokens plus `>>> ` progress lines."""
+        async for kind, data in self.astream_events(user_message, session_id, platform):
+            text = render_event(kind, data)
+            if text:
+                yield text
+
+    async def astream_events(self, user_message: str, session_id: str = "default", platform: str = "whatsapp") -> AsyncGenerator[Tuple[str, Any], None]:
+        """
+        Run a turn and yield typed events as (kind, data):
+        ("token", str), ("progress", str), ("tool_start", {id, name, arguments}),
+        ("tool_result", {id, name, output, error}) and ("usage", {prompt_tokens, ...}) per LLM call.
+        Cancelling the consumer aborts the in-flight LLM request and cancels the
+        turn's CancelToken, which stops a running tool; completed steps are kept.
+        """
+        on_break = self._check_break(user_message)
+        if on_break:
+            yield "token", on_break
+            return
+
+        messages, writer = await asyncio.to_thread(self._start_turn, user_message, session_id)
+        cancel = CancelToken()
+        try:
+            async for event in self._arun_turn(messages, writer, ToolContext(self, session_id, platform, cancel)):
+                yield event
+        except (asyncio.CancelledError, GeneratorExit):
+            # The consumer went away: tool handlers run on worker threads and only see the token
+            cancel.cancel("The turn was cancelled.")
+            raise
+        finally:
+            await asyncio.to_thread(writer.flush)
+
+    async def _acall_tool(self, tc: Dict[str, Any], ctx: ToolContext, out: List[Dict[str, Any]]) -> AsyncGenerator[Tuple[str, Any], None]:
+        """Async _call_tool, as events. Appends the `role: tool` message to `out`."""
+        func_name = tc["function"]["name"]
+        func_args_str = tc["function"]["arguments"]
+
+        yield "tool_start", {"id": tc["id"], "name": func_name, "arguments": func_args_str}
+
+        try:
+            func_args = json.loads(func_args_str)
+            spec = get_tool(func_name)
+            tool_output = f"Unknown tool: {func_name}"
+            if spec:
+                async for kind, value in arun_tool(spec, func_args, ctx):
+                    if kind == "line":
+                        yield "progress", value
+                    else:
+                        tool_output = value
+            tool_msg = _tool_message(tc, tool_output)
+            out.append(tool_msg)
+            yield "tool_result", {"id": tc["id"], "name": func_name, "output": tool_msg["content"], "error": False}
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            error_msg = f"Error: {str(e)}"
+            out.append(_tool_message(tc, error_msg))
+            yield "tool_result", {"id": tc["id"], "name": func_name, "output": error_msg, "error": True}
+
+    async def _arun_tool_group(self, group: List[Dict[str, Any]], ctx: ToolContext, out: List[Dict[str, Any]]) -> AsyncGenerator[Tuple[str, Any], None]:
+        """Async _run_tool_group, as events. Appends the group's tool messages to `out` in call order."""
+        runnable = [tc for tc in group if not tc.get("_duplicate")]
+        parallel = len(runnable) > 1
+        if parallel:
+            yield "progress", f">>> [Parallel]: Running {len(runnable)} read-only tools concurrently...\n"
+
+            async def collect(tc):
+                events, msgs = [], []
+                async for event in self._acall_tool(tc, ctx, msgs):
+                    events.append(event)
+                return events, msgs[0]
+
+            tasks = {tc["id"]: asyncio.ensure_future(collect(tc)) for tc in runnable}
+
+        try:
+            for tc in group:
+                if tc.get("_duplicate"):
+                    yield "progress", f">>> [Skipped duplicate call: {tc['function']['name']}]\n"
+                    out.append(_duplicate_message(tc))
+                elif parallel:
+                    events, tool_msg = await tasks[tc["id"]]
+                    for event in events:
+                        yield event
+                    out.append(tool_msg)
+                else:
+                    async for event in self._acall_tool(tc, ctx, out):
+                        yield event
+        finally:
+            if parallel:
+                for task in tasks.values():
+                    task.cancel()
+
+    async def _arun_turn(self, messages: List[Dict[str, Any]], writer: MessageBuffer, ctx: ToolContext) -> AsyncGenerator[Tuple[str, Any], None]:
+        while True:
+            try:
+                full_content = ""
+                tool_calls = []
+
+                cache_key, cached = await asyncio.to_thread(self._cache_lookup, messages) if self.cache else (None, None)
+                if cached:
+                    full_content = cached["content"]
+                    tool_calls = _replay_tool_calls(cached["tool_calls"])
+                    if full_content:
+                        yield "token", full_content
+                else:
+                    response = None
+                    started = time.monotonic()
+                    async for kind, value in self.router.aopen(self._completion_kwargs(messages)):
+                        if kind == "notice":
+                            yield "progress", value
+                        else:
+                            response = value
+
+                    try:
+                        async for chunk in response:
+                            usage = getattr(chunk, "usage", None)
+                            if usage:
+                                yield "usage", _usage_dict(usage)
+                            if not chunk.choices:
+                                continue
+                            delta = chunk.choices[0].delta
+                            if delta.content:
+                                full_content += delta.content
+                                yield "token", delta.content
+
+                            if delta.tool_calls:
+                                _merge_tool_call_deltas(tool_calls, delta.tool_calls)
+                    finally:
+                        # Closes the provider connection when the consumer went away mid-stream
+                        aclose = getattr(response, "aclose", None)
+                        if aclose:
+                            await aclose()
+
+                    if cache_key and (full_content or tool_calls):
+                        step = {"content": full_content, "tool_calls": tool_calls}
+                        await asyncio.to_thread(llm_cache.put, cache_key, self.full_model_name, step, time.monotonic() - started)
+
+                if full_content:
+                    assistant_msg = {"role": "assistant", "content": full_content}
+                    messages.append(assistant_msg)
+                    writer.add(assistant_msg)
+
+                if tool_calls:
+                    assistant_msg_tools = {"role": "assistant", "content": None, "tool_calls": tool_calls}
+                    messages.append(assistant_msg_tools)
+                    writer.add(assistant_msg_tools)
+
+                    step = _ToolStep(messages, writer)
+                    for group in _group_tool_calls(tool_calls):
+                        tool_msgs = []
+                        if step.stopped:
+                            tool_msgs = step.skip(group)
+                        else:
+                            async for event in self._arun_tool_group(group, ctx, tool_msgs):
+                                yield event
+                        for tool_msg in tool_msgs:
+                            notice = step.record(tool_msg)
+                            if notice:
+                                yield "progress", notice
+                    step.finish()
+
+                    await asyncio.to_thread(writer.flush)
+                    continue
+
+                break
+
+            except Exception as e:
+                import traceback
+                traceback.print_exc()
+                yield "progress", f">>> [CRITICAL AI ERROR]: {str(e)}\n"
+                break
+
+
+def _usage_dict(usage) -> Dict[str, int]:
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+    }
+
+
+def render_event(kind: str, data: Any) -> Optional[str]:
+    """The text stream's form of a turn event (None for events it does not show)."""
+    if kind in ("token", "progress"):
+        return data
+    if kind == "tool_start":
+        return f">>> --- 🛠️ Tool Call: {data['name']} ---\n>>> Arguments: {data['arguments']}\n"
+    if kind == "tool_result":
+        if data["error"]:
+            return f">>> [CRITICAL TOOL ERROR]: {data['output']}\n"
+        return f">>> --- ✅ Done: {data['name']} ---\n\n"
+    return None
+
 agent = LiteClawAgent()
 def process_message(message: str, session_id: str = "default", platform: str = "whatsapp"):
     return agent.process_message(message, session_id, platform)
 def stream_process_message(message: str, session_id: str = "default", platform: str = "whatsapp"):
     return agent.stream_process_message(message, session_id, platform)
+async def aprocess_message(message: str, session_id: str = "default", platform: str = "whatsapp"):
+    return await agent.aprocess_message(message, session_id, platform)
+def astream_process_message(message: str, session_id: str = "default", platform: str = "whatsapp"):
+    return agent.astream_process_message(message, session_id, platform)
+def astream_events(message: str, session_id: str = "default", platform: str = "whatsapp"):
+    return agent.astream_events(message, session_id, platform)
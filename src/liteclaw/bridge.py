@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+
+from .config import settings
+
+# Endpoints of the Node bridge (bridge/index.js). Routing between WhatsApp,
+# Telegram and Slack is done by the "platform" field of the payload.
+SEND_ENDPOINT = "/whatsapp/send"
+EDIT_ENDPOINT = "/whatsapp/edit"
+TYPING_ENDPOINT = "/whatsapp/typing"
+STOP_TYPING_ENDPOINT = "/whatsapp/stop-typing"
+
+BRIDGE_TIMEOUT = httpx.Timeout(15.0, connect=5.0)
+# Connection attempts only: a POST that reached the bridge is never re-sent
+BRIDGE_CONNECT_RETRIES = 2
+# Node closes idle keep-alive sockets after 5s; drop ours first to avoid resets on reuse
+BRIDGE_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=4.0)
+
+
+class BridgeClient:
+    """
+    Long-lived, pooled HTTP clients for the Node bridge.
+
+    The sync client serves worker threads (tools, sub-agents, vision agent). Async
+    clients are bound to an event loop, so one is kept per loop (in practice just
+    the server's). Both reuse keep-alive connections across messages.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self._client: Optional[httpx.Client] = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _sync(self) -> httpx.Client:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(
+                        base_url=self.base_url,
+                        timeout=BRIDGE_TIMEOUT,
+                        transport=httpx.HTTPTransport(retries=BRIDGE_CONNECT_RETRIES, limits=BRIDGE_LIMITS),
+                    )
+        return self._client
+
+    def _async(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=BRIDGE_TIMEOUT,
+                transport=httpx.AsyncHTTPTransport(retries=BRIDGE_CONNECT_RETRIES, limits=BRIDGE_LIMITS),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    # --- Raw calls ---
+
+    def post(self, path: str, payload: Dict[str, Any]) -> httpx.Response:
+        return self._sync().post(path, json=payload)
+
+    async def apost(self, path: str, payload: Dict[str, Any]) -> httpx.Response:
+        return await self._async().post(path, json=payload)
+
+    # --- Messages ---
+
+    def send_message(self, to: str, message: str, platform: Optional[str] = None) -> httpx.Response:
+        return self.post(SEND_ENDPOINT, _message_payload(to, message, platform))
+
+    async def asend_message(self, to: str, message: str, platform: Optional[str] = None) -> httpx.Response:
+        return await self.apost(SEND_ENDPOINT, _message_payload(to, message, platform))
+
+    async def aedit_message(self, to: str, message_id: Any, message: str, platform: str) -> httpx.Response:
+        """Replace the text of a message sent earlier (Telegram only)."""
+        return await self.apost(EDIT_ENDPOINT, {"to": to, "message_id": message_id, "message": message, "platform": platform})
+
+    def send_media(self, to: str, url_or_path: str, media_type: str, caption: str, platform: str, message: Optional[str] = None) -> httpx.Response:
+        return self.post(SEND_ENDPOINT, _media_payload(to, url_or_path, media_type, caption, platform, message))
+
+    async def atyping(self, to: str, platform: str) -> httpx.Response:
+        return await self.apost(TYPING_ENDPOINT, {"to": to, "platform": platform})
+
+    async def astop_typing(self, to: str, platform: str) -> httpx.Response:
+        return await self.apost(STOP_TYPING_ENDPOINT, {"to": to, "platform": platform})
+
+    async def aclose(self):
+        """Close the pooled clients (server shutdown)."""
+        try:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        except RuntimeError:
+            client = None
+        if client is not None:
+            await client.aclose()
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+def _message_payload(to: str, message: str, platform: Optional[str]) -> Dict[str, Any]:
+    payload = {"to": to, "message": message}
+    if platform:
+        payload["platform"] = platform
+    return payload
+
+
+def _media_payload(to: str, url_or_path: str, media_type: str, caption: str, platform: str, message: Optional[str]) -> Dict[str, Any]:
+    payload = {
+        "to": to,
+        "url_or_path": url_or_path,
+        "caption": caption,
+        "type": media_type,
+        "platform": platform,
+        "is_media": True
+    }
+    if message:
+        payload["message"] = message
+    return payload
+
+
+bridge = BridgeClient(settings.BRIDGE_URL)
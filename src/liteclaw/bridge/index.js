@@ -287,7 +287,9 @@ app.post('/whatsapp/send', async (req, res) => {
                     await bot.sendDocument(chatId, mediaSource, { caption: caption });
                 }
             } else {
-                await bot.sendMessage(chatId, message);
+                // The id lets the backend edit this message while a reply streams in
+                const sent = await bot.sendMessage(chatId, message);
+                return res.json({ success: true, id: sent.message_id, platform: 'telegram' });
             }
             return res.json({ success: true, platform: 'telegram' });
         }
@@ -368,6 +370,33 @@ app.post('/whatsapp/send', async (req, res) => {
     }
 });
 
+// API to replace the text of a sent message (streamed replies). Telegram only.
+app.post('/whatsapp/edit', async (req, res) => {
+    const { to, message, platform, message_id } = req.body;
+
+    if (!to || !message || !message_id) {
+        return res.status(400).json({ error: "Missing 'to', 'message' or 'message_id'" });
+    }
+    if (platform !== 'telegram') {
+        return res.status(400).json({ error: `Editing is not supported on ${platform || 'whatsapp'}` });
+    }
+
+    try {
+        const { bot, chatId } = resolveTelegramTarget(to);
+        if (!bot) throw new Error("Telegram bot not initialized");
+        await bot.editMessageText(message, { chat_id: chatId, message_id: message_id });
+        res.json({ success: true, id: message_id, platform: 'telegram' });
+    } catch (error) {
+        const description = (error.response && error.response.body && error.response.body.description) || error.message || '';
+        // Telegram rejects an edit that changes nothing; the message already shows this text
+        if (description.includes('message is not modified')) {
+            return res.json({ success: true, id: message_id, platform: 'telegram' });
+        }
+        console.error('Error editing message (telegram):', error);
+        res.status(500).json({ success: false, error: description || error.toString() });
+    }
+});
+
 // --- Telegram Polling (Unified Multi-Bot Support) ---
 
 let telegramTokens = [];
@@ -1,9 +1,9 @@
 from dataclasses import dataclass
 from typing import Optional
 from .config import settings
+from .bridge import bridge
 import asyncio
 import time
-import httpx
 import threading
 import sys
 
@@ -18,9 +18,6 @@ class ActionResult:
 _pending_questions = {}
 _pending_answers = {}
 
-# Platform-specific endpoint mappings
-BRIDGE_SEND_ENDPOINT = "/whatsapp/send"
-
 async def ask_human_for_input(question: str, session_id: str, platform: str = "whatsapp", timeout: int = 300) -> ActionResult:
     """
     Ask the user for input during automation.
@@ -36,20 +33,18 @@ async def ask_human_for_input(question: str, session_id: str, platform: str = "w
         print(f"[Input] ⚠️ API platform doesn't support push notifications. Waiting for answer via API...")
     else:
         try:
-            # All platforms use the same endpoint - routing is based on "platform" field
-            bridge_url = f"http://localhost:3040{BRIDGE_SEND_ENDPOINT}"
+            # Pooled sync client: this often runs on a short-lived loop (see _run_async_task_in_thread)
+            response = await asyncio.to_thread(
+                bridge.send_message,
+                session_id,
+                f"[LiteClaw] ⏸️ Task Paused\n\n{question}\n\n💬 Please respond to continue.",
+                platform
+            )
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(bridge_url, json={
-                    "to": session_id,
-                    "message": f"[LiteClaw] ⏸️ Task Paused\n\n{question}\n\n💬 Please respond to continue.",
-                    "platform": platform
-                }, timeout=10.0)
-                
-                if response.status_code == 200:
-                    print(f"[Input] ✅ Sent question to user via {platform.title()}: {question[:100]}...")
-                else:
-                    print(f"[Input] ⚠️ Failed to send question: {response.text}")
+            if response.status_code == 200:
+                print(f"[Input] ✅ Sent question to user via {platform.title()}: {question[:100]}...")
+            else:
+                print(f"[Input] ⚠️ Failed to send question: {response.text}")
 
         except Exception as e:
             print(f"[Input] ❌ Failed to send question via {platform.title()}: {e}")
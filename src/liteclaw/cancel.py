@@ -0,0 +1,62 @@
+import threading
+from typing import Callable, List, Optional
+
+
+class TurnCancelled(Exception):
+    """Raised inside a turn whose CancelToken was cancelled."""
+
+
+class CancelToken:
+    """
+    Cooperative cancellation for one agent run.
+
+    The turn loop checks it between LLM chunks and tool calls. Work that blocks
+    (an LLM stream, a subprocess) registers a callback with on_cancel that
+    aborts it, so a cancelled run stops within moments instead of at the end of
+    its current step.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[Cancel] Abort callback failed: {e}")
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise TurnCancelled(self.reason)
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Run `callback` on cancel (now, if already cancelled). Returns a function that unregisters it."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Sleep up to `timeout` seconds; True as soon as the token is cancelled."""
+        return self._event.wait(timeout)
@@ -199,6 +199,56 @@ def pair():
         
     pair_whatsapp(bridge_dir, config.get("WORK_DIR", "."), config)
 
+def iter_sse(resp):
+    """Yield (event, data) pairs from a server-sent events response."""
+    event, data = "message", []
+    for line in resp.iter_lines(decode_unicode=True):
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+
+def stream_chat(host, session_id, message):
+    """Run one turn over /chat/stream, printing tokens and tool activity as they arrive."""
+    status = console.status("[bold green]LiteClaw is thinking...[/bold green]")
+    status.start()
+    started = False
+    try:
+        with requests.post(f"{host}/chat/stream", json={"message": message, "session_id": session_id}, stream=True) as resp:
+            resp.raise_for_status()
+            for event, data in iter_sse(resp):
+                if event == "token":
+                    if not started:
+                        status.stop()
+                        console.print("[bold magenta]LiteClaw[/bold magenta]: ", end="")
+                        started = True
+                    console.print(data["text"], end="", markup=False, highlight=False)
+                elif event == "tool_start":
+                    if started:
+                        console.print()
+                        started = False
+                    console.print(f"[dim]🛠️  {data['name']}[/dim]")
+                    status.update(f"[bold green]Running {data['name']}...[/bold green]")
+                    status.start()
+                elif event == "tool_result":
+                    mark = "❌" if data.get("error") else "✅"
+                    console.print(f"[dim]{mark} {data['name']}[/dim]")
+                    status.update("[bold green]LiteClaw is thinking...[/bold green]")
+                elif event == "error":
+                    console.print(f"\n[red]Error: {data.get('message')}[/red]")
+                elif event == "done":
+                    usage = data.get("usage") or {}
+                    if started:
+                        console.print()
+                    if usage.get("total_tokens"):
+                        console.print(f"[dim]{usage['prompt_tokens']} prompt + {usage['completion_tokens']} completion tokens[/dim]")
+    finally:
+        status.stop()
+
 @cli.command()
 @click.option('--host', default='http://localhost:8009', help='Gateway URL')
 def console_cli(host):
@@ -275,23 +325,14 @@ def console_cli(host):
             if user_input.strip().lower() in ['exit', 'quit']:
                 break
                 
-            # Send to API
-            with console.status("[bold green]LiteClaw is thinking...[/bold green]"):
-                try:
-                    # We use the non-streaming endpoint for simplicity in CLI for now
-                    resp = requests.post(f"{host}/chat", json={
-                        "message": user_input,
-                        "session_id": current_session,
-                        "stream": False
-                    })
-                    data = resp.json()
-                    reply = data.get("response", "")
-                    
-                    console.print(f"[bold magenta]LiteClaw[/bold magenta]: {reply}")
-                    console.print(f"[dim]--------------------------------------------------[/dim]")
-                    
-                except Exception as e:
-                    console.print(f"[red]Error sending message: {e}[/red]")
+            # Send to API and print the reply as it streams (Ctrl+C cancels the turn)
+            try:
+                stream_chat(host, current_session, user_input)
+            except KeyboardInterrupt:
+                console.print("\n[yellow]Interrupted.[/yellow]")
+            except Exception as e:
+                console.print(f"[red]Error sending message: {e}[/red]")
+            console.print(f"[dim]--------------------------------------------------[/dim]")
                     
         except KeyboardInterrupt:
             break
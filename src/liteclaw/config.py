@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, PydanticBaseSettingsSource
-from typing import Optional, Type, Tuple, Dict, Any
+from typing import Optional, Type, Tuple, Dict, Any, List
 import json
 import os
 import platform
@@ -42,9 +42,91 @@ class Settings(BaseSettings):
     SLACK_APP_TOKEN: Optional[str] = None
     SLACK_SIGNING_SECRET: Optional[str] = None
     WHATSAPP_SESSION_ID: str = "whatsapp" # Dedicated session for WhatsApp interactions
+    BRIDGE_URL: str = "http://localhost:3040" # Node bridge (bridge/index.js) for WhatsApp, Telegram and Slack
     
     # Break Time (Timestamp until when the agent is resting)
     BREAK_UNTIL: float = 0
+
+    # Conversation history window loaded into each turn
+    HISTORY_MAX_MESSAGES: int = 50 # Last N messages of the session
+    HISTORY_MAX_TOKENS: Optional[int] = None # Optional token budget for the window (estimated)
+
+    # Context compaction (see context.py)
+    CONTEXT_MAX_TOKENS: Optional[int] = None # Prompt budget; defaults to a share of the model's context window
+    CONTEXT_BUDGET_RATIO: float = 0.5 # Share of the model's context window used when CONTEXT_MAX_TOKENS is unset
+    CONTEXT_TOOL_OUTPUT_MAX_CHARS: int = 2000 # Tool outputs from earlier turns are truncated to this size
+    CONTEXT_SUMMARY_MIN_BATCH: int = 10 # Evicted messages needed before the rolling summary is extended
+
+    # Tool execution
+    TOOL_MAX_WORKERS: int = 8 # Threads for running read-only tool calls of one step concurrently
+    TOOL_SERIAL_MAX_WORKERS: int = 64 # Threads for the other tool calls of event-loop turns (commands, waits); kept apart so they never starve read-only calls
+
+    # Shell commands (see tools.py)
+    COMMAND_TIMEOUT: float = 60 # Seconds before a command's process group is killed, unless the call asks for another timeout
+    COMMAND_MAX_TIMEOUT: float = 600 # Longest timeout a call may ask for
+    COMMAND_OUTPUT_HEAD_CHARS: int = 4000 # Start of a command's stdout kept for the result (stderr keeps a quarter)
+    COMMAND_OUTPUT_TAIL_CHARS: int = 12000 # End of a command's stdout kept for the result (stderr keeps a quarter)
+    COMMAND_PROGRESS_INTERVAL: float = 1.0 # Min seconds between progress updates with a running command's latest output
+    SHELL_SESSIONS: bool = True # Run each agent session's commands in one persistent shell (see shell_sessions.py); off = a fresh process per command
+    SHELL_SESSION_IDLE_TIMEOUT: float = 600 # Seconds an unused shell is kept
+    SHELL_SESSION_MAX: int = 8 # Persistent shells at once; beyond this the least recently used idle one is closed
+
+    # Background jobs (see jobs.py)
+    JOB_MAX_RUNNING: int = 8 # Background commands running at once
+    JOB_RETENTION_HOURS: float = 72 # Finished jobs and their log files are deleted after this
+
+    # Inbound message dispatch (see dispatcher.py)
+    INBOUND_MAX_CONCURRENT_TURNS: int = 8 # Agent turns running at once across all chats
+    INBOUND_COALESCE_WINDOW: float = 1.5 # Seconds to wait for follow-up messages to merge into one turn (0 = off)
+    INBOUND_COALESCE_MAX: int = 5 # Most messages merged into a single turn
+    INBOUND_SESSION_QUEUE_MAX: int = 20 # Pending messages per chat before new ones are dropped
+    INBOUND_DEDUPE_CAPACITY: int = 10000 # Message ids remembered in memory to drop bridge redeliveries (see dedupe.py)
+    INBOUND_DEDUPE_TTL: float = 86400 # Seconds a message id is remembered
+    INBOUND_DEDUPE_PERSIST: bool = True # Also keep ids in SQLite so duplicates are caught across restarts
+
+    # Model profiles per kind of work (see llm.py); unset fields fall back to the main LLM
+    LLM_PROFILES: Dict[str, Dict[str, Any]] = {} # e.g. {"background": {"model": "gpt-4o-mini"}}; profiles: interactive, background, subagent, vision_followup, summarization
+    LLM_LIGHT_PROFILES: List[str] = ["background", "summarization"] # Profiles that default to a lighter sibling of the main model (scheduler, heartbeat, subconscious, history summaries); not behind a custom LLM_BASE_URL, and the main model stays their fallback
+
+    # LLM admission control (see ratelimit.py)
+    LLM_MAX_CONCURRENT: int = 8 # LLM calls in flight at once across the process
+    LLM_RATE_LIMITS: Dict[str, Dict[str, float]] = {} # Per endpoint, e.g. {"openai:gpt-4o": {"rpm": 500, "tpm": 30000}}; "*" = any other endpoint; unset = unlimited
+    LLM_QUEUE_TIMEOUTS: Dict[str, float] = {"interactive": 30, "subagent": 120, "background": 300} # Seconds a call may wait for admission, per priority class
+    LLM_RATE_LIMIT_COOLDOWN: float = 20 # Seconds an endpoint is paused after a 429 without Retry-After
+
+    # LLM routing and failover (see router.py)
+    LLM_FALLBACKS: List[Dict[str, Any]] = [] # Extra endpoints: {"provider", "model", "api_key", "base_url", "weight"}; provider and api_key default to the main LLM's
+    LLM_ROUTING: str = "ordered" # "ordered" (main LLM first), "weighted" (random by weight) or "latency" (fastest p50 first)
+    LLM_HEDGE_AFTER: float = 0 # Seconds without a first chunk before the next endpoint is also tried (0 = off)
+    LLM_CIRCUIT_FAILURES: int = 3 # Consecutive failures that take an endpoint out of rotation
+    LLM_CIRCUIT_COOLDOWN: float = 60 # Seconds before an endpoint with an open circuit is tried again
+
+    # Sub-agents (see subagent.py)
+    SUBAGENT_MAX_CONCURRENT: int = 4 # Sub-agent tasks running at once across all sessions; the rest wait queued
+    SUBAGENT_CACHE_SIZE: int = 32 # Idle and finished sub-agents kept in memory; older ones are reloaded from SQLite on demand
+    SUBAGENT_SUMMARY_MAX_CHARS: int = 1500 # Size of the result summary a sub-agent posts to its parent session (the end of the reply is kept)
+
+    # LLM response cache (see llm_cache.py); used only by callers that opt in
+    LLM_CACHE_ENABLED: bool = True # Master switch
+    LLM_CACHE_TTL: float = 3600 # Seconds a cached completion may be reused
+    LLM_CACHE_MAX_ENTRIES: int = 2000 # Least recently used entries are evicted beyond this
+    LLM_CACHE_VISION: bool = False # Reuse vision decisions for near-identical screens and the same goal/history
+
+    # Streaming replies to chats (see reply_stream.py)
+    REPLY_STREAMING: bool = True # Deliver a reply while the turn runs instead of as one message at the end
+    REPLY_STREAM_INTERVAL: float = 1.0 # Min seconds between flushes (Telegram allows about one edit per second per chat)
+    REPLY_STREAM_MIN_CHARS: int = 200 # Where messages cannot be edited, text gathered before a partial message is sent
+
+    # Outbound message queue to the bridge (see outbox.py)
+    OUTBOX_RECIPIENT_RATE: float = 1.0 # Sustained messages per second to one chat
+    OUTBOX_RECIPIENT_BURST: int = 3 # Messages one chat may get back-to-back
+    OUTBOX_GLOBAL_RATE: float = 10.0 # Messages per second to the bridge overall
+    OUTBOX_SEND_WORKERS: int = 4 # Sends in flight to the bridge at once (at most one per chat), so a slow chat does not hold up the others
+    OUTBOX_MAX_ATTEMPTS: int = 8 # Delivery attempts before a message is marked failed
+    OUTBOX_RETRY_BASE: float = 2.0 # Seconds before the first retry; doubles per attempt
+    OUTBOX_RETRY_MAX: float = 300.0 # Cap on the retry delay
+    OUTBOX_COALESCE_MAX_CHARS: int = 3500 # Consecutive texts to one chat are merged up to this size (0 = off)
+    OUTBOX_RETENTION_HOURS: float = 24 # Delivered and failed messages (and their dedupe keys) are kept this long
     
     # Chrome Path
     CHROME_PATH: str = r"C:\Program Files\Google\Chrome\Application\chrome.exe"
@@ -72,6 +154,10 @@ class Settings(BaseSettings):
         """Get the exports directory path."""
         return os.path.join(self.WORK_DIR, "exports")
     
+    def get_jobs_dir(self) -> str:
+        """Get the background job logs directory path."""
+        return os.path.join(self.WORK_DIR, "jobs")
+    
     def get_agent_instructions_path(self) -> str:
         """Get the path to AGENT.md in the configs directory."""
         return os.path.join(self.get_configs_dir(), "AGENT.md")
@@ -84,6 +170,7 @@ class Settings(BaseSettings):
             self.get_configs_dir(), 
             self.get_notes_dir(),
             self.get_exports_dir(),
+            self.get_jobs_dir(),
             os.path.join(self.WORK_DIR, "sessions")
         ]
         for d in dirs:
@@ -0,0 +1,192 @@
+import threading
+from dataclasses import replace
+from typing import Dict, List, Optional
+
+import litellm
+
+from .config import settings
+from .llm import ModelProfile
+from .ratelimit import llm_admission
+from .memory import (
+    count_messages_between,
+    drop_orphan_tool_messages,
+    estimate_tokens,
+    get_messages_between,
+    get_session_summary,
+    get_session_window,
+    save_session_summary,
+)
+
+# Used when LiteLLM has no context size for the configured model
+DEFAULT_CONTEXT_WINDOW = 32000
+# Evicted messages folded into the summary per LLM call
+SUMMARY_CHUNK_MESSAGES = 60
+# On first summarization of an old session, only the most recent evicted messages are read
+SUMMARY_MAX_BACKLOG = 300
+# Per-message size cap when evicted messages are rendered for the summarizer
+SUMMARY_MESSAGE_MAX_CHARS = 600
+
+SUMMARY_PROMPT = """You maintain the running summary of a long conversation between a user and LiteClaw, an autonomous agent.
+Update the summary with the new messages below. Keep user goals, facts, decisions, open tasks and the outcome of tool work.
+Drop chit-chat and raw tool output. Write compact bullet points, at most ~400 words.
+
+## Current summary
+{summary}
+
+## New messages
+{transcript}
+
+Return only the updated summary."""
+
+# Sessions with a summary update in flight (one background pass per session)
+_summarizing = set()
+_summarizing_lock = threading.Lock()
+
+
+def count_message_tokens(model: str, message: Dict) -> int:
+    """Token count for one message, falling back to a character estimate."""
+    try:
+        return litellm.token_counter(model=model, messages=[message])
+    except Exception:
+        return estimate_tokens(message)
+
+
+def get_context_budget(model: str) -> int:
+    """Prompt token budget for a model: CONTEXT_MAX_TOKENS or a share of its context window."""
+    if settings.CONTEXT_MAX_TOKENS:
+        return settings.CONTEXT_MAX_TOKENS
+    window = None
+    try:
+        info = litellm.get_model_info(model)
+        window = info.get("max_input_tokens") or info.get("max_tokens")
+    except Exception:
+        pass
+    return int((window or DEFAULT_CONTEXT_WINDOW) * settings.CONTEXT_BUDGET_RATIO)
+
+
+def compact_tool_output(content: Optional[str], max_chars: int) -> Optional[str]:
+    """Keep the head and tail of an oversized tool output (page text, command logs)."""
+    if not content or len(content) <= max_chars:
+        return content
+    head = max_chars * 3 // 4
+    tail = max_chars - head
+    omitted = len(content) - head - tail
+    return f"{content[:head]}\n...[{omitted} chars truncated from an earlier turn]...\n{content[-tail:]}"
+
+
+def _render_for_summary(message: Dict) -> str:
+    role = message["role"]
+    if message.get("tool_calls"):
+        calls = ", ".join(
+            f"{tc['function']['name']}({tc['function']['arguments']})" for tc in message["tool_calls"]
+        )
+        text = f"called {calls}"
+    else:
+        text = message.get("content") or ""
+    if role == "tool":
+        role = f"tool:{message.get('name')}"
+    return f"{role}: {text[:SUMMARY_MESSAGE_MAX_CHARS]}"
+
+
+class ContextManager:
+    """
+    Builds the history part of each prompt under a per-model token budget.
+
+    Old tool outputs are truncated, the oldest messages are evicted until the
+    history fits, and evicted messages are folded into a rolling summary stored
+    in `session_summaries`. The summary is extended incrementally in the
+    background: only messages newer than its `last_message_id` are sent to the
+    model, and only once enough of them have accumulated.
+    """
+
+    def __init__(self, model: str, api_key: Optional[str] = None, base_url: Optional[str] = None, summarizer: Optional[ModelProfile] = None):
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+        # Model that writes the rolling summary (defaults to the turn's model)
+        self.summarizer = summarizer
+
+    def build_history(self, session_id: str, system_prompt: str, user_message: str) -> List[Dict]:
+        window = get_session_window(session_id)
+        budget = get_context_budget(self.model)
+        budget -= count_message_tokens(self.model, {"role": "system", "content": system_prompt})
+        budget -= count_message_tokens(self.model, {"role": "user", "content": user_message})
+
+        summary, summarized_upto = get_session_summary(session_id)
+        summary_msg = None
+        if summary:
+            summary_msg = {"role": "system", "content": f"## Earlier conversation (summary)\n{summary}"}
+            budget -= count_message_tokens(self.model, summary_msg)
+
+        # 1. Shrink bulky tool outputs from earlier turns
+        for _, msg in window:
+            if msg["role"] == "tool":
+                msg["content"] = compact_tool_output(msg.get("content"), settings.CONTEXT_TOOL_OUTPUT_MAX_CHARS)
+
+        # 2. Evict oldest messages until the rest fits the budget
+        kept = []
+        used = 0
+        for msg_id, msg in reversed(window):
+            used += count_message_tokens(self.model, msg)
+            if used > budget and kept:
+                break
+            kept.append((msg_id, msg))
+        kept.reverse()
+
+        # 3. Fold everything older than the kept window into the rolling summary
+        if kept:
+            self._maybe_extend_summary(session_id, summarized_upto, kept[0][0])
+
+        history = drop_orphan_tool_messages([msg for _, msg in kept])
+        if summary_msg:
+            history.insert(0, summary_msg)
+        return history
+
+    def _maybe_extend_summary(self, session_id: str, summarized_upto: int, first_kept_id: int):
+        pending = count_messages_between(session_id, summarized_upto, first_kept_id)
+        if pending < settings.CONTEXT_SUMMARY_MIN_BATCH:
+            return
+        with _summarizing_lock:
+            if session_id in _summarizing:
+                return
+            _summarizing.add(session_id)
+        threading.Thread(
+            target=self._extend_summary, args=(session_id, first_kept_id), daemon=True
+        ).start()
+
+    def _summarize(self, prompt: str, summarizer: Optional[ModelProfile] = None) -> str:
+        """One summarizer call; a light summarizer that fails is retried on the main model."""
+        summarizer = summarizer or self.summarizer
+        try:
+            endpoint = f"{summarizer.provider}:{summarizer.model}" if summarizer else self.model
+            with llm_admission.slot(endpoint, "background", len(prompt) // 4):
+                response = litellm.completion(
+                    model=summarizer.full_model_name if summarizer else self.model,
+                    messages=[{"role": "user", "content": prompt}],
+                    api_key=summarizer.api_key if summarizer else self.api_key,
+                    base_url=summarizer.base_url if summarizer else self.base_url,
+                )
+        except Exception as e:
+            if not (summarizer and summarizer.fallback_model):
+                raise
+            print(f"[Context] Summarizer {summarizer.model} failed ({e}); retrying on {summarizer.fallback_model}.")
+            return self._summarize(prompt, replace(summarizer, model=summarizer.fallback_model, fallback_model=None))
+        return (response.choices[0].message.content or "").strip()
+
+    def _extend_summary(self, session_id: str, first_kept_id: int):
+        try:
+            summary, summarized_upto = get_session_summary(session_id)
+            backlog = get_messages_between(session_id, summarized_upto, first_kept_id, SUMMARY_MAX_BACKLOG)
+            for start in range(0, len(backlog), SUMMARY_CHUNK_MESSAGES):
+                chunk = backlog[start:start + SUMMARY_CHUNK_MESSAGES]
+                transcript = "\n".join(_render_for_summary(msg) for _, msg in chunk)
+                prompt = SUMMARY_PROMPT.format(summary=summary or "(empty)", transcript=transcript)
+                summary = self._summarize(prompt) or summary
+                # Persist after every chunk so progress survives a failure mid-backlog
+                save_session_summary(session_id, summary, chunk[-1][0])
+            print(f"[Context] Summary for '{session_id}' extended with {len(backlog)} evicted messages.")
+        except Exception as e:
+            print(f"[Context] Failed to extend summary for '{session_id}': {e}")
+        finally:
+            with _summarizing_lock:
+                _summarizing.discard(session_id)
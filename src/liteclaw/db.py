@@ -1,70 +1,314 @@
 from .config import settings
+from contextlib import contextmanager
 import os
 import sqlite3
+import threading
+
+# Seconds a writer waits on a locked database before raising "database is locked"
+DB_BUSY_TIMEOUT = 30.0
+# Compiled statements kept per connection (sqlite3 re-uses them by SQL text)
+DB_STATEMENT_CACHE = 256
+
+# One long-lived connection per thread (FastAPI workers, sub-agents, monitors)
+_local = threading.local()
 
 def get_db_file():
     """Get the absolute path to the database file in WORK_DIR."""
     return os.path.join(settings.WORK_DIR, "liteclaw_memory.db")
 
-def get_db_connection():
+def _connect():
     db_file = get_db_file()
     # Create parent directory if missing (safety)
     os.makedirs(os.path.dirname(db_file), exist_ok=True)
-    conn = sqlite3.connect(db_file, check_same_thread=False)
+    conn = sqlite3.connect(
+        db_file,
+        check_same_thread=False,
+        timeout=DB_BUSY_TIMEOUT,
+        cached_statements=DB_STATEMENT_CACHE
+    )
     conn.row_factory = sqlite3.Row
+    # WAL lets readers run alongside a writer; NORMAL sync is durable across app crashes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT * 1000)}")
     return conn
 
-def init_db():
+def get_db_connection():
+    """
+    Return this thread's pooled connection, opening it on first use.
+    Callers must not close it; it lives as long as the thread does.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _connect()
+        _local.conn = conn
+    return conn
+
+def close_db_connection():
+    """Close this thread's pooled connection (e.g. before a worker thread exits)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+@contextmanager
+def transaction():
+    """
+    Run a block of writes in one transaction on the pooled connection.
+    Takes the write lock up-front (BEGIN IMMEDIATE) so concurrent writers wait on
+    the busy timeout instead of failing on a lock upgrade. Nested use joins the
+    outer transaction.
+    """
     conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Create sessions table
+    if conn.in_transaction:
+        yield conn.cursor()
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn.cursor()
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def init_db():
+    with transaction() as c:
+        # Create sessions table
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                parent_session_id TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Create messages table
+        # Storing content as TEXT. For tool calls, we might serialize JSON.
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                role TEXT,
+                content TEXT,
+                tool_calls TEXT,
+                tool_call_id TEXT,
+                name TEXT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(session_id) REFERENCES sessions(session_id)
+            )
+        ''')
+
+        # Create cron_jobs table
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS cron_jobs (
+                id TEXT PRIMARY KEY,
+                name TEXT,
+                schedule_type TEXT,
+                schedule_value TEXT,
+                task TEXT,
+                is_active BOOLEAN DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_run TIMESTAMP
+            )
+        ''')
+
+    run_migrations()
+
+# --- Schema migrations ---
+# Each migration runs once, in order, inside its own transaction. Append new
+# entries with the next version number; never edit one that has shipped.
+
+def _column_exists(c, table: str, column: str) -> bool:
+    return any(row["name"] == column for row in c.execute(f"PRAGMA table_info({table})"))
+
+def _migration_001_hot_query_indexes(c):
+    # Databases created before parent_session_id existed
+    if not _column_exists(c, "sessions", "parent_session_id"):
+        c.execute("ALTER TABLE sessions ADD COLUMN parent_session_id TEXT")
+    # History window and add_message dedupe: WHERE session_id = ? ORDER BY id DESC
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages(session_id, id)")
+    # list_sessions: ORDER BY created_at DESC
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sessions_created_at ON sessions(created_at)")
+    # CronManager.load_jobs: WHERE is_active = 1
+    c.execute("CREATE INDEX IF NOT EXISTS idx_cron_jobs_active ON cron_jobs(is_active)")
+
+def _migration_002_session_summaries(c):
+    # Rolling summary of messages evicted from the context window
     c.execute('''
-        CREATE TABLE IF NOT EXISTS sessions (
+        CREATE TABLE IF NOT EXISTS session_summaries (
             session_id TEXT PRIMARY KEY,
-            parent_session_id TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            summary TEXT,
+            last_message_id INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    
-    # Check if column exists (migration for existing db)
-    try:
-        c.execute("ALTER TABLE sessions ADD COLUMN parent_session_id TEXT")
-    except Exception:
-        pass
-    
-    # Create messages table
-    # Storing content as TEXT. For tool calls, we might serialize JSON.
+
+def _migration_003_outbound_messages(c):
+    # Durable queue of messages for the Node bridge (see outbox.py)
     c.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
+        CREATE TABLE IF NOT EXISTS outbound_messages (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            role TEXT,
-            content TEXT,
-            tool_calls TEXT,
-            tool_call_id TEXT,
-            name TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(session_id) REFERENCES sessions(session_id)
+            recipient TEXT NOT NULL,
+            platform TEXT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            dedupe_key TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            sent_at REAL
         )
     ''')
+    # Sender worker: WHERE status = 'pending' ORDER BY id
+    c.execute("CREATE INDEX IF NOT EXISTS idx_outbound_status ON outbound_messages(status, id)")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_outbound_dedupe_key ON outbound_messages(dedupe_key)")
 
-    # Create cron_jobs table
+def _migration_004_dedupe_keys(c):
+    # Recently seen inbound message ids, kept across restarts (see dedupe.py)
     c.execute('''
-        CREATE TABLE IF NOT EXISTS cron_jobs (
+        CREATE TABLE IF NOT EXISTS dedupe_keys (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (namespace, key)
+        )
+    ''')
+    # Pruning: WHERE namespace = ? AND expires_at <= ?
+    c.execute("CREATE INDEX IF NOT EXISTS idx_dedupe_keys_expires ON dedupe_keys(namespace, expires_at)")
+
+def _migration_005_llm_cache(c):
+    # Cached LLM completions for opted-in callers (see llm_cache.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT,
+            response TEXT NOT NULL,
+            latency REAL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            last_used_at REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # Eviction: ORDER BY last_used_at; expiry: WHERE expires_at <= ?
+    c.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache(expires_at)")
+
+def _migration_006_cacheable_cron_jobs(c):
+    # Jobs whose runs may reuse cached LLM responses
+    if not _column_exists(c, "cron_jobs", "cacheable"):
+        c.execute("ALTER TABLE cron_jobs ADD COLUMN cacheable BOOLEAN DEFAULT 0")
+
+def _migration_007_sub_agents(c):
+    # Sub-agents, their task history and inbox (see subagent.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sub_agents (
             id TEXT PRIMARY KEY,
-            name TEXT,
-            schedule_type TEXT,
-            schedule_value TEXT,
-            task TEXT,
-            is_active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_run TIMESTAMP
+            session_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            platform TEXT,
+            status TEXT NOT NULL DEFAULT 'idle',
+            last_result TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
         )
     ''')
-    
-    conn.commit()
-    conn.close()
+    # Lookup by name within a session; list_sub_agents and the per-session cap
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_sub_agents_session_name ON sub_agents(session_id, name)")
+    # Heartbeat is_occupied and restart recovery: WHERE status = 'working'
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sub_agents_status ON sub_agents(status)")
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sub_agent_tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sub_agent_id TEXT NOT NULL,
+            task TEXT NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            started_at REAL NOT NULL,
+            ended_at REAL
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sub_agent_tasks_agent ON sub_agent_tasks(sub_agent_id, id)")
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sub_agent_inbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sub_agent_id TEXT NOT NULL,
+            sender TEXT,
+            text TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            read_at REAL
+        )
+    ''')
+    # Unread messages of one sub-agent: WHERE sub_agent_id = ? AND read_at IS NULL
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sub_agent_inbox_unread ON sub_agent_inbox(sub_agent_id, read_at)")
+
+def _migration_008_background_jobs(c):
+    # Detached shell commands; their output is spooled to log files (see jobs.py)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS background_jobs (
+            id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL,
+            command TEXT NOT NULL,
+            status TEXT NOT NULL,
+            pid INTEGER,
+            exit_code INTEGER,
+            log_path TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            ended_at REAL
+        )
+    ''')
+    # list: WHERE session_id = ? ORDER BY created_at DESC
+    c.execute("CREATE INDEX IF NOT EXISTS idx_background_jobs_session ON background_jobs(session_id, created_at)")
+    # Running count and restart recovery: WHERE status = 'running'
+    c.execute("CREATE INDEX IF NOT EXISTS idx_background_jobs_status ON background_jobs(status)")
+
+def _migration_009_outbound_recipient_index(c):
+    # Sender: head of every chat's queue, MIN(id) WHERE status IN (...) GROUP BY recipient
+    c.execute("CREATE INDEX IF NOT EXISTS idx_outbound_status_recipient ON outbound_messages(status, recipient, id)")
+
+MIGRATIONS = [
+    (1, "hot query indexes", _migration_001_hot_query_indexes),
+    (2, "session summaries", _migration_002_session_summaries),
+    (3, "outbound message queue", _migration_003_outbound_messages),
+    (4, "dedupe keys", _migration_004_dedupe_keys),
+    (5, "llm response cache", _migration_005_llm_cache),
+    (6, "cacheable cron jobs", _migration_006_cacheable_cron_jobs),
+    (7, "sub-agent store", _migration_007_sub_agents),
+    (8, "background jobs", _migration_008_background_jobs),
+    (9, "outbound recipient index", _migration_009_outbound_recipient_index),
+]
+
+def get_schema_version() -> int:
+    row = get_db_connection().execute("SELECT MAX(version) AS version FROM schema_version").fetchone()
+    return row["version"] or 0
+
+def run_migrations():
+    """Apply pending migrations. A no-op (one query) when the schema is current."""
+    with transaction() as c:
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+    if get_schema_version() >= MIGRATIONS[-1][0]:
+        return
+
+    for version, name, migrate in MIGRATIONS:
+        with transaction() as c:
+            # Re-check under the write lock in case another process got here first
+            current = c.execute("SELECT MAX(version) AS version FROM schema_version").fetchone()["version"] or 0
+            if version <= current:
+                continue
+            print(f"[DB] Applying migration {version}: {name}...")
+            migrate(c)
+            c.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
 
 # Initialize on module load
 init_db()
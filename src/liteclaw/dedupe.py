@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict
+
+from .config import settings
+from .db import transaction
+
+# Expired rows are deleted from SQLite every this many new keys
+DEDUPE_PRUNE_EVERY = 500
+
+
+class DedupeStore:
+    """
+    Remembers recently seen keys (e.g. bridge message ids) for `ttl` seconds.
+
+    The in-memory part is an LRU of at most `capacity` keys: lookups, inserts and
+    evictions are O(1), and the oldest key is dropped one at a time rather than
+    the whole set at once. With `persist`, keys are also written to SQLite, so a
+    message redelivered after a restart (or after falling out of the LRU) is
+    still recognised. Safe to call from any thread or process.
+    """
+
+    def __init__(self, namespace: str, capacity: int, ttl: float, persist: bool = False):
+        self.namespace = namespace
+        self.capacity = max(1, capacity)
+        self.ttl = ttl
+        self.persist = persist
+
+        self._keys: "OrderedDict[str, float]" = OrderedDict() # key -> expires at (oldest first)
+        self._lock = threading.Lock()
+        self._since_prune = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def seen(self, key: str) -> bool:
+        """Record `key` and return True if it was already seen within the TTL."""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            expires_at = self._keys.get(key)
+            if expires_at is not None:
+                self._keys.move_to_end(key)
+                self._hits += 1
+                return True
+
+            # Checked and recorded under the lock so concurrent requests with one id see one miss
+            if self.persist and self._seen_in_db(key, now):
+                self._remember(key, now)
+                self._hits += 1
+                return True
+
+            self._remember(key, now)
+            self._misses += 1
+            return False
+
+    def _remember(self, key: str, now: float):
+        self._keys[key] = now + self.ttl
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.capacity:
+            self._keys.popitem(last=False)
+            self._evictions += 1
+
+    def _expire(self, now: float):
+        # Every key gets the same TTL, so the oldest entries expire first
+        while self._keys:
+            key, expires_at = next(iter(self._keys.items()))
+            if expires_at > now:
+                break
+            del self._keys[key]
+
+    def _seen_in_db(self, key: str, now: float) -> bool:
+        with transaction() as c:
+            row = c.execute(
+                "SELECT expires_at FROM dedupe_keys WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+            if row and row["expires_at"] > now:
+                return True
+            c.execute(
+                "INSERT OR REPLACE INTO dedupe_keys (namespace, key, expires_at) VALUES (?, ?, ?)",
+                (self.namespace, key, now + self.ttl)
+            )
+            self._since_prune += 1
+            if self._since_prune >= DEDUPE_PRUNE_EVERY:
+                self._since_prune = 0
+                c.execute("DELETE FROM dedupe_keys WHERE namespace = ? AND expires_at <= ?", (self.namespace, now))
+        return False
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._keys),
+                "capacity": self.capacity,
+                "duplicates": self._hits,
+                "new": self._misses,
+                "evictions": self._evictions,
+            }
+
+
+inbound_dedupe = DedupeStore(
+    "inbound",
+    capacity=settings.INBOUND_DEDUPE_CAPACITY,
+    ttl=settings.INBOUND_DEDUPE_TTL,
+    persist=settings.INBOUND_DEDUPE_PERSIST,
+)
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from .config import settings
+from .metrics import METRIC_SAMPLES, summarize
+
+
+@dataclass
+class InboundMessage:
+    session_id: str
+    text: str # Message as the agent should see it (with sender prefix)
+    sender: str
+    platform: str
+    message_id: Optional[str] = None # Bridge message id, used as the reply's dedupe key
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class InboundDispatcher:
+    """
+    Serializes inbound messages per session and bounds work across sessions.
+
+    Each session has one ordered queue drained by a single task, so two messages
+    from the same chat never run a turn on the same session concurrently. At most
+    `max_concurrent` turns run at once over all sessions. Messages that arrive
+    within `coalesce_window` seconds of the first queued one (or while the
+    previous turn was running) are merged into a single turn.
+    """
+
+    def __init__(self, handler: Callable[[str, List[InboundMessage]], Awaitable[Any]],
+                 max_concurrent: int, coalesce_window: float, coalesce_max: int, session_queue_max: int):
+        self.handler = handler
+        self.max_concurrent = max_concurrent
+        self.coalesce_window = coalesce_window
+        self.coalesce_max = max(1, coalesce_max)
+        self.session_queue_max = session_queue_max
+
+        self._queues: Dict[str, Deque[InboundMessage]] = {}
+        self._drainers: Dict[str, asyncio.Task] = {}
+        self._slots: Optional[asyncio.Semaphore] = None # Created on the serving loop
+
+        self._running = 0
+        self._processed = 0
+        self._turns = 0
+        self._rejected = 0
+        self._waits: Deque[float] = deque(maxlen=METRIC_SAMPLES)
+        self._turn_times: Deque[float] = deque(maxlen=METRIC_SAMPLES)
+
+    def submit(self, message: InboundMessage) -> bool:
+        """Queue a message for its session. Returns False if that session's queue is full."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+
+        queue = self._queues.setdefault(message.session_id, deque())
+        if self.session_queue_max and len(queue) >= self.session_queue_max:
+            self._rejected += 1
+            return False
+        queue.append(message)
+
+        if message.session_id not in self._drainers:
+            self._drainers[message.session_id] = asyncio.ensure_future(self._drain(message.session_id))
+        return True
+
+    async def _drain(self, session_id: str):
+        queue = self._queues[session_id]
+        try:
+            while queue:
+                # Give rapid follow-ups a moment to arrive so they share one turn
+                if self.coalesce_window > 0:
+                    delay = queue[0].enqueued_at + self.coalesce_window - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                async with self._slots:
+                    limit = self.coalesce_max if self.coalesce_window > 0 else 1
+                    batch = [queue.popleft() for _ in range(min(limit, len(queue)))]
+                    started = time.monotonic()
+                    for message in batch:
+                        self._waits.append(started - message.enqueued_at)
+
+                    self._running += 1
+                    try:
+                        await self.handler(session_id, batch)
+                    except Exception as e:
+                        print(f"[Dispatcher] Turn failed for '{session_id}': {e}")
+                    finally:
+                        self._running -= 1
+                        self._turns += 1
+                        self._processed += len(batch)
+                        self._turn_times.append(time.monotonic() - started)
+        finally:
+            self._drainers.pop(session_id, None)
+            if not queue:
+                self._queues.pop(session_id, None)
+
+    def metrics(self) -> Dict[str, Any]:
+        depths = {sid: len(q) for sid, q in self._queues.items() if q}
+        return {
+            "queued": sum(depths.values()),
+            "max_session_depth": max(depths.values(), default=0),
+            "active_sessions": len(self._drainers),
+            "running_turns": self._running,
+            "max_concurrent": self.max_concurrent,
+            "messages_processed": self._processed,
+            "turns": self._turns,
+            "coalesced": self._processed - self._turns,
+            "rejected": self._rejected,
+            "wait_seconds": summarize(self._waits),
+            "turn_seconds": summarize(self._turn_times),
+        }
+
+
+def create_inbound_dispatcher(handler: Callable[[str, List[InboundMessage]], Awaitable[Any]]) -> InboundDispatcher:
+    return InboundDispatcher(
+        handler,
+        max_concurrent=settings.INBOUND_MAX_CONCURRENT_TURNS,
+        coalesce_window=settings.INBOUND_COALESCE_WINDOW,
+        coalesce_max=settings.INBOUND_COALESCE_MAX,
+        session_queue_max=settings.INBOUND_SESSION_QUEUE_MAX,
+    )
@@ -14,7 +14,8 @@ class HeartbeatMonitor:
     def __init__(self):
         self._running = False
         self._thread = None
-        self._agent = LiteClawAgent()
+        # No LLM cache: the fixed session's history grows every pulse, so no key would repeat
+        self._agent = LiteClawAgent(profile="background")
         self._last_run = 0
         self._config = {
             "interval_seconds": 3600,
@@ -75,10 +76,8 @@ class HeartbeatMonitor:
         # 2. Check Sub-Agents
         try:
             from .subagent import sub_agent_manager
-            for session_id in sub_agent_manager.sessions:
-                for sa in sub_agent_manager.sessions[session_id]:
-                    if sa.status == "working":
-                        return True
+            if sub_agent_manager.any_working():
+                return True
         except Exception:
             pass
 
@@ -0,0 +1,248 @@
+import os
+import platform
+import signal
+import subprocess
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from .config import settings
+from .db import get_db_connection, transaction
+from .outbox import outbox
+from .tools import _kill_tree, _shell_args, is_command_safe
+
+# Bytes read from the end of a log file for tail()
+JOB_TAIL_READ_BYTES = 256 * 1024
+# Seconds between checks while waiting on a job, so a cancelled turn stops waiting quickly
+JOB_WAIT_POLL = 0.5
+# Longest single wait; the agent polls again rather than hold a tool thread for minutes
+JOB_WAIT_MAX = 30
+
+
+def _tail_file(path: str, lines: int) -> str:
+    """The last `lines` lines of a file, reading at most JOB_TAIL_READ_BYTES from its end."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - JOB_TAIL_READ_BYTES))
+            data = f.read()
+    except OSError:
+        return ""
+    text = data.decode("utf-8", errors="replace")
+    return "\n".join(text.splitlines()[-lines:])
+
+
+def _boot_time() -> Optional[float]:
+    """When the host booted (Linux), or None if unknown."""
+    try:
+        with open("/proc/stat") as f:
+            for line in f:
+                if line.startswith("btime "):
+                    return float(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _kill_orphan(job: Dict[str, Any]) -> bool:
+    """
+    Kill the process group of a job left running by a previous run. Jobs are
+    session leaders, so their pid is their group id; the group is only killed
+    if it still exists as a group and the job was started since the last boot
+    (so the pid cannot have been reused by a newer boot's process).
+    """
+    pid = job["pid"]
+    if not pid or platform.system() == "Windows":
+        return False
+    boot = _boot_time()
+    if boot is not None and job["created_at"] < boot:
+        return False
+    try:
+        if os.getpgid(pid) != pid:
+            return False
+        os.killpg(pid, signal.SIGKILL)
+        return True
+    except OSError:
+        return False
+
+
+class JobManager:
+    """
+    Shell commands run detached from the agent turn. The process writes stdout
+    and stderr to a log file in WORK_DIR/jobs; its metadata lives in SQLite
+    (`background_jobs`). A watcher thread per job records the exit code and
+    notifies the chat that started it, so a multi-minute build or download
+    never holds a turn or a sub-agent. A restart cannot reattach to a job:
+    jobs still running then are killed and marked interrupted.
+    """
+
+    def __init__(self):
+        self._procs: Dict[str, subprocess.Popen] = {}
+        self._done: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    def start(self, session_id: str, command: str, platform_name: str = "whatsapp", notify: bool = True) -> str:
+        """Start `command` in the background. Returns the job id, or an error message."""
+        is_safe, block_reason = is_command_safe(command)
+        if not is_safe:
+            return block_reason
+        self.purge()
+        job_id = uuid.uuid4().hex[:8]
+        log_path = os.path.join(settings.get_jobs_dir(), f"{job_id}.log")
+        # Count and claim a slot under one write lock, so concurrent starts cannot exceed the limit
+        with transaction() as c:
+            running = c.execute("SELECT COUNT(*) AS n FROM background_jobs WHERE status = 'running'").fetchone()["n"]
+            if running >= settings.JOB_MAX_RUNNING:
+                return f"Error: {running} background jobs are already running (limit {settings.JOB_MAX_RUNNING}). Wait for one or kill it."
+            c.execute(
+                "INSERT INTO background_jobs (id, session_id, command, status, log_path, created_at) VALUES (?, ?, ?, 'running', ?, ?)",
+                (job_id, session_id, command, log_path, time.time())
+            )
+
+        try:
+            project_root = r"d:\openclaw_lite"
+            os.makedirs(project_root, exist_ok=True)
+            os.makedirs(settings.get_jobs_dir(), exist_ok=True)
+
+            args, kwargs, temp_script = _shell_args(command, project_root)
+            if platform.system() == "Windows":
+                kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+            else:
+                kwargs["start_new_session"] = True # Own process group, so kill() reaches the children
+            with open(log_path, "ab") as log:
+                proc = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, **kwargs)
+        except Exception:
+            with transaction() as c:
+                c.execute("UPDATE background_jobs SET status = 'failed', ended_at = ? WHERE id = ?", (time.time(), job_id))
+            raise
+
+        with transaction() as c:
+            c.execute("UPDATE background_jobs SET pid = ? WHERE id = ?", (proc.pid, job_id))
+        with self._lock:
+            self._procs[job_id] = proc
+            self._done[job_id] = threading.Event()
+        threading.Thread(
+            target=self._watch, args=(job_id, proc, temp_script, platform_name if notify else None),
+            name=f"liteclaw-job-{job_id}", daemon=True
+        ).start()
+        print(f"[Jobs] Started {job_id} (pid {proc.pid}): {command[:80]}")
+        return job_id
+
+    def _watch(self, job_id: str, proc: subprocess.Popen, temp_script: Optional[str], notify_platform: Optional[str]):
+        exit_code = proc.wait()
+        if temp_script:
+            try:
+                os.remove(temp_script)
+            except OSError:
+                pass
+        status = "completed" if exit_code == 0 else "failed"
+        with transaction() as c:
+            # A job marked killed keeps that status
+            c.execute(
+                "UPDATE background_jobs SET status = ?, exit_code = ?, ended_at = ? WHERE id = ? AND status = 'running'",
+                (status, exit_code, time.time(), job_id)
+            )
+            finished = c.rowcount
+        with self._lock:
+            self._procs.pop(job_id, None)
+            done = self._done.pop(job_id, None)
+        if done:
+            done.set()
+        print(f"[Jobs] {job_id} ended with exit code {exit_code}")
+        if finished and notify_platform and notify_platform != "api":
+            self._notify(job_id, status, exit_code, notify_platform)
+
+    def _notify(self, job_id: str, status: str, exit_code: int, platform_name: str):
+        job = self.get(job_id)
+        icon = "✅" if status == "completed" else "❌"
+        text = f"[LiteClaw] {icon} Background job {job_id} {status} (exit code {exit_code}).\n$ {job['command'][:200]}"
+        tail = _tail_file(job["log_path"], 5)
+        if tail:
+            text += f"\n{tail[-800:]}"
+        try:
+            outbox.send_text(job["session_id"], text, platform_name)
+        except Exception as e:
+            print(f"[Jobs] Failed to queue completion notice for {job_id}: {e}")
+
+    def get(self, job_id: str, session_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """The job's row; with `session_id`, only if that session started it."""
+        sql, params = "SELECT * FROM background_jobs WHERE id = ?", (job_id,)
+        if session_id is not None:
+            sql, params = sql + " AND session_id = ?", (job_id, session_id)
+        row = get_db_connection().execute(sql, params).fetchone()
+        return dict(row) if row else None
+
+    def list(self, session_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        rows = get_db_connection().execute(
+            "SELECT * FROM background_jobs WHERE session_id = ? ORDER BY created_at DESC LIMIT ?", (session_id, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def tail(self, job: Dict[str, Any], lines: int = 50) -> str:
+        return _tail_file(job["log_path"], lines)
+
+    def wait(self, job_id: str, timeout: float, cancel=None) -> bool:
+        """Block until the job ends or `timeout` (at most JOB_WAIT_MAX) passes. True if it is no longer running."""
+        with self._lock:
+            done = self._done.get(job_id)
+        if done is None:
+            return True
+        deadline = time.monotonic() + min(timeout, JOB_WAIT_MAX)
+        while not done.is_set():
+            if cancel:
+                cancel.raise_if_cancelled()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            done.wait(min(JOB_WAIT_POLL, remaining))
+        return True
+
+    def kill(self, job_id: str) -> bool:
+        """Kill the job and everything it started. False if it is not running."""
+        with self._lock:
+            proc = self._procs.get(job_id)
+        if proc is None:
+            return False
+        with transaction() as c:
+            c.execute(
+                "UPDATE background_jobs SET status = 'killed', ended_at = ? WHERE id = ? AND status = 'running'",
+                (time.time(), job_id)
+            )
+        _kill_tree(proc)
+        return True
+
+    def purge(self):
+        """Delete finished jobs older than JOB_RETENTION_HOURS, with their log files."""
+        cutoff = time.time() - settings.JOB_RETENTION_HOURS * 3600
+        with transaction() as c:
+            rows = c.execute(
+                "SELECT id, log_path FROM background_jobs WHERE status != 'running' AND ended_at < ?", (cutoff,)
+            ).fetchall()
+            for row in rows:
+                try:
+                    os.remove(row["log_path"])
+                except OSError:
+                    pass
+            c.executemany("DELETE FROM background_jobs WHERE id = ?", [(row["id"],) for row in rows])
+
+    def recover(self) -> int:
+        """
+        Called at startup: jobs of the previous run can no longer be tracked or
+        counted, so their processes are killed. Returns how many jobs.
+        """
+        with transaction() as c:
+            jobs = c.execute("SELECT id, pid, created_at FROM background_jobs WHERE status = 'running'").fetchall()
+            for job in jobs:
+                if _kill_orphan(dict(job)):
+                    print(f"[Jobs] Killed {job['id']} (pid {job['pid']}) left running by the last run")
+            c.execute(
+                "UPDATE background_jobs SET status = 'interrupted', ended_at = ? WHERE status = 'running'",
+                (time.time(),)
+            )
+        self.purge()
+        return len(jobs)
+
+
+job_manager = JobManager()
@@ -1,8 +1,35 @@
+from dataclasses import dataclass
 from typing import Optional
 import os
 
 from .config import settings
 
+# Kinds of work that can run on their own model (see LLM_PROFILES)
+MODEL_PROFILES = ("interactive", "background", "subagent", "vision_followup", "summarization")
+
+# Admission priority class of each profile (see ratelimit.py)
+PROFILE_PRIORITIES = {
+    "interactive": "interactive",
+    "vision_followup": "interactive",
+    "subagent": "subagent",
+    "background": "background",
+    "summarization": "background",
+}
+
+# Cheaper, faster sibling of well-known main models, used by the profiles in
+# LLM_LIGHT_PROFILES unless LLM_PROFILES names a model for them. Only models
+# served by the provider's own API: behind a custom base URL (a proxy, or an
+# OpenAI-compatible host) the sibling may not exist, so none is substituted.
+LIGHT_MODELS = {
+    "gpt-4o": "gpt-4o-mini",
+    "gpt-4-turbo": "gpt-4o-mini",
+    "o1-preview": "o1-mini",
+    "openai/gpt-4o": "openai/gpt-4o-mini",
+    "bedrock/anthropic.claude-3-5-sonnet-20240620-v1:0": "bedrock/anthropic.claude-3-haiku-20240307-v1:0",
+    "bedrock/anthropic.claude-3-sonnet-20240229-v1:0": "bedrock/anthropic.claude-3-haiku-20240307-v1:0",
+    "bedrock/meta.llama3-1-70b-instruct-v1:0": "bedrock/meta.llama3-1-8b-instruct-v1:0",
+}
+
 
 def get_full_model_name(provider: str, model: str, base_url: Optional[str] = None) -> str:
     """
@@ -30,6 +57,62 @@ def get_full_model_name(provider: str, model: str, base_url: Optional[str] = Non
     return model
 
 
+@dataclass
+class ModelProfile:
+    """The provider, model and credentials one kind of work runs on."""
+    name: str
+    provider: str
+    model: str
+    api_key: Optional[str] = None
+    base_url: Optional[str] = None
+    # The main model, when `model` is its light sibling: tried if the sibling fails
+    fallback_model: Optional[str] = None
+
+    @property
+    def full_model_name(self) -> str:
+        return get_full_model_name(self.provider, self.model, self.base_url)
+
+    @property
+    def priority(self) -> str:
+        return PROFILE_PRIORITIES[self.name]
+
+
+def get_model_profile(name: str = "interactive") -> ModelProfile:
+    """
+    Resolve a workload's model from LLM_PROFILES, falling back to the main LLM.
+
+    Profiles in LLM_LIGHT_PROFILES without their own model use the lighter
+    sibling of the main model (LIGHT_MODELS) when one is known and the main
+    LLM has no custom base URL; the main model stays their fallback. A profile on
+    another provider does not inherit the main LLM's key or base URL.
+    """
+    if name not in MODEL_PROFILES:
+        raise ValueError(f"Unknown model profile '{name}'. Expected one of: {', '.join(MODEL_PROFILES)}")
+
+    override = settings.LLM_PROFILES.get(name) or {}
+    provider = override.get("provider") or settings.LLM_PROVIDER
+    same_provider = provider == settings.LLM_PROVIDER
+
+    model = override.get("model")
+    fallback_model = None
+    if not model:
+        model = settings.LLM_MODEL
+        custom_base_url = settings.LLM_BASE_URL and "api.openai.com" not in str(settings.LLM_BASE_URL)
+        if same_provider and name in settings.LLM_LIGHT_PROFILES and not custom_base_url:
+            model = LIGHT_MODELS.get(model, model)
+            if model != settings.LLM_MODEL:
+                fallback_model = settings.LLM_MODEL
+
+    return ModelProfile(
+        name=name,
+        provider=provider,
+        model=model,
+        api_key=override.get("api_key", settings.LLM_API_KEY if same_provider else None),
+        base_url=override.get("base_url", settings.LLM_BASE_URL if same_provider else None),
+        fallback_model=fallback_model,
+    )
+
+
 def configure_bedrock_env() -> None:
     """
     Configure AWS Bedrock environment for LiteLLM.
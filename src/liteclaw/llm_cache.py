@@ -0,0 +1,158 @@
+import base64
+import hashlib
+import io
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .config import settings
+from .db import get_db_connection, transaction
+
+# Side of the grayscale grid screenshots are reduced to before hashing. Larger
+# means fewer screens count as "the same" (16 -> 256-bit difference hash).
+IMAGE_HASH_SIZE = 16
+# Expired and surplus rows are pruned every this many stores
+CACHE_PRUNE_EVERY = 50
+
+
+def _image_hash(url: str) -> str:
+    """Perceptual (difference) hash of a data-URL image, so near-identical screens share a key."""
+    if not url.startswith("data:"):
+        return url
+    data = url.split(",", 1)[-1]
+    try:
+        from PIL import Image
+        image = Image.open(io.BytesIO(base64.b64decode(data))).convert("L")
+        image = image.resize((IMAGE_HASH_SIZE + 1, IMAGE_HASH_SIZE))
+        pixels = list(image.getdata())
+        bits = 0
+        for row in range(IMAGE_HASH_SIZE):
+            for col in range(IMAGE_HASH_SIZE):
+                left = pixels[row * (IMAGE_HASH_SIZE + 1) + col]
+                bits = (bits << 1) | (left > pixels[row * (IMAGE_HASH_SIZE + 1) + col + 1])
+        return f"dhash:{bits:0{IMAGE_HASH_SIZE * IMAGE_HASH_SIZE // 4}x}"
+    except Exception:
+        # Pillow missing or not an image: only identical bytes match
+        return "sha256:" + hashlib.sha256(data.encode()).hexdigest()
+
+
+def _normalize_content(content: Any) -> Any:
+    if isinstance(content, str):
+        return content.strip()
+    if isinstance(content, list):
+        parts = []
+        for part in content:
+            if part.get("type") == "image_url":
+                url = part["image_url"]["url"] if isinstance(part.get("image_url"), dict) else part.get("image_url", "")
+                parts.append({"image": _image_hash(url)})
+            elif part.get("type") == "text":
+                parts.append({"text": part.get("text", "").strip()})
+            else:
+                parts.append(part)
+        return parts
+    return content
+
+
+def _normalize_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    # Tool call ids are random per request, so they are left out of the key
+    normalized = {"role": message.get("role"), "content": _normalize_content(message.get("content"))}
+    if message.get("tool_calls"):
+        normalized["tool_calls"] = [
+            [tc["function"]["name"], tc["function"]["arguments"]] for tc in message["tool_calls"]
+        ]
+    if message.get("name"):
+        normalized["name"] = message["name"]
+    return normalized
+
+
+class LLMCache:
+    """
+    Exact-match cache of LLM completions, stored in SQLite (`llm_cache`).
+
+    Keys cover the model, the normalized messages (whitespace trimmed, tool call
+    ids dropped, images reduced to a perceptual hash) and the tool schemas.
+    Entries live for LLM_CACHE_TTL seconds and the least recently used ones are
+    evicted beyond LLM_CACHE_MAX_ENTRIES. Only callers that opt in use it:
+    cacheable cron jobs (fresh session, so a repeated prompt repeats its key)
+    and (if enabled) vision.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._since_prune = 0
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._saved_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.LLM_CACHE_ENABLED and settings.LLM_CACHE_MAX_ENTRIES > 0
+
+    def key(self, model: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> str:
+        payload = {
+            "model": model,
+            "messages": [_normalize_message(m) for m in messages],
+            "tools": tools or [],
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The cached response for `key`, or None on a miss."""
+        now = time.time()
+        # A plain read: misses, the common case, never take the write lock
+        row = get_db_connection().execute(
+            "SELECT response, latency FROM llm_cache WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row:
+            with transaction() as c:
+                c.execute("UPDATE llm_cache SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        with self._lock:
+            if not row:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._saved_seconds += row["latency"] or 0.0
+        return json.loads(row["response"])
+
+    def put(self, key: str, model: str, response: Dict[str, Any], latency: float = 0.0):
+        now = time.time()
+        with transaction() as c:
+            c.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, latency, created_at, expires_at, last_used_at, hits) VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, model, json.dumps(response), latency, now, now + settings.LLM_CACHE_TTL, now)
+            )
+            with self._lock:
+                self._stores += 1
+                self._since_prune += 1
+                prune = self._since_prune >= CACHE_PRUNE_EVERY
+                if prune:
+                    self._since_prune = 0
+            if prune:
+                self._prune(c, now)
+
+    def _prune(self, c, now: float):
+        c.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+        surplus = c.execute("SELECT COUNT(*) AS n FROM llm_cache").fetchone()["n"] - settings.LLM_CACHE_MAX_ENTRIES
+        if surplus > 0:
+            c.execute(
+                "DELETE FROM llm_cache WHERE key IN (SELECT key FROM llm_cache ORDER BY last_used_at LIMIT ?)", (surplus,)
+            )
+
+    def metrics(self) -> Dict[str, Any]:
+        entries = get_db_connection().execute("SELECT COUNT(*) AS n FROM llm_cache").fetchone()["n"]
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "entries": entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+                "stores": self._stores,
+                "saved_seconds": round(self._saved_seconds, 3),
+            }
+
+
+llm_cache = LLMCache()
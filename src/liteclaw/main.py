@@ -2,19 +2,51 @@ from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import StreamingResponse, FileResponse
 from pydantic import BaseModel
 import os
-from typing import Optional
+from typing import Any, List, Optional
+import asyncio
+import json
 import uuid
-import httpx
-from .agent import process_message, stream_process_message
+from .bridge import bridge
+from .agent import aprocess_message, astream_events, astream_process_message
 from .memory import create_session
 from .config import settings
 import traceback
 from .scheduler import cron_manager
+from .dispatcher import InboundMessage, create_inbound_dispatcher
+from .outbox import outbox
+from .dedupe import inbound_dedupe
+from . import reply_stream, router
+from .ratelimit import llm_admission
+from .llm_cache import llm_cache
+from .shell_sessions import shell_pool
 
 app = FastAPI(title="LiteClaw Backend")
 
 @app.on_event("startup")
 async def startup_event():
+    # Import tool handlers now instead of on the first tool call
+    from .tool_registry import warm_tools
+    warm_tools()
+
+    # Which model each kind of work runs on (see LLM_PROFILES)
+    from .llm import MODEL_PROFILES, get_model_profile
+    for name in MODEL_PROFILES:
+        profile = get_model_profile(name)
+        print(f"[LLM] '{name}' work runs on {profile.provider}:{profile.model}.")
+
+    # Deliver replies left in the queue by the previous run
+    outbox.start()
+
+    # Sub-agent tasks cut off by the last shutdown cannot resume
+    from .subagent import sub_agent_manager
+    sub_agent_manager.recover()
+
+    # Background jobs of the previous run cannot be reattached
+    from .jobs import job_manager
+    interrupted = job_manager.recover()
+    if interrupted:
+        print(f"[Jobs] {interrupted} background job(s) were interrupted by the last shutdown.")
+
     cron_manager.start()
     
     # Start Heartbeat Monitor
@@ -25,6 +57,12 @@ async def startup_event():
     from .subconscious import subconscious_innovator
     subconscious_innovator.start()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    outbox.stop()
+    shell_pool.close_all()
+    await bridge.aclose()
+
 class CreateSessionRequest(BaseModel):
     session_id: Optional[str] = None
 
@@ -38,18 +76,20 @@ class CreateJobRequest(BaseModel):
     schedule_type: str # cron, interval, webhook
     schedule_value: str
     task: str
+    cacheable: bool = False # Reuse cached LLM responses for repeated runs of the same prompt
 
+# Plain def: FastAPI runs these on its thread pool, so their SQLite writes stay off the event loop
 @app.post("/cron/jobs")
-async def create_cron_job(req: CreateJobRequest):
-    job_id = cron_manager.create_job(req.name, req.schedule_type, req.schedule_value, req.task)
+def create_cron_job(req: CreateJobRequest):
+    job_id = cron_manager.create_job(req.name, req.schedule_type, req.schedule_value, req.task, req.cacheable)
     return {"status": "created", "job_id": job_id}
 
 @app.get("/cron/jobs")
-async def list_cron_jobs():
+def list_cron_jobs():
     return cron_manager.list_jobs()
 
 @app.delete("/cron/jobs/{job_id}")
-async def delete_cron_job(job_id: str):
+def delete_cron_job(job_id: str):
     cron_manager.delete_job(job_id)
     return {"status": "deleted"}
 
@@ -60,26 +100,77 @@ async def trigger_cron_webhook(job_id: str):
         raise HTTPException(status_code=404, detail="Job not found")
     return {"status": "triggered"}
 
-# WhatsApp Bridge Integration
-WHATSAPP_BRIDGE_URL = "http://localhost:3040"
+async def process_inbound_turn(session_id: str, batch: List[InboundMessage]):
+    """Run one agent turn for queued messages of a chat (several if they were coalesced) and send the reply."""
+    sender = batch[-1].sender
+    platform = batch[-1].platform
+    message_id = batch[-1].message_id
+    context_message = "\n".join(m.text for m in batch)
+
+    async def typing_loop():
+        """Keep sending typing status while AI is thinking."""
+        while not stop_typing_event.is_set():
+            try:
+                await bridge.atyping(sender, platform)
+            except Exception:
+                pass
+            # Telegram typing expires every 5s; the pooled connection stays open between pings
+            try:
+                await asyncio.wait_for(stop_typing_event.wait(), timeout=4)
+            except asyncio.TimeoutError:
+                pass
 
-# Simple in-memory de-duplication for WhatsApp messages
-PROCESSED_MESSAGES = set()
+    stop_typing_event = asyncio.Event()
+    typing_task = asyncio.create_task(typing_loop())
+
+    try:
+        if settings.REPLY_STREAMING:
+            # Show the reply sentence by sentence while tools still run (edited in place on Telegram)
+            reply = reply_stream.ReplyStream(sender, platform, session_id, message_id)
+            try:
+                async for chunk in astream_process_message(context_message, session_id=session_id, platform=platform):
+                    print(chunk, end="", flush=True)
+                    reply.feed(chunk)
+            finally:
+                # Flush what was streamed even if the turn failed midway
+                await reply.finish()
+        else:
+            # Async agent core: the LLM stream runs on the event loop, blocking tools on worker threads
+            response_text = await aprocess_message(context_message, session_id=session_id, platform=platform)
+
+            # 4. Queue the reply for the Node bridge (retried until delivered; keyed so a redelivered message is not answered twice)
+            dedupe_key = f"reply:{session_id}:{message_id}" if message_id else None
+            await asyncio.to_thread(outbox.send_text, sender, f"[LiteClaw] {response_text}", platform, dedupe_key)
+
+        # Stop the typing indicator
+        stop_typing_event.set()
+        await typing_task
+
+        # Turn off typing (explicitly for WhatsApp)
+        if platform == 'whatsapp':
+            try:
+                await bridge.astop_typing(sender, platform)
+            except Exception as e:
+                print(f"[{platform.title()}] Failed to stop typing: {e}")
+
+    except Exception as e:
+        print(f"[WhatsApp] CRITICAL ERROR processing message: {e}")
+        traceback.print_exc()
+    finally:
+        stop_typing_event.set()
+
+inbound_dispatcher = create_inbound_dispatcher(process_inbound_turn)
 
 @app.post("/whatsapp/incoming")
 async def handle_whatsapp_incoming(request: Request):
     # Parsing manually to handle 'from' key safely
     data = await request.json()
     
-    # De-duplication check
+    # De-duplication check (the bridge may redeliver a message)
     msg_id = data.get('message_id')
-    if msg_id:
-        if msg_id in PROCESSED_MESSAGES:
-            return {"status": "ignored_duplicate"}
-        PROCESSED_MESSAGES.add(msg_id)
-        # Prevent memory growth
-        if len(PROCESSED_MESSAGES) > 1000:
-            PROCESSED_MESSAGES.clear()
+    # Off the event loop: a persisted lookup takes a SQLite write lock
+    if msg_id and await asyncio.to_thread(inbound_dedupe.seen, msg_id):
+        return {"status": "ignored_duplicate"}
 
     sender = data.get('from') # This is the session key (remote user ID)
     message = data.get('body')
@@ -114,24 +205,19 @@ async def handle_whatsapp_incoming(request: Request):
     # 1. Create/Get Session
     # Use the specific sender ID as the session_id so sub-agents can notify back
     session_id = sender 
-    create_session(session_id)
+    await asyncio.to_thread(create_session, session_id)
 
     # CHECK FOR RESET COMMAND
     if message.strip().lower() == "/reset":
         from .memory import reset_session
-        reset_session(session_id)
+        await asyncio.to_thread(reset_session, session_id)
         print(f"[{platform.title()}] Session '{session_id}' RESET by user.")
         
         # Send confirmation via the correct platform
-        async with httpx.AsyncClient() as client:
-            try:
-                await client.post(f"{WHATSAPP_BRIDGE_URL}/whatsapp/send", json={
-                    "to": sender,
-                    "message": "[LiteClaw] 🔄 Session reset. Context cleared.",
-                    "platform": platform  # Route to correct platform
-                })
-            except Exception:
-                pass
+        try:
+            await asyncio.to_thread(outbox.send_text, sender, "[LiteClaw] 🔄 Session reset. Context cleared.", platform)
+        except Exception:
+            pass
         return {"status": "reset"}
 
     # 2. Store Message & Handle Logic
@@ -149,15 +235,10 @@ async def handle_whatsapp_incoming(request: Request):
         
         # Send confirmation (only if not from self to avoid double messages)
         if not from_me:
-            async with httpx.AsyncClient() as client:
-                try:
-                    await client.post(f"{WHATSAPP_BRIDGE_URL}/whatsapp/send", json={
-                        "to": sender,
-                        "message": f"[LiteClaw] ✅ Got it! Continuing browser task with your answer: \"{message}\"",
-                        "platform": platform
-                    })
-                except:
-                    pass
+            try:
+                await asyncio.to_thread(outbox.send_text, sender, f"[LiteClaw] ✅ Got it! Continuing browser task with your answer: \"{message}\"", platform)
+            except Exception:
+                pass
         else:
             print(f"[Browser] ✅ Received answer to pending question: {message}")
         
@@ -169,52 +250,12 @@ async def handle_whatsapp_incoming(request: Request):
 
     # All other messages continue to agent processing
     # (Browser answers and loop prevention already handled above)
-
-    async def typing_loop():
-        """Keep sending typing status while AI is thinking."""
-        async with httpx.AsyncClient() as client:
-            while not stop_typing_event.is_set():
-                try:
-                    await client.post(f"{WHATSAPP_BRIDGE_URL}/whatsapp/typing", json={"to": sender, "platform": platform})
-                except:
-                    pass
-                await asyncio.sleep(4) # Telegram typing expires every 5s
-
-    import asyncio
-    stop_typing_event = asyncio.Event()
-    typing_task = asyncio.create_task(typing_loop())
-
-    try:
-        # CRITICAL: Use run_in_threadpool to avoid blocking the main async loop with the sync process_message
-        from fastapi.concurrency import run_in_threadpool
-        response_text = await run_in_threadpool(process_message, context_message, session_id=session_id, platform=platform)
-        
-        # Stop the typing indicator
-        stop_typing_event.set()
-        await typing_task
-
-        final_reply = f"[LiteClaw] {response_text}"
-        
-        # 4. Send Reply via Node Bridge
-        async with httpx.AsyncClient() as client:
-            try:
-                await client.post(f"{WHATSAPP_BRIDGE_URL}/whatsapp/send", json={
-                    "to": sender,
-                    "message": final_reply,
-                    "platform": platform
-                })
-                # Turn off typing (explicitly for WhatsApp)
-                if platform == 'whatsapp':
-                    await client.post(f"{WHATSAPP_BRIDGE_URL}/whatsapp/stop-typing", json={"to": sender, "platform": platform})
-            except Exception as e:
-                print(f"[{platform.title()}] Failed to send reply: {e}")
-
-    except Exception as e:
-        print(f"[WhatsApp] CRITICAL ERROR processing message: {e}")
-        traceback.print_exc()
-        return {"status": "error", "message": str(e)}
-
-    return {"status": "processed"}
+    # Turns for one chat run in arrival order; the bridge does not wait for the reply
+    queued = inbound_dispatcher.submit(InboundMessage(session_id, context_message, sender, platform, message_id=msg_id))
+    if not queued:
+        print(f"[{platform.title()}] Queue full for '{session_id}', dropping message.")
+        return {"status": "ignored_queue_full"}
+    return {"status": "queued"}
 
 @app.post("/session/create")
 def create_session_endpoint(request: CreateSessionRequest):
@@ -235,17 +276,93 @@ def list_sessions_endpoint():
     from .memory import list_sessions
     return list_sessions()
 
+@app.get("/metrics")
+def metrics_endpoint():
+    """Queue depth, wait times and throughput of the background components."""
+    return {
+        "inbound": inbound_dispatcher.metrics(),
+        "inbound_dedupe": inbound_dedupe.metrics(),
+        "outbox": outbox.metrics(),
+        "replies": reply_stream.metrics(),
+        "llm_cache": llm_cache.metrics(),
+        "llm_router": router.metrics(),
+        "llm_admission": llm_admission.metrics(),
+        "shell_sessions": shell_pool.metrics(),
+    }
+
 @app.post("/chat")
 async def chat_endpoint(request: ChatRequest):
     if request.stream:
         return StreamingResponse(
-            stream_process_message(request.message, request.session_id, platform="api"),
+            astream_process_message(request.message, request.session_id, platform="api"),
             media_type="text/plain"
         )
     else:
-        response = process_message(request.message, request.session_id, platform="api")
+        response = await aprocess_message(request.message, request.session_id, platform="api")
         return {"response": response}
 
+# Comment line sent on idle SSE streams so proxies keep them open and a gone client is noticed
+SSE_KEEPALIVE_SECONDS = 15
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def chat_event_stream(message: str, session_id: str):
+    """
+    Server-sent events for one turn: token, progress, tool_start, tool_result and
+    usage as they happen, then done (or error). If the client disconnects, the
+    turn is cancelled, which aborts the in-flight LLM request and stops a running tool.
+    """
+    events = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for event in astream_events(message, session_id, platform="api"):
+                events.put_nowait(event)
+        except Exception as e:
+            traceback.print_exc()
+            events.put_nowait(("error", {"message": str(e)}))
+        finally:
+            events.put_nowait(None)
+
+    producer = asyncio.create_task(produce())
+    response_text = ""
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(events.get(), timeout=SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                break
+            kind, data = event
+            if kind == "token":
+                response_text += data
+                yield _sse(kind, {"text": data})
+            elif kind == "progress":
+                yield _sse(kind, {"text": data})
+            else:
+                if kind == "usage":
+                    for key in usage:
+                        usage[key] += data.get(key, 0)
+                yield _sse(kind, data)
+        yield _sse("done", {"response": response_text, "usage": usage})
+    finally:
+        if not producer.done():
+            producer.cancel()
+            print(f"[API] Client disconnected; cancelled turn for session '{session_id}'.")
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """Typed, token-level streaming of a turn as server-sent events (see chat_event_stream)."""
+    return StreamingResponse(
+        chat_event_stream(request.message, request.session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/")
 def read_root():
     index_path = os.path.join(os.getcwd(), "index.html")
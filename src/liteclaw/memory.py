@@ -1,64 +1,30 @@
 import json
 from typing import Optional
-from .db import get_db_connection
+from .db import get_db_connection, transaction
+from .config import settings
 
 def create_session(session_id: str, parent_session_id: Optional[str] = None):
-    conn = get_db_connection()
-    c = conn.cursor()
     try:
-        c.execute("INSERT INTO sessions (session_id, parent_session_id) VALUES (?, ?)", (session_id, parent_session_id))
-        conn.commit()
+        with transaction() as c:
+            c.execute("INSERT INTO sessions (session_id, parent_session_id) VALUES (?, ?)", (session_id, parent_session_id))
         return True
     except Exception:
         # Session likely exists
         return False
-    finally:
-        conn.close()
 
 def list_sessions():
-    conn = get_db_connection()
-    c = conn.cursor()
     try:
         # Get all sessions with their last message time if possible, or just IDs
         # For simplicity, just listing IDs for now.
-        c.execute("SELECT session_id, created_at FROM sessions ORDER BY created_at DESC")
-        rows = c.fetchall()
+        rows = get_db_connection().execute("SELECT session_id, created_at FROM sessions ORDER BY created_at DESC").fetchall()
         return [{"session_id": row["session_id"], "created_at": row["created_at"]} for row in rows]
     except Exception:
         return []
-    finally:
-        conn.close()
 
-def add_message(session_id: str, message: dict):
-    """
-    Store a message in the database.
-    message: dict with 'role', 'content', and optional 'tool_calls', 'tool_call_id', 'name'
-    """
-    # De-duplication: don't add the exact same message if it's already the latest in history
-    # This prevents double-storage when both main.py and agent.py try to save.
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    role = message.get("role")
-    content = message.get("content")
-    tool_call_id = message.get("tool_call_id")
-    name = message.get("name")
-
-    # Check last message
-    c.execute('''
-        SELECT role, content, tool_call_id, name FROM messages 
-        WHERE session_id = ? 
-        ORDER BY id DESC LIMIT 1
-    ''', (session_id,))
-    last = c.fetchone()
-    if last:
-        if (last["role"] == role and 
-            last["content"] == content and 
-            last["tool_call_id"] == tool_call_id and 
-            last["name"] == name):
-            conn.close()
-            return
+_ROW_FIELDS = ("role", "content", "tool_calls", "tool_call_id", "name")
 
+def _message_row(message: dict) -> tuple:
+    """Flatten a message dict into a row tuple ordered like _ROW_FIELDS."""
     # Handle tool calls serialization
     tool_calls = None
     if message.get("tool_calls"):
@@ -73,61 +39,204 @@ def add_message(session_id: str, message: dict):
             }
             for tc in message.get("tool_calls")
         ])
-    
-    c.execute('''
-        INSERT INTO messages (session_id, role, content, tool_calls, tool_call_id, name)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (session_id, role, content, tool_calls, tool_call_id, name))
-    
-    conn.commit()
-    conn.close()
-
-def get_session_history(session_id: str, limit: int = 20):
+    return (message.get("role"), message.get("content"), tool_calls, message.get("tool_call_id"), message.get("name"))
+
+def _is_duplicate(last, row: tuple) -> bool:
+    """Same role, content, tool_call_id and name as the latest stored message."""
+    if not last:
+        return False
+    role, content, _, tool_call_id, name = row
+    return (last["role"] == role and
+            last["content"] == content and
+            last["tool_call_id"] == tool_call_id and
+            last["name"] == name)
+
+def _get_last_message(session_id: str):
+    return get_db_connection().execute('''
+        SELECT role, content, tool_call_id, name FROM messages 
+        WHERE session_id = ? 
+        ORDER BY id DESC LIMIT 1
+    ''', (session_id,)).fetchone()
+
+_INSERT_MESSAGE = '''
+    INSERT INTO messages (session_id, role, content, tool_calls, tool_call_id, name)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+def add_message(session_id: str, message: dict):
     """
-    Retrieve message history for a session.
+    Store a message in the database.
+    message: dict with 'role', 'content', and optional 'tool_calls', 'tool_call_id', 'name'
     """
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Get last N messages ordered by time
-    c.execute('''
-        SELECT role, content, tool_calls, tool_call_id, name 
-        FROM messages 
-        WHERE session_id = ? 
-        ORDER BY id ASC
-    ''', (session_id,))
-    
-    rows = c.fetchall()
-    conn.close()
-    
-    messages = []
-    for row in rows:
-        msg = {
-            "role": row["role"],
-            "content": row["content"]
-        }
-        if row["tool_calls"]:
-            msg["tool_calls"] = json.loads(row["tool_calls"])
-        if row["tool_call_id"]:
-            msg["tool_call_id"] = row["tool_call_id"]
-        if row["name"]:
-            msg["name"] = row["name"]
-            
-        messages.append(msg)
-        
-    return messages
+    # De-duplication: don't add the exact same message if it's already the latest in history
+    # This prevents double-storage when both main.py and agent.py try to save.
+    row = _message_row(message)
+    with transaction() as c:
+        if _is_duplicate(_get_last_message(session_id), row):
+            return
+        c.execute(_INSERT_MESSAGE, (session_id,) + row)
+
+class MessageBuffer:
+    """
+    Turn-scoped write buffer for one session.
+
+    Messages added during an agent turn are kept in memory and written in a
+    single transaction on flush(). The agent flushes once per completed step
+    (assistant message + all of its tool results) and again when the turn ends,
+    so a crash mid-turn loses at most the step in flight and never persists a
+    tool call without its results. De-duplication runs in memory against the
+    last flushed row, which is read from the database once per buffer.
+    """
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self._pending = []
+        self._last = None
+        self._last_loaded = False
+
+    def _latest(self):
+        if self._pending:
+            return dict(zip(_ROW_FIELDS, self._pending[-1]))
+        if not self._last_loaded:
+            self._last = _get_last_message(self.session_id)
+            self._last_loaded = True
+        return self._last
+
+    def add(self, message: dict):
+        row = _message_row(message)
+        if _is_duplicate(self._latest(), row):
+            return
+        self._pending.append(row)
+
+    def flush(self):
+        """Write all pending messages in one transaction."""
+        if not self._pending:
+            return
+        with transaction() as c:
+            c.executemany(_INSERT_MESSAGE, [(self.session_id,) + row for row in self._pending])
+        self._last = dict(zip(_ROW_FIELDS, self._pending[-1]))
+        self._last_loaded = True
+        self._pending = []
+
+def estimate_tokens(message: dict) -> int:
+    """Cheap token estimate (~4 chars per token) used for history windowing."""
+    size = len(message.get("content") or "")
+    if message.get("tool_calls"):
+        size += len(json.dumps(message["tool_calls"]))
+    return size // 4 + 4 # Per-message overhead (role, separators)
+
+def drop_orphan_tool_messages(messages: list) -> list:
+    """
+    Keep tool-call/tool-result pairs intact after windowing.
+    Tool results whose assistant call fell outside the window are dropped,
+    and so are assistant tool calls that have no stored results.
+    """
+    answered = {m.get("tool_call_id") for m in messages if m["role"] == "tool"}
+    declared = set()
+    kept = []
+    for msg in messages:
+        if msg.get("tool_calls"):
+            call_ids = {tc.get("id") for tc in msg["tool_calls"]}
+            if not call_ids <= answered:
+                continue
+            declared |= call_ids
+        elif msg["role"] == "tool" and msg.get("tool_call_id") not in declared:
+            continue
+        kept.append(msg)
+    return kept
+
+def _row_to_message(row) -> dict:
+    msg = {
+        "role": row["role"],
+        "content": row["content"]
+    }
+    if row["tool_calls"]:
+        msg["tool_calls"] = json.loads(row["tool_calls"])
+    if row["tool_call_id"]:
+        msg["tool_call_id"] = row["tool_call_id"]
+    if row["name"]:
+        msg["name"] = row["name"]
+    return msg
+
+def get_session_window(session_id: str, limit: Optional[int] = None):
+    """Last `limit` messages of a session as (id, message) pairs, oldest first."""
+    if limit is None:
+        limit = settings.HISTORY_MAX_MESSAGES
+    # Newest first so the window is a single LIMIT scan, reversed below
+    rows = get_db_connection().execute('''
+        SELECT id, role, content, tool_calls, tool_call_id, name
+        FROM messages
+        WHERE session_id = ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (session_id, limit)).fetchall()
+    return [(row["id"], _row_to_message(row)) for row in reversed(rows)]
+
+def get_session_history(session_id: str, limit: Optional[int] = None, max_tokens: Optional[int] = None):
+    """
+    Retrieve the most recent message history for a session, oldest first.
+    The window is the last `limit` messages, further trimmed to `max_tokens`
+    (estimated) when a token budget is set. Both default to the HISTORY_* settings.
+    """
+    if max_tokens is None:
+        max_tokens = settings.HISTORY_MAX_TOKENS
+
+    messages = [msg for _, msg in get_session_window(session_id, limit)]
+    if max_tokens:
+        used_tokens = 0
+        for i in range(len(messages) - 1, -1, -1):
+            used_tokens += estimate_tokens(messages[i])
+            if used_tokens > max_tokens and i < len(messages) - 1:
+                messages = messages[i + 1:]
+                break
+
+    return drop_orphan_tool_messages(messages)
+
+def get_messages_between(session_id: str, after_id: int, before_id: int, limit: int):
+    """The newest `limit` messages with after_id < id < before_id, as (id, message) pairs oldest first."""
+    rows = get_db_connection().execute('''
+        SELECT id, role, content, tool_calls, tool_call_id, name
+        FROM messages
+        WHERE session_id = ? AND id > ? AND id < ?
+        ORDER BY id DESC
+        LIMIT ?
+    ''', (session_id, after_id, before_id, limit)).fetchall()
+    return [(row["id"], _row_to_message(row)) for row in reversed(rows)]
+
+def count_messages_between(session_id: str, after_id: int, before_id: int) -> int:
+    row = get_db_connection().execute('''
+        SELECT COUNT(*) AS n FROM messages
+        WHERE session_id = ? AND id > ? AND id < ?
+    ''', (session_id, after_id, before_id)).fetchone()
+    return row["n"]
+
+def get_session_summary(session_id: str):
+    """Rolling summary of evicted messages as (summary, last_message_id)."""
+    row = get_db_connection().execute(
+        "SELECT summary, last_message_id FROM session_summaries WHERE session_id = ?", (session_id,)
+    ).fetchone()
+    if not row:
+        return "", 0
+    return row["summary"] or "", row["last_message_id"] or 0
+
+def save_session_summary(session_id: str, summary: str, last_message_id: int):
+    with transaction() as c:
+        c.execute('''
+            INSERT INTO session_summaries (session_id, summary, last_message_id, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(session_id) DO UPDATE SET
+                summary = excluded.summary,
+                last_message_id = excluded.last_message_id,
+                updated_at = excluded.updated_at
+        ''', (session_id, summary, last_message_id))
 
 def reset_session(session_id: str):
     """
     Clear all messages for a given session.
     """
-    conn = get_db_connection()
-    c = conn.cursor()
     try:
-        c.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
-        conn.commit()
+        with transaction() as c:
+            c.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            c.execute("DELETE FROM session_summaries WHERE session_id = ?", (session_id,))
         return True
     except Exception:
         return False
-    finally:
-        conn.close()
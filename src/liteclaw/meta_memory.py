@@ -1,5 +1,6 @@
 from .config import settings
 import os
+import threading
 
 def get_file_path(filename: str) -> str:
     """Gets the path for a meta-memory file, prioritizing the WORK_DIR/configs folder."""
@@ -23,14 +24,55 @@ SUBCONSCIOUS_FILE = get_file_path("SUBCONSCIOUS.md")
 LEARNING_FILE = get_file_path("LEARNING.md")
 
 
+MEMORY_FILES = (AGENT_FILE, SOUL_FILE, PERSONALITY_FILE, SUBCONSCIOUS_FILE, LEARNING_FILE)
+
+# Read cache: file contents keyed on (mtime_ns, size). The writers below drop
+# entries and bump the generation directly, so prompt assembly in agent.py can
+# skip re-reading (and re-stat'ing) files that have not changed.
+_content_cache = {}
+_cache_lock = threading.Lock()
+_generation = 0
+
+def _file_signature(filepath):
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def get_memory_generation() -> int:
+    """Counter bumped by every in-process write to a meta-memory file."""
+    return _generation
+
+def get_memory_signature() -> tuple:
+    """(mtime_ns, size) of every meta-memory file, for detecting external edits."""
+    return tuple(_file_signature(path) for path in MEMORY_FILES)
+
 def read_file_content(filepath):
-    if not os.path.exists(filepath):
+    signature = _file_signature(filepath)
+    if signature is None:
         return ""
+    cached = _content_cache.get(filepath)
+    if cached and cached[0] == signature:
+        return cached[1]
     try:
         with open(filepath, "r", encoding="utf-8") as f:
-            return f.read()
+            content = f.read()
     except Exception:
         return ""
+    with _cache_lock:
+        _content_cache[filepath] = (signature, content)
+    return content
+
+def _write_file(filepath, content: str, mode: str = "w"):
+    global _generation
+    try:
+        with open(filepath, mode, encoding="utf-8") as f:
+            f.write(content)
+    finally:
+        with _cache_lock:
+            _content_cache.pop(filepath, None)
+            _generation += 1
 
 def get_agent_profile():
     return read_file_content(AGENT_FILE)
@@ -56,16 +98,14 @@ def update_soul_memory(content: str):
     But usually, the AI should read -> modify -> write.
     """
     try:
-        with open(SOUL_FILE, "w", encoding="utf-8") as f:
-            f.write(content)
+        _write_file(SOUL_FILE, content)
         return "SOUL updated successfully."
     except Exception as e:
         return f"Failed to update SOUL: {e}"
 
 def append_to_soul(content: str):
     try:
-        with open(SOUL_FILE, "a", encoding="utf-8") as f:
-            f.write(f"\n{content}")
+        _write_file(SOUL_FILE, f"\n{content}", mode="a")
         return "Memory appended to SOUL."
     except Exception as e:
         return f"Failed to append to SOUL: {e}"
@@ -75,8 +115,7 @@ def update_personality_memory(content: str):
     Overwrites PERSONALITY.md with new content.
     """
     try:
-        with open(PERSONALITY_FILE, "w", encoding="utf-8") as f:
-            f.write(content)
+        _write_file(PERSONALITY_FILE, content)
         return "Personality updated successfully."
     except Exception as e:
         return f"Failed to update Personality: {e}"
@@ -87,8 +126,7 @@ def update_subconscious_memory(content: str):
     Stores innovations, error patterns, and experimental ideas.
     """
     try:
-        with open(SUBCONSCIOUS_FILE, "w", encoding="utf-8") as f:
-            f.write(content)
+        _write_file(SUBCONSCIOUS_FILE, content)
         return "Subconscious updated successfully."
     except Exception as e:
         return f"Failed to update Subconscious: {e}"
@@ -99,8 +137,7 @@ def update_learning_memory(content: str):
     Stores best practices, lessons learned, and self-organization strategies.
     """
     try:
-        with open(LEARNING_FILE, "w", encoding="utf-8") as f:
-            f.write(content)
+        _write_file(LEARNING_FILE, content)
         return "Learning memory updated successfully."
     except Exception as e:
         return f"Failed to update Learning memory: {e}"
@@ -0,0 +1,17 @@
+from typing import Dict, Iterable
+
+# Recent samples kept per latency series (wait times, send latency, ...)
+METRIC_SAMPLES = 500
+
+
+def summarize(samples: Iterable[float]) -> Dict[str, float]:
+    """avg / p50 / p95 / max of a window of latency samples, in seconds."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"avg": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    return {
+        "avg": round(sum(ordered) / len(ordered), 3),
+        "p50": round(ordered[len(ordered) // 2], 3),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "max": round(ordered[-1], 3),
+    }
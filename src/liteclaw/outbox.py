@@ -0,0 +1,277 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from .bridge import SEND_ENDPOINT, _media_payload, _message_payload, bridge
+from .config import settings
+from .db import get_db_connection, transaction
+from .metrics import METRIC_SAMPLES, summarize
+from .ratelimit import TokenBucket
+
+# Seconds the sender sleeps when nothing is due (enqueue wakes it earlier)
+OUTBOX_POLL_INTERVAL = 1.0
+# Queued rows of one chat read when merging consecutive texts
+OUTBOX_COALESCE_SCAN = 50
+# Seconds between purges of old delivered/failed rows
+OUTBOX_PURGE_INTERVAL = 600
+
+# Bridge answers 400 for malformed requests; those will never succeed
+_PERMANENT_STATUS = {400, 404, 413, 422}
+
+
+class Outbox:
+    """
+    Durable, rate-limited queue of outbound messages to the Node bridge.
+
+    Messages are written to `outbound_messages` before anything is sent, so a
+    crash or a bridge outage never loses them. A single sender thread delivers
+    them in order per recipient, under a per-chat and a global token bucket:
+    each pass looks only at the oldest queued message of every chat, and sends
+    run on OUTBOX_SEND_WORKERS threads (one chat at a time each), so a chat
+    with a long or retrying backlog, or a slow send, never holds up the rest.
+    Consecutive text messages to the same chat are merged into one send, and
+    failed sends are retried with exponential backoff. Delivery is at-least-once;
+    an optional `dedupe_key` makes enqueueing the same message twice a no-op.
+    """
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._global = TokenBucket(settings.OUTBOX_GLOBAL_RATE, max(1.0, settings.OUTBOX_GLOBAL_RATE))
+        self._last_purge = 0.0
+        self._workers = max(1, settings.OUTBOX_SEND_WORKERS)
+        self._senders = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="liteclaw-outbox-send")
+        self._inflight = set() # Recipients with a send in progress
+        self._lock = threading.Lock()
+
+        self._sent = 0
+        self._sends = 0
+        self._retries = 0
+        self._failed = 0
+        self._coalesced = 0
+        self._deduped = 0
+        self._latencies = deque(maxlen=METRIC_SAMPLES)
+
+    # --- Producers (any thread) ---
+
+    def send_text(self, to: str, message: str, platform: Optional[str] = None, dedupe_key: Optional[str] = None) -> Optional[int]:
+        return self._enqueue(to, platform, "text", _message_payload(to, message, platform), dedupe_key)
+
+    def send_media(self, to: str, url_or_path: str, media_type: str, caption: str, platform: str,
+                   message: Optional[str] = None, dedupe_key: Optional[str] = None) -> Optional[int]:
+        payload = _media_payload(to, url_or_path, media_type, caption, platform, message)
+        return self._enqueue(to, platform, "media", payload, dedupe_key)
+
+    def _enqueue(self, to: str, platform: Optional[str], kind: str, payload: Dict[str, Any], dedupe_key: Optional[str]) -> Optional[int]:
+        """Persist one message. Returns its id, or None if the dedupe key was already queued."""
+        now = time.time()
+        with transaction() as c:
+            c.execute(
+                "INSERT OR IGNORE INTO outbound_messages (recipient, platform, kind, payload, dedupe_key, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (to, platform, kind, json.dumps(payload), dedupe_key, now, now)
+            )
+            inserted = c.rowcount
+            message_id = c.lastrowid
+        if not inserted:
+            self._deduped += 1
+            return None
+        self._wake.set()
+        return message_id
+
+    # --- Sender ---
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        # Sends interrupted by a crash or restart go out again (at-least-once)
+        with transaction() as c:
+            c.execute("UPDATE outbound_messages SET status = 'pending' WHERE status = 'sending'")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="liteclaw-outbox", daemon=True)
+        self._thread.start()
+        print("[Outbox] Sender started.")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                delay = self._drain()
+                self._maybe_purge()
+            except Exception as e:
+                print(f"[Outbox] Sender error: {e}")
+                delay = OUTBOX_POLL_INTERVAL
+            self._wake.wait(timeout=max(0.05, delay))
+            self._wake.clear()
+
+    def _bucket(self, recipient: str) -> TokenBucket:
+        bucket = self._buckets.get(recipient)
+        if bucket is None:
+            bucket = TokenBucket(settings.OUTBOX_RECIPIENT_RATE, settings.OUTBOX_RECIPIENT_BURST)
+            self._buckets[recipient] = bucket
+        return bucket
+
+    def _drain(self) -> float:
+        """Start every send that is due and allowed now. Returns seconds until the next attempt."""
+        # The oldest unsent message of each chat; a chat whose head is still sending is skipped,
+        # so a retry is never overtaken
+        heads = get_db_connection().execute(
+            "SELECT * FROM outbound_messages WHERE status = 'pending' AND id IN ("
+            "SELECT MIN(id) FROM outbound_messages WHERE status IN ('pending', 'sending') GROUP BY recipient"
+            ") ORDER BY id"
+        ).fetchall()
+
+        now = time.time()
+        next_delay = OUTBOX_POLL_INTERVAL
+        for head in heads:
+            recipient = head["recipient"]
+            if head["next_attempt_at"] > now:
+                next_delay = min(next_delay, head["next_attempt_at"] - now)
+                continue
+            with self._lock:
+                if recipient in self._inflight:
+                    continue
+                if len(self._inflight) >= self._workers:
+                    # Every sender is busy; a finished send wakes the loop
+                    return next_delay
+            bucket = self._bucket(recipient)
+            wait = bucket.time_until()
+            if wait > 0:
+                next_delay = min(next_delay, wait)
+                continue
+            if not self._global.try_acquire():
+                return min(next_delay, self._global.time_until())
+            bucket.try_acquire()
+            batch = self._coalesce(head, now)
+            self._claim(batch)
+            self._senders.submit(self._deliver, batch)
+        return next_delay
+
+    def _coalesce(self, head: Any, now: float) -> List[Any]:
+        batch = [head]
+        max_chars = settings.OUTBOX_COALESCE_MAX_CHARS
+        if not max_chars or head["kind"] != "text":
+            return batch
+        rows = get_db_connection().execute(
+            "SELECT * FROM outbound_messages WHERE status = 'pending' AND recipient = ? AND id > ? ORDER BY id LIMIT ?",
+            (head["recipient"], head["id"], OUTBOX_COALESCE_SCAN)
+        ).fetchall()
+        size = len(json.loads(head["payload"])["message"])
+        for row in rows:
+            if row["kind"] != "text" or row["platform"] != head["platform"] or row["next_attempt_at"] > now:
+                break
+            size += len(json.loads(row["payload"])["message"]) + 2
+            if size > max_chars:
+                break
+            batch.append(row)
+        return batch
+
+    def _claim(self, batch: List[Any]):
+        """Mark a batch as sending (on the sender thread, so the next pass skips its chat)."""
+        ids = [row["id"] for row in batch]
+        with transaction() as c:
+            c.execute(f"UPDATE outbound_messages SET status = 'sending' WHERE id IN ({','.join('?' * len(ids))})", ids)
+        with self._lock:
+            self._inflight.add(batch[0]["recipient"])
+
+    def _deliver(self, batch: List[Any]):
+        try:
+            self._send(batch)
+        except Exception as e:
+            print(f"[Outbox] Sender error: {e}")
+        finally:
+            with self._lock:
+                self._inflight.discard(batch[0]["recipient"])
+            # The chat may have more due, and a sender is free again
+            self._wake.set()
+
+    def _send(self, batch: List[Any]):
+        ids = [row["id"] for row in batch]
+        marks = ",".join("?" * len(ids))
+        payload = json.loads(batch[0]["payload"])
+        if len(batch) > 1:
+            payload["message"] = "\n\n".join(json.loads(row["payload"])["message"] for row in batch)
+
+        error = None
+        permanent = False
+        try:
+            response = bridge.post(SEND_ENDPOINT, payload)
+            if response.status_code >= 400:
+                error = f"HTTP {response.status_code}: {response.text[:200]}"
+                permanent = response.status_code in _PERMANENT_STATUS
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+
+        now = time.time()
+        attempts = batch[0]["attempts"] + 1
+        with transaction() as c:
+            if error is None:
+                c.execute(f"UPDATE outbound_messages SET status = 'sent', sent_at = ?, attempts = attempts + 1 WHERE id IN ({marks})", [now] + ids)
+                with self._lock:
+                    self._sends += 1
+                    self._sent += len(batch)
+                    self._coalesced += len(batch) - 1
+                    for row in batch:
+                        self._latencies.append(now - row["created_at"])
+            elif permanent or attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                c.execute(f"UPDATE outbound_messages SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id IN ({marks})", [error] + ids)
+                with self._lock:
+                    self._sends += 1
+                    self._failed += len(batch)
+                print(f"[Outbox] ❌ Giving up on {len(batch)} message(s) to {batch[0]['recipient']}: {error}")
+            else:
+                # Exponential backoff with jitter so a bridge restart is not hit by every retry at once
+                delay = min(settings.OUTBOX_RETRY_MAX, settings.OUTBOX_RETRY_BASE * (2 ** (attempts - 1)))
+                delay *= random.uniform(0.8, 1.2)
+                c.execute(
+                    f"UPDATE outbound_messages SET status = 'pending', attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE id IN ({marks})",
+                    [now + delay, error] + ids
+                )
+                with self._lock:
+                    self._sends += 1
+                    self._retries += 1
+                print(f"[Outbox] ⚠️ Send to {batch[0]['recipient']} failed ({error}); retry {attempts} in {delay:.1f}s.")
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge < OUTBOX_PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        cutoff = now - settings.OUTBOX_RETENTION_HOURS * 3600
+        with transaction() as c:
+            c.execute("DELETE FROM outbound_messages WHERE status IN ('sent', 'failed') AND created_at < ?", (cutoff,))
+        # Forget idle chats whose bucket is back to full
+        for recipient in [r for r, b in self._buckets.items() if b.full]:
+            del self._buckets[recipient]
+
+    def metrics(self) -> Dict[str, Any]:
+        conn = get_db_connection()
+        counts = {row["status"]: row["n"] for row in conn.execute(
+            "SELECT status, COUNT(*) AS n FROM outbound_messages GROUP BY status"
+        )}
+        oldest = conn.execute(
+            "SELECT MIN(created_at) AS t FROM outbound_messages WHERE status = 'pending'"
+        ).fetchone()["t"]
+        return {
+            "pending": counts.get("pending", 0) + counts.get("sending", 0),
+            "failed_stored": counts.get("failed", 0),
+            "oldest_pending_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "sent": self._sent,
+            "sends": self._sends,
+            "coalesced": self._coalesced,
+            "retries": self._retries,
+            "failed": self._failed,
+            "deduplicated": self._deduped,
+            "delivery_seconds": summarize(self._latencies),
+        }
+
+
+outbox = Outbox()
@@ -0,0 +1,336 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from .cancel import CancelToken, TurnCancelled
+from .config import settings
+from .metrics import METRIC_SAMPLES, summarize
+
+# Admission order of LLM calls: lower goes first
+PRIORITIES = {"interactive": 0, "subagent": 1, "background": 2}
+# Longest a waiting call sleeps before re-checking the buckets itself
+_MAX_POLL_SECONDS = 1.0
+
+_waiter_ids = itertools.count()
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, holding at most `capacity`.
+    Non-blocking; callers decide whether to wait (see time_until) or skip.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def time_until(self, tokens: float = 1.0) -> float:
+        """Seconds until `tokens` are available (0 if they are now)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = tokens - self._tokens
+            if missing <= 0:
+                return 0.0
+            return missing / self.rate if self.rate > 0 else float("inf")
+
+    def consume(self, tokens: float):
+        """Take `tokens` even if that leaves the bucket in debt (for costs known only afterwards)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+
+    @property
+    def full(self) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens >= self.capacity
+
+
+class AdmissionTimeout(TimeoutError):
+    """An LLM call waited past its deadline for a slot."""
+
+
+class _EndpointLimits:
+    """Requests-per-minute and tokens-per-minute buckets of one endpoint."""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.rpm = TokenBucket(rpm / 60.0, rpm) if rpm > 0 else None
+        self.tpm = TokenBucket(tpm / 60.0, tpm) if tpm > 0 else None
+        self.paused_until = 0.0
+
+    def clamp(self, tokens: float) -> float:
+        # A request larger than the whole minute budget would never fit
+        return min(tokens, self.tpm.capacity) if self.tpm else tokens
+
+    def time_until(self, tokens: float, now: float) -> float:
+        wait = max(0.0, self.paused_until - now)
+        if self.rpm:
+            wait = max(wait, self.rpm.time_until(1))
+        if self.tpm:
+            wait = max(wait, self.tpm.time_until(self.clamp(tokens)))
+        return wait
+
+    def take(self, tokens: float):
+        if self.rpm:
+            self.rpm.consume(1)
+        if self.tpm:
+            self.tpm.consume(self.clamp(tokens))
+
+
+class _Waiter:
+    def __init__(self, endpoint: str, priority: str, tokens: float, deadline: float, loop=None):
+        self.endpoint = endpoint
+        self.priority = priority
+        self.tokens = tokens
+        self.deadline = deadline
+        self.queued_at = time.monotonic()
+        self.order = (PRIORITIES.get(priority, len(PRIORITIES)), next(_waiter_ids))
+        self.granted = False
+        self._loop = loop
+        self._event = asyncio.Event() if loop else threading.Event()
+
+    def wake(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._event.set)
+        else:
+            self._event.set()
+
+    def wait(self, timeout: float):
+        self._event.wait(timeout)
+        self._event.clear()
+
+    async def await_wake(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+
+
+class LLMPermit:
+    """A granted LLM call. Release it when the response is finished."""
+
+    def __init__(self, controller: "AdmissionController", endpoint: str, tokens: float):
+        self._controller = controller
+        self.endpoint = endpoint
+        self.tokens = tokens
+        self._released = False
+
+    def release(self, used_tokens: Optional[float] = None):
+        """Free the concurrency slot. `used_tokens` (from the usage report) corrects the TPM estimate."""
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(self, used_tokens)
+
+
+class AdmissionController:
+    """
+    Process-wide gate in front of every LLM call.
+
+    At most LLM_MAX_CONCURRENT calls run at once, and each endpoint
+    ("provider:model") is held to the requests and tokens per minute in
+    LLM_RATE_LIMITS ("*" applies to endpoints without their own entry). Waiting
+    calls are admitted by priority class (interactive, then subagent, then
+    background), oldest first; within one endpoint a lower class never passes a
+    higher one. A call that is not admitted within its class's
+    LLM_QUEUE_TIMEOUTS raises AdmissionTimeout. After a 429 the endpoint is
+    paused for the provider's Retry-After (or LLM_RATE_LIMIT_COOLDOWN).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters: List[_Waiter] = []
+        self._limits: Dict[str, _EndpointLimits] = {}
+        self._active = 0
+        self._admitted = 0
+        self._timeouts = 0
+        self._throttled = 0
+        self._waits: Dict[str, deque] = {p: deque(maxlen=METRIC_SAMPLES) for p in PRIORITIES}
+
+    def _endpoint_limits(self, endpoint: str) -> _EndpointLimits:
+        limits = self._limits.get(endpoint)
+        if limits is None:
+            # "provider:model#<key hash>" (a second API key) has its own buckets, sized like "provider:model"
+            config = (
+                settings.LLM_RATE_LIMITS.get(endpoint) or settings.LLM_RATE_LIMITS.get(endpoint.split("#")[0])
+                or settings.LLM_RATE_LIMITS.get("*") or {}
+            )
+            limits = _EndpointLimits(float(config.get("rpm", 0)), float(config.get("tpm", 0)))
+            self._limits[endpoint] = limits
+        return limits
+
+    def _deadline(self, priority: str, timeout: Optional[float]) -> float:
+        if timeout is None:
+            timeout = settings.LLM_QUEUE_TIMEOUTS.get(priority, settings.LLM_QUEUE_TIMEOUTS.get("background", 300))
+        return time.monotonic() + timeout
+
+    def _dispatch(self) -> Optional[float]:
+        """Admit every waiter that fits now. Returns seconds until a blocked endpoint may have room."""
+        now = time.monotonic()
+        next_check = None
+        blocked = set()
+        with self._lock:
+            for waiter in sorted(self._waiters, key=lambda w: w.order):
+                if self._active >= settings.LLM_MAX_CONCURRENT:
+                    break
+                if waiter.endpoint in blocked:
+                    continue
+                limits = self._endpoint_limits(waiter.endpoint)
+                wait = limits.time_until(waiter.tokens, now)
+                if wait > 0:
+                    # Later waiters for this endpoint must not overtake this one
+                    blocked.add(waiter.endpoint)
+                    next_check = wait if next_check is None else min(next_check, wait)
+                    continue
+                limits.take(waiter.tokens)
+                self._waiters.remove(waiter)
+                self._active += 1
+                self._admitted += 1
+                self._waits[waiter.priority if waiter.priority in self._waits else "background"].append(now - waiter.queued_at)
+                waiter.granted = True
+                waiter.wake()
+        return next_check
+
+    def _poll_delay(self, waiter: _Waiter, next_check: Optional[float]) -> float:
+        delay = min(waiter.deadline - time.monotonic(), _MAX_POLL_SECONDS)
+        if next_check is not None:
+            delay = min(delay, next_check)
+        return max(delay, 0.0)
+
+    def _give_up(self, waiter: _Waiter) -> bool:
+        """Drop a waiter past its deadline. False if it was admitted meanwhile."""
+        with self._lock:
+            if waiter.granted:
+                return False
+            self._waiters.remove(waiter)
+            self._timeouts += 1
+        print(f"[Admission] ⏱️ {waiter.priority} call to {waiter.endpoint} not admitted before its deadline.")
+        return True
+
+    def _enqueue(self, endpoint: str, priority: str, tokens: float, timeout: Optional[float], loop=None) -> _Waiter:
+        waiter = _Waiter(endpoint, priority, tokens, self._deadline(priority, timeout), loop)
+        with self._lock:
+            self._waiters.append(waiter)
+        return waiter
+
+    def acquire(self, endpoint: str, priority: str = "interactive", tokens: float = 0, timeout: Optional[float] = None,
+                cancel: Optional[CancelToken] = None) -> LLMPermit:
+        """
+        Block until the call may start. Raises AdmissionTimeout past the
+        deadline, or TurnCancelled as soon as `cancel` is cancelled.
+        """
+        waiter = self._enqueue(endpoint, priority, tokens, timeout)
+        unregister = cancel.on_cancel(waiter.wake) if cancel else None
+        try:
+            while True:
+                next_check = self._dispatch()
+                if waiter.granted:
+                    return LLMPermit(self, endpoint, tokens)
+                if cancel and cancel.cancelled:
+                    self._leave(waiter)
+                    raise TurnCancelled(cancel.reason)
+                if time.monotonic() >= waiter.deadline and self._give_up(waiter):
+                    raise AdmissionTimeout(f"No LLM slot for {endpoint} ({priority}) before the deadline")
+                waiter.wait(self._poll_delay(waiter, next_check))
+        finally:
+            if unregister:
+                unregister()
+
+    def try_acquire(self, endpoint: str, priority: str = "interactive", tokens: float = 0) -> Optional[LLMPermit]:
+        """A permit if the call may start right now (nothing ahead of it, room in the buckets), else None."""
+        waiter = self._enqueue(endpoint, priority, tokens, 0)
+        self._dispatch()
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                return None
+        return LLMPermit(self, endpoint, tokens)
+
+    def _leave(self, waiter: _Waiter):
+        """Take a waiter out of the queue, handing back the slot if it was admitted meanwhile."""
+        with self._lock:
+            granted = waiter.granted
+            if not granted:
+                self._waiters.remove(waiter)
+        if granted:
+            LLMPermit(self, waiter.endpoint, waiter.tokens).release(0)
+
+    async def aacquire(self, endpoint: str, priority: str = "interactive", tokens: float = 0, timeout: Optional[float] = None) -> LLMPermit:
+        """Event-loop counterpart of acquire."""
+        waiter = self._enqueue(endpoint, priority, tokens, timeout, asyncio.get_running_loop())
+        try:
+            while True:
+                next_check = self._dispatch()
+                if waiter.granted:
+                    return LLMPermit(self, endpoint, tokens)
+                if time.monotonic() >= waiter.deadline and self._give_up(waiter):
+                    raise AdmissionTimeout(f"No LLM slot for {endpoint} ({priority}) before the deadline")
+                await waiter.await_wake(self._poll_delay(waiter, next_check))
+        except asyncio.CancelledError:
+            # Cancelled while queued (e.g. a lost hedge): leave the queue or hand the slot back
+            self._leave(waiter)
+            raise
+
+    @contextmanager
+    def slot(self, endpoint: str, priority: str = "interactive", tokens: float = 0, timeout: Optional[float] = None) -> Iterator[LLMPermit]:
+        """`with llm_admission.slot(...)` around a non-streamed call."""
+        permit = self.acquire(endpoint, priority, tokens, timeout)
+        try:
+            yield permit
+        finally:
+            permit.release()
+
+    def _release(self, permit: LLMPermit, used_tokens: Optional[float]):
+        with self._lock:
+            self._active -= 1
+            limits = self._limits.get(permit.endpoint)
+        if limits and limits.tpm and used_tokens is not None:
+            limits.tpm.consume(used_tokens - limits.clamp(permit.tokens))
+        self._dispatch()
+
+    def throttle(self, endpoint: str, retry_after: Optional[float] = None):
+        """Pause an endpoint after the provider answered 429."""
+        pause = retry_after if retry_after and retry_after > 0 else settings.LLM_RATE_LIMIT_COOLDOWN
+        with self._lock:
+            limits = self._endpoint_limits(endpoint)
+            limits.paused_until = max(limits.paused_until, time.monotonic() + pause)
+            self._throttled += 1
+        print(f"[Admission] 🚦 {endpoint} is rate limited; pausing it for {pause:g}s.")
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            queued = {p: 0 for p in PRIORITIES}
+            for waiter in self._waiters:
+                queued[waiter.priority] = queued.get(waiter.priority, 0) + 1
+            return {
+                "active": self._active,
+                "max_concurrent": settings.LLM_MAX_CONCURRENT,
+                "queued": queued,
+                "admitted": self._admitted,
+                "timeouts": self._timeouts,
+                "throttled": self._throttled,
+                "wait_seconds": {p: summarize(w) for p, w in self._waits.items()},
+            }
+
+
+llm_admission = AdmissionController()
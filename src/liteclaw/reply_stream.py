@@ -0,0 +1,194 @@
+import asyncio
+import re
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from .bridge import bridge
+from .config import settings
+from .metrics import METRIC_SAMPLES, summarize
+from .outbox import outbox
+
+REPLY_PREFIX = "[LiteClaw] "
+# Platforms whose bridge messages can be edited after sending
+EDITABLE_PLATFORMS = {"telegram"}
+# Telegram rejects messages over 4096 chars; start a new one before that
+EDIT_MAX_CHARS = 4000
+
+# Places a partial reply may end: a paragraph or line break, or the end of a sentence
+_BOUNDARY = re.compile(r"\n\s*\n|\n|[.!?…](?=\s)")
+
+_first_text_times = deque(maxlen=METRIC_SAMPLES)
+_flushes = {"sent": 0, "edited": 0, "fallbacks": 0}
+
+
+def _last_boundary(text: str, start: int, end: int) -> int:
+    """Index just past the last boundary in text[start:end], or start if there is none."""
+    cut = start
+    for match in _BOUNDARY.finditer(text, start, end):
+        cut = match.end()
+    # Never end a partial message inside a code block
+    while cut > start and text.count("```", start, cut) % 2:
+        cut = text.rfind("```", start, cut)
+    return cut
+
+
+class ReplyStream:
+    """
+    Delivers an agent turn to a chat while it is still running.
+
+    Feed it the chunks of astream_process_message; `>>> ` progress lines are not
+    shown. Text is flushed at sentence or paragraph boundaries, at most every
+    REPLY_STREAM_INTERVAL seconds. On Telegram the reply is one message edited in
+    place (a new one starts after each tool step, so media sent by tools stays in
+    order). Elsewhere each flush is sent as its own message through the outbox.
+    Flushes run in the background, so feeding never waits on the bridge.
+    """
+
+    def __init__(self, to: str, platform: str, session_id: str, message_id: Optional[str] = None):
+        self.to = to
+        self.platform = platform
+        self.session_id = session_id
+        self.message_id = message_id
+        self.editable = platform in EDITABLE_PLATFORMS
+
+        self._text = "" # All user-visible text so far
+        self._delivered = 0 # End of the text the user has (or is queued to get)
+        self._step_end = 0 # End of the text before the last tool step
+        self._edit_id: Any = None # Telegram message being edited
+        self._edit_start = 0 # Where the text of that message begins
+        self._segments = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_flush = 0.0
+        self._started = time.monotonic()
+        self._first_text_at: Optional[float] = None
+
+    def feed(self, chunk: str):
+        if chunk.startswith(">>> "):
+            # The model's text for this step is complete; show it before the tools run
+            if len(self._text) > self._step_end:
+                self._step_end = len(self._text)
+                self._schedule(force=True)
+            return
+        self._text += chunk
+        self._schedule()
+
+    async def finish(self) -> str:
+        """Deliver everything that is left. Returns the full reply text."""
+        if self._flush_task:
+            await self._flush_task
+        self._step_end = len(self._text)
+        await self._flush(len(self._text), complete=True)
+        if self._first_text_at is not None:
+            _first_text_times.append(self._first_text_at - self._started)
+        return self._text
+
+    def _schedule(self, force: bool = False):
+        running = self._flush_task is not None and not self._flush_task.done()
+        if force:
+            # Must not be dropped: queue it behind the flush in progress
+            self._flush_task = asyncio.ensure_future(self._flush_after(self._flush_task if running else None, self._step_end))
+            return
+        if running or time.monotonic() - self._last_flush < settings.REPLY_STREAM_INTERVAL:
+            return
+        end = _last_boundary(self._text, self._delivered, len(self._text))
+        if end > self._delivered:
+            self._flush_task = asyncio.ensure_future(self._flush(end, complete=False))
+
+    async def _flush_after(self, previous: Optional[asyncio.Task], end: int):
+        if previous:
+            await previous
+        await self._flush(end, complete=True)
+
+    async def _flush(self, end: int, complete: bool):
+        """Deliver the text up to `end`. `complete` means no more text follows it in this step."""
+        try:
+            if self.editable:
+                await self._edit(end, complete)
+                if complete:
+                    self._close_message()
+            else:
+                await self._send(end, complete)
+        except Exception as e:
+            print(f"[Reply] Flush to {self.to} failed: {e}")
+        finally:
+            self._last_flush = time.monotonic()
+
+    async def _send(self, end: int, complete: bool):
+        body = self._text[self._delivered:end].strip()
+        if not body:
+            self._delivered = max(self._delivered, end)
+            return
+        # Avoid a trail of tiny messages; the rest goes with a later flush
+        if not complete and len(body) < settings.REPLY_STREAM_MIN_CHARS:
+            return
+        dedupe_key = f"reply:{self.session_id}:{self.message_id}:{self._segments}" if self.message_id else None
+        await asyncio.to_thread(outbox.send_text, self.to, REPLY_PREFIX + body, self.platform, dedupe_key)
+        self._delivered = end
+        self._segments += 1
+        _flushes["sent"] += 1
+        self._mark_first_text()
+
+    async def _edit(self, end: int, complete: bool):
+        while True:
+            body_end = end
+            if end - self._edit_start > EDIT_MAX_CHARS:
+                limit = self._edit_start + EDIT_MAX_CHARS
+                body_end = _last_boundary(self._text, self._edit_start, limit)
+                if body_end <= self._edit_start:
+                    body_end = limit
+            body = self._text[self._edit_start:body_end].strip()
+            if body and body_end > self._delivered:
+                try:
+                    if self._edit_id is None:
+                        response = await bridge.asend_message(self.to, REPLY_PREFIX + body, self.platform)
+                        response.raise_for_status()
+                        _flushes["sent"] += 1
+                        self._edit_id = response.json().get("id")
+                        if self._edit_id is None:
+                            # Older bridge: this message went out but cannot be edited
+                            self._mark_first_text()
+                            self._delivered = body_end
+                            self._fall_back("bridge returned no message id")
+                            await self._send(end, complete)
+                            return
+                    else:
+                        response = await bridge.aedit_message(self.to, self._edit_id, REPLY_PREFIX + body, self.platform)
+                        response.raise_for_status()
+                        _flushes["edited"] += 1
+                except Exception as e:
+                    # Deliver the rest as plain messages (e.g. the message was deleted)
+                    self._fall_back(e)
+                    if self._edit_id is None:
+                        self._delivered = self._edit_start
+                    await self._send(end, complete)
+                    return
+                self._mark_first_text()
+            self._delivered = body_end
+            if body_end == end:
+                return
+            # Message is full: continue in a new one
+            self._edit_start = body_end
+            self._edit_id = None
+
+    def _fall_back(self, reason: Any):
+        print(f"[Reply] Editing unavailable for {self.to} ({reason}); sending the rest as new messages.")
+        _flushes["fallbacks"] += 1
+        self.editable = False
+
+    def _close_message(self):
+        """Text after this point starts a new message."""
+        if self._edit_id is not None:
+            self._edit_id = None
+            self._edit_start = self._delivered
+
+    def _mark_first_text(self):
+        if self._first_text_at is None:
+            self._first_text_at = time.monotonic()
+
+
+def metrics() -> Dict[str, Any]:
+    return {
+        **_flushes,
+        "first_text_seconds": summarize(_first_text_times),
+    }
@@ -0,0 +1,506 @@
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Generator, Iterator, List, Optional, Tuple
+
+import litellm
+
+from .cancel import CancelToken, TurnCancelled
+from .config import settings
+from .llm import get_full_model_name
+from .memory import estimate_tokens
+from .metrics import METRIC_SAMPLES, summarize
+from .ratelimit import AdmissionTimeout, LLMPermit, llm_admission
+
+# Attempts per LLM call, across endpoints (a single endpoint is retried)
+ROUTER_MAX_ATTEMPTS = 3
+# Pause before re-trying an endpoint that already failed for this call
+ROUTER_RETRY_DELAY = 2.0
+# Threads opening streams for the sync path. Only calls that already hold an
+# admission permit are submitted, so queued low-priority calls never occupy them.
+_HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=max(8, settings.LLM_MAX_CONCURRENT), thread_name_prefix="liteclaw-llm")
+
+_END = object()
+# How often a cancellable wait re-checks its token
+_CANCEL_POLL_SECONDS = 0.2
+
+
+class LLMEndpoint:
+    """
+    One provider/model/base_url/API key with its health: time to first chunk, recent
+    outcomes and a circuit breaker. After LLM_CIRCUIT_FAILURES consecutive
+    failures the circuit opens and the endpoint is skipped for
+    LLM_CIRCUIT_COOLDOWN seconds; after that the next call decides whether it closes.
+    """
+
+    def __init__(self, provider: str, model: str, api_key: Optional[str], base_url: Optional[str], weight: float = 1.0):
+        self.provider = provider
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+        self.weight = weight
+        self.full_model_name = get_full_model_name(provider, model, base_url)
+        self.name = f"{provider}:{model}"
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=METRIC_SAMPLES) # Seconds to first chunk
+        self._outcomes = deque(maxlen=METRIC_SAMPLES) # True = success
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+
+    def completion_kwargs(self) -> Dict[str, Any]:
+        return {"model": self.full_model_name, "api_key": self.api_key, "base_url": self.base_url}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now: float) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if now - self._opened_at >= settings.LLM_CIRCUIT_COOLDOWN:
+            return "half-open"
+        return "open"
+
+    def available(self) -> bool:
+        """Whether calls may go here now. A half-open circuit closes on the next success and re-opens on a failure."""
+        return self.state != "open"
+
+    def p50(self) -> Optional[float]:
+        with self._lock:
+            return summarize(self._latencies)["p50"] if self._latencies else None
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.requests += 1
+            self._latencies.append(latency)
+            self._outcomes.append(True)
+            self._consecutive_failures = 0
+            if self._opened_at is not None:
+                self._opened_at = None
+                print(f"[Router] ✅ {self.name} recovered; circuit closed.")
+
+    def record_failure(self, error: BaseException):
+        with self._lock:
+            self.requests += 1
+            self.failures += 1
+            self._outcomes.append(False)
+            # A malformed request or a rate limit says nothing about the endpoint's health
+            if isinstance(error, (litellm.BadRequestError, litellm.RateLimitError)):
+                return
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= settings.LLM_CIRCUIT_FAILURES:
+                if self._opened_at is None:
+                    print(f"[Router] ⛔ {self.name} failed {self._consecutive_failures} times in a row; circuit open for {settings.LLM_CIRCUIT_COOLDOWN:g}s.")
+                self._opened_at = time.monotonic()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            outcomes = list(self._outcomes)
+            return {
+                "state": self._state(time.monotonic()),
+                "weight": self.weight,
+                "requests": self.requests,
+                "failures": self.failures,
+                "error_rate": round(outcomes.count(False) / len(outcomes), 3) if outcomes else 0.0,
+                "first_chunk_seconds": summarize(self._latencies),
+            }
+
+
+# Shared by every router, so all agents see the same health per endpoint
+_endpoints: Dict[Tuple[str, str, Optional[str], str], LLMEndpoint] = {}
+_endpoints_lock = threading.Lock()
+_routing = {"failovers": 0, "hedges": 0, "hedge_wins": 0, "last_endpoint": None}
+
+
+def _key_fingerprint(api_key: Optional[str]) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()[:8] if api_key else ""
+
+
+def get_endpoint(provider: str, model: str, api_key: Optional[str] = None, base_url: Optional[str] = None, weight: float = 1.0) -> LLMEndpoint:
+    """
+    The shared endpoint for a provider/model/base_url and API key. Each key gets
+    its own endpoint (circuit breaker, admission buckets), so a second key of
+    the same model is a real failover; it is named "provider:model#<key hash>".
+    """
+    fingerprint = _key_fingerprint(api_key)
+    key = (provider, model, base_url, fingerprint)
+    with _endpoints_lock:
+        endpoint = _endpoints.get(key)
+        if endpoint is None:
+            endpoint = LLMEndpoint(provider, model, api_key, base_url, weight)
+            if any(e.name == endpoint.name for e in _endpoints.values()):
+                endpoint.name += f"#{fingerprint or 'nokey'}"
+            _endpoints[key] = endpoint
+        return endpoint
+
+
+class LLMRouter:
+    """
+    Picks the endpoint for each streamed LLM call and fails over between them.
+
+    Endpoints are ordered by LLM_ROUTING: "ordered" (as configured), "weighted"
+    (random, proportional to weight) or "latency" (fastest p50 time to first
+    chunk first). Endpoints with an open circuit are skipped. Failover happens
+    only before the first chunk arrives, so a step's text and tool calls always
+    come from one model. With LLM_HEDGE_AFTER set, a call that has not produced
+    a first chunk by then is raced against the next endpoint and the loser is
+    closed. Every attempt first waits for admission (see ratelimit.py) under
+    the router's priority class; all attempts of one call share its deadline.
+    """
+
+    def __init__(self, endpoints: List[LLMEndpoint], priority: str = "interactive"):
+        self.endpoints = endpoints
+        self.primary = endpoints[0]
+        self.priority = priority
+
+    def _plan(self) -> List[LLMEndpoint]:
+        mode = settings.LLM_ROUTING
+        endpoints = list(self.endpoints)
+        if mode == "weighted":
+            # Weighted shuffle: a higher weight tends to come first
+            endpoints.sort(key=lambda e: random.random() ** (1.0 / max(e.weight, 1e-6)), reverse=True)
+        elif mode == "latency":
+            # Unmeasured endpoints first, so each gets measured
+            endpoints.sort(key=lambda e: e.p50() or 0.0)
+
+        usable = [e for e in endpoints if e.available()]
+        if not usable:
+            # Every circuit is open: try the configured order anyway rather than fail outright
+            usable = endpoints
+        plan = list(usable)
+        while len(plan) < ROUTER_MAX_ATTEMPTS:
+            plan.append(usable[len(plan) % len(usable)])
+        return plan
+
+    def _hedge_delay(self, plan: List[LLMEndpoint], index: int, racing) -> Optional[float]:
+        # The plan repeats endpoints for retries; never race an endpoint against itself
+        if settings.LLM_HEDGE_AFTER > 0 and index < len(plan) and plan[index] not in racing:
+            return settings.LLM_HEDGE_AFTER
+        return None
+
+    def _admission(self, request: Dict[str, Any]) -> Tuple[float, float]:
+        """(estimated prompt tokens, deadline) for one call."""
+        tokens = sum(estimate_tokens(m) for m in request.get("messages", []))
+        timeout = settings.LLM_QUEUE_TIMEOUTS.get(self.priority, settings.LLM_QUEUE_TIMEOUTS.get("background", 300))
+        return tokens, time.monotonic() + timeout
+
+    def _failed(self, endpoint: LLMEndpoint, error: BaseException):
+        endpoint.record_failure(error)
+        if isinstance(error, litellm.RateLimitError):
+            llm_admission.throttle(endpoint.name, _retry_after(error))
+
+    def _won(self, endpoint: LLMEndpoint, hedged: bool):
+        if endpoint is not self.primary:
+            _routing["failovers"] += 1
+        if hedged:
+            _routing["hedge_wins"] += 1
+        if _routing["last_endpoint"] != endpoint.name:
+            print(f"[Router] Routing to {endpoint.name}.")
+        _routing["last_endpoint"] = endpoint.name
+
+    # --- Event loop ---
+
+    async def aopen(self, request: Dict[str, Any]) -> AsyncGenerator[Tuple[str, Any], None]:
+        """
+        Open a streamed completion. Yields ("notice", line) for failovers and
+        hedges, then ("stream", async iterator of chunks). Raises the last error
+        if every attempt failed.
+        """
+        plan = self._plan()
+        tokens, deadline = self._admission(request)
+        index = 0
+        pending: Dict[asyncio.Task, LLMEndpoint] = {}
+        tried = set()
+        error: Optional[BaseException] = None
+        hedges = set()
+        try:
+            while True:
+                if not pending:
+                    if index >= len(plan):
+                        raise error
+                    endpoint = plan[index]
+                    if endpoint.name in tried:
+                        await asyncio.sleep(ROUTER_RETRY_DELAY)
+                    tried.add(endpoint.name)
+                    pending[asyncio.ensure_future(self._afirst_chunk(endpoint, request, tokens, deadline))] = endpoint
+                    index += 1
+
+                done, _ = await asyncio.wait(pending, timeout=self._hedge_delay(plan, index, pending.values()), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slow to start: race the next endpoint
+                    nxt = plan[index]
+                    _routing["hedges"] += 1
+                    yield "notice", f">>> [Router]: No response from {', '.join(e.name for e in pending.values())} after {settings.LLM_HEDGE_AFTER:g}s; also trying {nxt.name}.\n"
+                    tried.add(nxt.name)
+                    task = asyncio.ensure_future(self._afirst_chunk(nxt, request, tokens, deadline))
+                    pending[task] = nxt
+                    hedges.add(task)
+                    index += 1
+                    continue
+
+                for task in done:
+                    endpoint = pending.pop(task)
+                    try:
+                        response, first, permit = task.result()
+                    except Exception as e:
+                        error = e
+                        yield "notice", f">>> [System]: {endpoint.name} failed ({e}).{' Failing over...' if index < len(plan) or pending else ''}\n"
+                        continue
+                    self._won(endpoint, task in hedges)
+                    yield "stream", self._achain(endpoint, response, first, permit)
+                    return
+        finally:
+            for task in pending:
+                if task.done():
+                    # Finished in the same round as the winner: cancel() would be a no-op
+                    await _aclose_lost_stream(task)
+                else:
+                    task.cancel()
+
+    async def _afirst_chunk(self, endpoint: LLMEndpoint, request: Dict[str, Any], tokens: float, deadline: float):
+        permit = await llm_admission.aacquire(endpoint.name, self.priority, tokens, max(0.0, deadline - time.monotonic()))
+        started = time.monotonic()
+        response = None
+        try:
+            response = await litellm.acompletion(**request, **endpoint.completion_kwargs())
+            first = await response.__aiter__().__anext__()
+        except StopAsyncIteration:
+            first = _END
+        except asyncio.CancelledError:
+            # Lost a hedge race
+            permit.release()
+            if response is not None and hasattr(response, "aclose"):
+                await response.aclose()
+            raise
+        except Exception as e:
+            permit.release()
+            self._failed(endpoint, e)
+            raise
+        endpoint.record_success(time.monotonic() - started)
+        return response, first, permit
+
+    async def _achain(self, endpoint: LLMEndpoint, response, first, permit: LLMPermit) -> AsyncIterator:
+        used = None
+        try:
+            if first is not _END:
+                yield first
+                used = _usage_tokens(first, used)
+                async for chunk in response:
+                    used = _usage_tokens(chunk, used)
+                    yield chunk
+        except Exception as e:
+            self._failed(endpoint, e)
+            raise
+        finally:
+            permit.release(used)
+            if hasattr(response, "aclose"):
+                await response.aclose()
+
+    # --- Worker threads ---
+
+    def open(self, request: Dict[str, Any], cancel: Optional[CancelToken] = None) -> Generator[str, None, Iterator]:
+        """
+        Sync counterpart of aopen: yields notice lines, returns the chunk iterator.
+        A `cancel` token stops waiting for a first chunk and closes the stream when cancelled.
+        """
+        plan = self._plan()
+        tokens, deadline = self._admission(request)
+        index = 0
+        pending = {}
+        tried = set()
+        error: Optional[BaseException] = None
+        hedges = set()
+        try:
+            while True:
+                if not pending:
+                    if index >= len(plan):
+                        raise error
+                    endpoint = plan[index]
+                    if endpoint.name in tried:
+                        _sleep(ROUTER_RETRY_DELAY, cancel)
+                    tried.add(endpoint.name)
+                    # Queue for admission on this thread, so the priority queue orders it
+                    try:
+                        permit = llm_admission.acquire(endpoint.name, self.priority, tokens, max(0.0, deadline - time.monotonic()), cancel)
+                    except AdmissionTimeout as e:
+                        error = e
+                        index += 1
+                        yield f">>> [System]: {endpoint.name} failed ({e}).{' Failing over...' if index < len(plan) else ''}\n"
+                        continue
+                    pending[_HEDGE_EXECUTOR.submit(self._first_chunk, endpoint, request, permit, cancel)] = endpoint
+                    index += 1
+
+                done = _wait_first(pending, self._hedge_delay(plan, index, pending.values()), cancel)
+                if not done:
+                    nxt = plan[index]
+                    # A hedge only starts if it is admitted right away; otherwise keep waiting
+                    permit = llm_admission.try_acquire(nxt.name, self.priority, tokens)
+                    if permit is None:
+                        continue
+                    _routing["hedges"] += 1
+                    yield f">>> [Router]: No response from {', '.join(e.name for e in pending.values())} after {settings.LLM_HEDGE_AFTER:g}s; also trying {nxt.name}.\n"
+                    tried.add(nxt.name)
+                    future = _HEDGE_EXECUTOR.submit(self._first_chunk, nxt, request, permit, cancel)
+                    pending[future] = nxt
+                    hedges.add(future)
+                    index += 1
+                    continue
+
+                for future in done:
+                    endpoint = pending.pop(future)
+                    try:
+                        response, first, permit = future.result()
+                    except TurnCancelled:
+                        raise
+                    except Exception as e:
+                        error = e
+                        yield f">>> [System]: {endpoint.name} failed ({e}).{' Failing over...' if index < len(plan) or pending else ''}\n"
+                        continue
+                    self._won(endpoint, future in hedges)
+                    return self._chain(endpoint, response, first, permit, cancel)
+        finally:
+            # Hedge losers: close their streams once they open
+            for future in pending:
+                future.add_done_callback(_close_lost_stream)
+
+    def _first_chunk(self, endpoint: LLMEndpoint, request: Dict[str, Any], permit: LLMPermit, cancel: Optional[CancelToken] = None):
+        if cancel and cancel.cancelled:
+            # Admitted after the run was cancelled: do not start the call
+            permit.release(0)
+            raise TurnCancelled(cancel.reason)
+        started = time.monotonic()
+        try:
+            response = litellm.completion(**request, **endpoint.completion_kwargs())
+            first = next(iter(response), _END)
+        except Exception as e:
+            permit.release()
+            self._failed(endpoint, e)
+            raise
+        endpoint.record_success(time.monotonic() - started)
+        return response, first, permit
+
+    def _chain(self, endpoint: LLMEndpoint, response, first, permit: LLMPermit, cancel: Optional[CancelToken] = None) -> Iterator:
+        used = None
+        # Cancelling closes the connection, which ends a read blocked on the provider
+        unregister = cancel.on_cancel(lambda: _close_stream(response)) if cancel else None
+        try:
+            if first is not _END:
+                yield first
+                used = _usage_tokens(first, used)
+                for chunk in response:
+                    used = _usage_tokens(chunk, used)
+                    yield chunk
+        except Exception as e:
+            if not (cancel and cancel.cancelled):
+                self._failed(endpoint, e)
+            raise
+        finally:
+            if unregister:
+                unregister()
+            permit.release(used)
+
+
+def _usage_tokens(chunk, used: Optional[float]) -> Optional[float]:
+    usage = getattr(chunk, "usage", None)
+    total = getattr(usage, "total_tokens", None) if usage else None
+    return total if total else used
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Seconds from the Retry-After header of a 429, if the provider sent one."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "litellm_response_headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _wait_first(pending, timeout: Optional[float], cancel: Optional[CancelToken]):
+    """concurrent.futures.wait(FIRST_COMPLETED) that gives up as soon as `cancel` is cancelled."""
+    if not cancel:
+        return wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)[0]
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        cancel.raise_if_cancelled()
+        step = _CANCEL_POLL_SECONDS if deadline is None else min(_CANCEL_POLL_SECONDS, max(0.0, deadline - time.monotonic()))
+        done, _ = wait(pending, timeout=step, return_when=FIRST_COMPLETED)
+        if done or (deadline is not None and time.monotonic() >= deadline):
+            return done
+
+
+def _sleep(seconds: float, cancel: Optional[CancelToken]):
+    if cancel:
+        if cancel.wait(seconds):
+            raise TurnCancelled(cancel.reason)
+    else:
+        time.sleep(seconds)
+
+
+def _close_stream(response):
+    """Close a sync litellm stream (the wrapper itself has no close; its provider stream does)."""
+    for target in (response, getattr(response, "completion_stream", None)):
+        close = getattr(target, "close", None)
+        if close:
+            try:
+                close()
+            except Exception:
+                pass
+            return
+
+
+def _close_lost_stream(future):
+    try:
+        response, _, permit = future.result()
+    except Exception:
+        return
+    permit.release()
+    _close_stream(response)
+
+
+async def _aclose_lost_stream(task: asyncio.Task):
+    if task.cancelled() or task.exception() is not None:
+        return
+    response, _, permit = task.result()
+    permit.release()
+    if hasattr(response, "aclose"):
+        try:
+            await response.aclose()
+        except Exception:
+            pass
+
+
+def create_router(provider: str, model: str, api_key: Optional[str], base_url: Optional[str], priority: str = "interactive", fallback_model: Optional[str] = None) -> LLMRouter:
+    """Router with the given model first, then `fallback_model` (same provider), then LLM_FALLBACKS."""
+    endpoints = [get_endpoint(provider, model, api_key, base_url)]
+    if fallback_model and fallback_model != model:
+        endpoints.append(get_endpoint(provider, fallback_model, api_key, base_url))
+    for fallback in settings.LLM_FALLBACKS:
+        endpoint = get_endpoint(
+            fallback.get("provider", provider),
+            fallback["model"],
+            fallback.get("api_key", api_key),
+            fallback.get("base_url"),
+            float(fallback.get("weight", 1.0)),
+        )
+        if endpoint not in endpoints:
+            endpoints.append(endpoint)
+    return LLMRouter(endpoints, priority)
+
+
+def metrics() -> Dict[str, Any]:
+    """Routing decisions and the health of every endpoint."""
+    with _endpoints_lock:
+        endpoints = list(_endpoints.values())
+    return {
+        "routing": settings.LLM_ROUTING,
+        **_routing,
+        "endpoints": {e.name: e.metrics() for e in endpoints},
+    }
@@ -5,53 +5,56 @@ import json
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
-from .db import get_db_connection
-from .agent import process_message  # Helper function from agent.py
-from fastapi.concurrency import run_in_threadpool
-
-WHATSAPP_BRIDGE_URL = "http://localhost:3040"
+from .db import get_db_connection, transaction
+from .agent import LiteClawAgent
+from .outbox import outbox
 
 scheduler = AsyncIOScheduler()
+# Jobs run on the background model profile, keeping the main model free for chats
+background_agent = LiteClawAgent(profile="background")
+# Runs jobs flagged cacheable: a repeated prompt is answered from the LLM cache
+cached_agent = LiteClawAgent(cache=True, profile="background")
+
+def _mark_job_run(job_id: str):
+    with transaction() as c:
+        c.execute("UPDATE cron_jobs SET last_run = ? WHERE id = ?", (datetime.datetime.now(), job_id))
 
-async def run_cron_job(job_id: str, task_prompt: str):
+async def run_cron_job(job_id: str, task_prompt: str, cacheable: bool = False):
     """The function that actually runs the agent for a job."""
     print(f"[Cron] ⏳ Starting job {job_id}: {task_prompt[:50]}...")
     
-    # Update last_run in DB
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("UPDATE cron_jobs SET last_run = ? WHERE id = ?", (datetime.datetime.now(), job_id))
-    conn.commit()
-    conn.close()
+    # Update last_run in DB (off the event loop: the write may wait on the SQLite lock)
+    await asyncio.to_thread(_mark_job_run, job_id)
 
     try:
         # Create a FRESH, UNIQUE session for every run.
         # This keeps the cron context clean and prevents infinite history loops.
         session_id = f"cron_{job_id}_{str(uuid.uuid4())[:8]}"
         
-        # We need to run the agent. process_message is synchronous in agent.py but we are in async context.
         # We also need to capture output to send somewhere? For now, just print/log.
         # Ideally, we should notify the user via WhatsApp bridge if configured.
         
-        # NOTE: The agent.py process_message returns a string final result.
-        # We pass it to run_in_threadpool
-        response = await run_in_threadpool(process_message, task_prompt, session_id=session_id)
+        # NOTE: aprocess_message runs on the scheduler's event loop and returns the final text.
+        if cacheable:
+            response = await cached_agent.aprocess_message(task_prompt, session_id=session_id)
+        else:
+            response = await background_agent.aprocess_message(task_prompt, session_id=session_id)
         
         print(f"[Cron] ✅ Job {job_id} Completed:\n{response[:100]}...")
         
         # Notify via WhatsApp if possible (Primitive approach for now)
         # We default to notifying the allowed number if set
         from .config import settings
-        import httpx
         
         target_number = settings.WHATSAPP_ALLOWED_NUMBERS[0] if settings.WHATSAPP_ALLOWED_NUMBERS else None
         
         if target_number:
-            async with httpx.AsyncClient() as client:
-                await client.post(f"{WHATSAPP_BRIDGE_URL}/whatsapp/send", json={
-                    "to": f"{target_number}@c.us", # Formatting might vary
-                    "message": f"⏰ [Cron Job Report]: {task_prompt}\n\n{response}"
-                })
+            await asyncio.to_thread(
+                outbox.send_text,
+                f"{target_number}@c.us", # Formatting might vary
+                f"⏰ [Cron Job Report]: {task_prompt}\n\n{response}",
+                dedupe_key=f"cron:{job_id}:{session_id}"
+            )
 
     except Exception as e:
         print(f"[Cron] ❌ Job {job_id} Failed: {e}")
@@ -64,9 +67,7 @@ class CronManager:
 
     def load_jobs(self):
         """Load active jobs from DB and add to scheduler."""
-        conn = get_db_connection()
-        jobs = conn.execute("SELECT * FROM cron_jobs WHERE is_active = 1").fetchall()
-        conn.close()
+        jobs = get_db_connection().execute("SELECT * FROM cron_jobs WHERE is_active = 1").fetchall()
         
         for job in jobs:
             self.schedule_job_in_scheduler(job)
@@ -95,7 +96,7 @@ class CronManager:
                 scheduler.add_job(
                     run_cron_job, 
                     trigger, 
-                    args=[job['id'], job['task']], 
+                    args=[job['id'], job['task'], bool(job['cacheable'])], 
                     id=job['id'],
                     replace_existing=True
                 )
@@ -103,33 +104,30 @@ class CronManager:
         except Exception as e:
             print(f"[CronManager] Failed to schedule job {job['id']}: {e}")
 
-    def create_job(self, name: str, schedule_type: str, schedule_value: str, task: str):
+    def create_job(self, name: str, schedule_type: str, schedule_value: str, task: str, cacheable: bool = False):
         job_id = str(uuid.uuid4())[:8]
-        conn = get_db_connection()
-        conn.execute(
-            "INSERT INTO cron_jobs (id, name, schedule_type, schedule_value, task, is_active) VALUES (?, ?, ?, ?, ?, ?)",
-            (job_id, name, schedule_type, schedule_value, task, 1)
-        )
-        conn.commit()
+        with transaction() as c:
+            c.execute(
+                "INSERT INTO cron_jobs (id, name, schedule_type, schedule_value, task, is_active, cacheable) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, name, schedule_type, schedule_value, task, 1, 1 if cacheable else 0)
+            )
         
         # Fetch back to schedule
-        job = conn.execute("SELECT * FROM cron_jobs WHERE id = ?", (job_id,)).fetchone()
-        conn.close()
+        job = get_db_connection().execute("SELECT * FROM cron_jobs WHERE id = ?", (job_id,)).fetchone()
         
         self.schedule_job_in_scheduler(job)
         return job_id
 
     def list_jobs(self):
-        conn = get_db_connection()
-        jobs = conn.execute("SELECT * FROM cron_jobs").fetchall()
-        conn.close()
+        jobs = get_db_connection().execute("SELECT * FROM cron_jobs").fetchall()
         return [dict(j) for j in jobs]
     
+    def _get_job(self, job_id: str):
+        return get_db_connection().execute("SELECT * FROM cron_jobs WHERE id = ?", (job_id,)).fetchone()
+
     def delete_job(self, job_id: str):
-        conn = get_db_connection()
-        conn.execute("DELETE FROM cron_jobs WHERE id = ?", (job_id,))
-        conn.commit()
-        conn.close()
+        with transaction() as c:
+            c.execute("DELETE FROM cron_jobs WHERE id = ?", (job_id,))
         try:
             scheduler.remove_job(job_id)
         except:
@@ -137,13 +135,11 @@ class CronManager:
             
     async def trigger_job(self, job_id: str):
         """Manually trigger a job (webhook)."""
-        conn = get_db_connection()
-        job = conn.execute("SELECT * FROM cron_jobs WHERE id = ?", (job_id,)).fetchone()
-        conn.close()
+        job = await asyncio.to_thread(self._get_job, job_id)
         
         if job:
             # Run immediately in background
-            asyncio.create_task(run_cron_job(job['id'], job['task']))
+            asyncio.create_task(run_cron_job(job['id'], job['task'], bool(job['cacheable'])))
             return True
         return False
 
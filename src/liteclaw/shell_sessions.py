@@ -0,0 +1,271 @@
+import os
+import platform
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Generator, Optional
+
+from .config import settings
+from .tools import COMMAND_QUEUE_CHUNKS, CommandOutput, _kill_tree, _read_stream
+
+# Seconds between sweeps for idle shells
+SHELL_REAP_INTERVAL = 60
+
+
+class _Framing:
+    """
+    Splits one command's output off a shell's stream at the end marker the
+    frame prints after it. Only a tail that could be the start of the marker
+    is held back, so output reaches progress updates as soon as it arrives.
+    """
+
+    def __init__(self, marker: str):
+        self.marker = marker
+        self.done = False
+        self._pending = ""
+
+    def feed(self, text: str) -> str:
+        """The part of `text` that belongs to the command's output."""
+        self._pending += text
+        index = self._pending.find(self.marker)
+        if index >= 0:
+            if "\n" not in self._pending[index:]:
+                return "" # Rest of the marker line still to come
+            output = self._pending[:index]
+            self._pending = ""
+            self.done = True
+            return output
+        held = 0
+        for size in range(min(len(self._pending), len(self.marker) - 1), 0, -1):
+            if self.marker.startswith(self._pending[-size:]):
+                held = size
+                break
+        output = self._pending[:len(self._pending) - held]
+        self._pending = self._pending[len(self._pending) - held:]
+        return output
+
+
+class ShellSession:
+    """
+    One long-lived shell (bash/sh, or PowerShell on Windows) that runs an agent
+    session's commands one after another, so `cd`, exported variables and an
+    activated virtualenv carry over between calls.
+
+    Each command is written to a script file and dot-sourced, with its stdin
+    from /dev/null (a command cannot swallow the frame, a syntax error cannot
+    desync the shell). The frame then prints an end marker, new for every
+    command, on stdout and stderr; output up to the markers is the command's.
+    A command whose markers were not both seen leaves the shell closed, so
+    its late output can never be read as the next command's.
+    """
+
+    def __init__(self, key: str, cwd: str):
+        self.key = key
+        self.busy = False
+        self.last_used = time.monotonic()
+        self._dir = tempfile.mkdtemp(prefix="liteclaw-shell-")
+        self._chunks: "queue.Queue" = queue.Queue(maxsize=COMMAND_QUEUE_CHUNKS)
+
+        if platform.system() == "Windows":
+            self._script = os.path.join(self._dir, "command.ps1")
+            args = ["powershell", "-NoLogo", "-NoProfile", "-NonInteractive", "-ExecutionPolicy", "Bypass", "-Command", "-"]
+            self._frame = (
+                f"try {{ . '{self._script}' }} finally {{ "
+                "[Console]::Out.Write(\"{marker}`n\"); [Console]::Out.Flush(); "
+                "[Console]::Error.Write(\"{marker}`n\"); [Console]::Error.Flush() }\n"
+            )
+            kwargs: Dict[str, Any] = {}
+        else:
+            self._script = os.path.join(self._dir, "command.sh")
+            bash = shutil.which("bash")
+            args = [bash, "--noprofile", "--norc"] if bash else ["/bin/sh"]
+            self._frame = (
+                f". '{self._script}' < /dev/null\n"
+                "printf '%s\\n' '{marker}'\n"
+                "printf '%s\\n' '{marker}' >&2\n"
+            )
+            kwargs = {"start_new_session": True} # Own process group, so _kill_tree reaches the children
+        self._proc = subprocess.Popen(
+            args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, **kwargs
+        )
+        for name, pipe in (("stdout", self._proc.stdout), ("stderr", self._proc.stderr)):
+            threading.Thread(target=_read_stream, args=(pipe, name, self._chunks), name=f"liteclaw-shell-{name}", daemon=True).start()
+
+    @property
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def run(self, command: str, timeout: float, cancel=None) -> Generator[str, None, str]:
+        """Run one command, yielding progress lines. A timeout or cancel closes the shell."""
+        with open(self._script, "w", encoding="utf-8") as f:
+            f.write(command + "\n")
+        marker = f"__LITECLAW_DONE_{uuid.uuid4().hex}__"
+        self._proc.stdin.write(self._frame.replace("{marker}", marker).encode())
+        self._proc.stdin.flush()
+
+        output = CommandOutput()
+        framing = {"stdout": _Framing(marker), "stderr": _Framing(marker)}
+        unregister = cancel.on_cancel(self.close) if cancel else None
+        deadline = time.monotonic() + timeout
+        timed_out = ended = False
+        try:
+            while not all(f.done for f in framing.values()):
+                if cancel:
+                    cancel.raise_if_cancelled()
+                if time.monotonic() >= deadline:
+                    timed_out = True
+                    self.close()
+                    break
+                try:
+                    name, text = self._chunks.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                if text is None:
+                    ended = True # The command ended the shell (`exit`) or it was killed
+                    break
+                if not framing[name].done:
+                    output.write(name, framing[name].feed(text))
+                yield from output.progress()
+        finally:
+            if unregister:
+                unregister()
+            if not all(f.done for f in framing.values()):
+                # Timed out, cancelled, or the caller stopped consuming: the
+                # command may still be running and writing into this shell
+                self.close()
+        if cancel:
+            cancel.raise_if_cancelled()
+
+        result = output.getvalue()
+        if timed_out:
+            result += f"\n[Command timed out after {timeout:g}s; it and its shell session were killed. The next command starts a fresh shell.]"
+        elif ended:
+            result += "\n[The shell session ended. The next command starts a fresh shell.]"
+        return result
+
+    def close(self):
+        _kill_tree(self._proc)
+        try:
+            self._proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+
+class ShellPool:
+    """
+    Persistent shells keyed by agent session (see ShellSession). A session
+    reuses its shell across execute_command calls, so the hot loop of a
+    multi-step task no longer pays for process spawn and shell startup. Shells
+    idle for SHELL_SESSION_IDLE_TIMEOUT are closed, and at most
+    SHELL_SESSION_MAX are kept (least recently used idle ones go first).
+    When none is available, or the session's shell is busy, run() returns None
+    and the caller starts a one-off process instead.
+    """
+
+    def __init__(self):
+        self._sessions: "OrderedDict[str, ShellSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._started = 0
+        self._reused = 0
+        self._evicted = 0
+        self._fallbacks = 0
+
+    def _acquire(self, key: str, cwd: str) -> Optional[ShellSession]:
+        with self._lock:
+            self._reap(time.monotonic())
+            session = self._sessions.get(key)
+            if session and not session.alive:
+                self._discard(key)
+                session = None
+            if session:
+                if session.busy:
+                    self._fallbacks += 1
+                    return None
+                self._reused += 1
+            else:
+                if len(self._sessions) >= settings.SHELL_SESSION_MAX and not self._evict_one():
+                    self._fallbacks += 1
+                    return None
+                session = ShellSession(key, cwd)
+                self._sessions[key] = session
+                self._started += 1
+                self._start_reaper()
+            session.busy = True
+            self._sessions.move_to_end(key)
+            return session
+
+    def _release(self, session: ShellSession):
+        with self._lock:
+            session.busy = False
+            session.last_used = time.monotonic()
+            if (self._stop.is_set() or not session.alive) and self._sessions.get(session.key) is session:
+                self._discard(session.key)
+
+    def run(self, key: str, command: str, timeout: float, cwd: str, cancel=None) -> Generator[str, None, Optional[str]]:
+        """Run `command` in the shell of `key`. Returns its output, or None if no shell was free."""
+        session = self._acquire(key, cwd)
+        if session is None:
+            return None
+        try:
+            return (yield from session.run(command, timeout, cancel))
+        finally:
+            self._release(session)
+
+    def _discard(self, key: str):
+        session = self._sessions.pop(key)
+        session.close()
+
+    def _evict_one(self) -> bool:
+        for key, session in self._sessions.items():
+            if not session.busy:
+                self._discard(key)
+                self._evicted += 1
+                return True
+        return False
+
+    def _reap(self, now: float):
+        for key, session in list(self._sessions.items()):
+            if not session.busy and (not session.alive or now - session.last_used > settings.SHELL_SESSION_IDLE_TIMEOUT):
+                self._discard(key)
+                self._evicted += 1
+
+    def _start_reaper(self):
+        if self._reaper and self._reaper.is_alive():
+            return
+        self._reaper = threading.Thread(target=self._reap_loop, name="liteclaw-shell-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap_loop(self):
+        while not self._stop.wait(SHELL_REAP_INTERVAL):
+            with self._lock:
+                self._reap(time.monotonic())
+
+    def close_all(self):
+        """Close every idle shell (at shutdown); busy ones close when their command returns."""
+        self._stop.set()
+        with self._lock:
+            for key, session in list(self._sessions.items()):
+                if not session.busy:
+                    self._discard(key)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "busy": sum(1 for s in self._sessions.values() if s.busy),
+                "started": self._started,
+                "reused": self._reused,
+                "evicted": self._evicted,
+                "fallbacks": self._fallbacks,
+            }
+
+
+shell_pool = ShellPool()
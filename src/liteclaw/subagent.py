@@ -1,42 +1,216 @@
 import threading
 import uuid
 import time
-import httpx
-import asyncio
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 from .agent import LiteClawAgent
+from .cancel import CancelToken, TurnCancelled
+from .config import settings
+from .db import get_db_connection, transaction
+from .memory import add_message, create_session
+from .outbox import outbox
+
+# Statuses of an agent whose task has not finished yet
+ACTIVE_STATUSES = ("queued", "working")
+# Sub-agent tasks run here; beyond SUBAGENT_MAX_CONCURRENT they wait their turn
+SUBAGENT_EXECUTOR = ThreadPoolExecutor(max_workers=settings.SUBAGENT_MAX_CONCURRENT, thread_name_prefix="liteclaw-subagent")
+
+
+class SubAgentStore:
+    """
+    Sub-agent state in SQLite: `sub_agents` (one row per agent), `sub_agent_tasks`
+    (task history) and `sub_agent_inbox` (messages sent to an agent). Survives
+    restarts; every status query is an indexed lookup.
+    """
+
+    def get(self, session_id: str, name: str) -> Optional[Dict[str, Any]]:
+        row = get_db_connection().execute(
+            "SELECT * FROM sub_agents WHERE session_id = ? AND name = ?", (session_id, name)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def create(self, sub_agent_id: str, session_id: str, name: str, platform: str):
+        now = time.time()
+        with transaction() as c:
+            c.execute(
+                "INSERT INTO sub_agents (id, session_id, name, platform, status, created_at, updated_at) VALUES (?, ?, ?, ?, 'idle', ?, ?)",
+                (sub_agent_id, session_id, name, platform, now, now)
+            )
+
+    def update(self, sub_agent_id: str, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{column} = ?" for column in fields)
+        with transaction() as c:
+            c.execute(f"UPDATE sub_agents SET {columns} WHERE id = ?", (*fields.values(), sub_agent_id))
+
+    def count(self, session_id: str) -> int:
+        return get_db_connection().execute(
+            "SELECT COUNT(*) AS n FROM sub_agents WHERE session_id = ?", (session_id,)
+        ).fetchone()["n"]
+
+    def list(self, session_id: str, statuses: Optional[Tuple[str, ...]] = None) -> List[Dict[str, Any]]:
+        sql = "SELECT id, name, status, last_result FROM sub_agents WHERE session_id = ?"
+        params: tuple = (session_id,)
+        if statuses:
+            sql += f" AND status IN ({', '.join('?' for _ in statuses)})"
+            params += tuple(statuses)
+        return [dict(row) for row in get_db_connection().execute(sql + " ORDER BY created_at", params)]
+
+    def any_working(self) -> bool:
+        return get_db_connection().execute(
+            "SELECT 1 FROM sub_agents WHERE status IN ('queued', 'working') LIMIT 1"
+        ).fetchone() is not None
+
+    def start_task(self, sub_agent_id: str, task: str) -> int:
+        """Record a delegated task as queued. Returns its id."""
+        now = time.time()
+        with transaction() as c:
+            c.execute(
+                "INSERT INTO sub_agent_tasks (sub_agent_id, task, status, started_at) VALUES (?, ?, 'queued', ?)",
+                (sub_agent_id, task, now)
+            )
+            task_id = c.lastrowid
+            c.execute("UPDATE sub_agents SET status = 'queued', updated_at = ? WHERE id = ?", (now, sub_agent_id))
+        return task_id
+
+    def begin_task(self, sub_agent_id: str, task_id: int) -> bool:
+        """Move a queued task to working. False if it was terminated while queued."""
+        now = time.time()
+        with transaction() as c:
+            c.execute(
+                "UPDATE sub_agent_tasks SET status = 'working', started_at = ? WHERE id = ? AND status = 'queued'",
+                (now, task_id)
+            )
+            if not c.rowcount:
+                return False
+            c.execute("UPDATE sub_agents SET status = 'working', updated_at = ? WHERE id = ?", (now, sub_agent_id))
+        return True
+
+    def finish_task(self, sub_agent_id: str, task_id: int, status: str, result: Optional[str] = None, error: Optional[str] = None):
+        """Record the outcome of a task. A task already marked terminated keeps that status."""
+        now = time.time()
+        with transaction() as c:
+            c.execute(
+                "UPDATE sub_agent_tasks SET status = ?, result = ?, error = ?, ended_at = ? WHERE id = ? AND status IN ('queued', 'working')",
+                (status, result, error, now, task_id)
+            )
+            if c.rowcount:
+                c.execute(
+                    "UPDATE sub_agents SET status = ?, last_result = ?, updated_at = ? WHERE id = ?",
+                    (status, result if error is None else f"Error: {error}", now, sub_agent_id)
+                )
+
+    def terminate(self, sub_agent_id: str, reason: str):
+        now = time.time()
+        with transaction() as c:
+            c.execute(
+                "UPDATE sub_agent_tasks SET status = 'terminated', error = ?, ended_at = ? WHERE sub_agent_id = ? AND status IN ('queued', 'working')",
+                (reason, now, sub_agent_id)
+            )
+            c.execute(
+                "UPDATE sub_agents SET status = 'terminated', last_result = ?, updated_at = ? WHERE id = ?",
+                (reason, now, sub_agent_id)
+            )
+
+    def task_history(self, sub_agent_id: str, limit: int = 20) -> List[Dict[str, Any]]:
+        rows = get_db_connection().execute(
+            "SELECT task, status, result, error, started_at, ended_at FROM sub_agent_tasks WHERE sub_agent_id = ? ORDER BY id DESC LIMIT ?",
+            (sub_agent_id, limit)
+        ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def add_inbox(self, sub_agent_id: str, sender: str, text: str):
+        with transaction() as c:
+            c.execute(
+                "INSERT INTO sub_agent_inbox (sub_agent_id, sender, text, created_at) VALUES (?, ?, ?, ?)",
+                (sub_agent_id, sender, text, time.time())
+            )
+
+    def recover(self) -> int:
+        """Mark work that was running when the process stopped as interrupted. Returns how many agents."""
+        now = time.time()
+        with transaction() as c:
+            c.execute(
+                "UPDATE sub_agent_tasks SET status = 'interrupted', error = 'Interrupted by a restart.', ended_at = ? WHERE status IN ('queued', 'working')",
+                (now,)
+            )
+            c.execute(
+                "UPDATE sub_agents SET status = 'interrupted', last_result = 'Interrupted by a restart.', updated_at = ? WHERE status IN ('queued', 'working')",
+                (now,)
+            )
+            return c.rowcount
+
+
+store = SubAgentStore()
+
+
+def _compact_result(result: str) -> str:
+    """The end of a sub-agent's reply (where its conclusion is), cut to SUBAGENT_SUMMARY_MAX_CHARS."""
+    result = (result or "").strip()
+    limit = settings.SUBAGENT_SUMMARY_MAX_CHARS
+    if len(result) <= limit:
+        return result
+    return f"...[{len(result) - limit} earlier chars omitted]...\n{result[-limit:]}"
+
+
+# One LLM agent serves every sub-agent; each task passes its own session
+_agent: Optional[LiteClawAgent] = None
+_agent_lock = threading.Lock()
+
+
+def _subagent_llm() -> LiteClawAgent:
+    global _agent
+    with _agent_lock:
+        if _agent is None:
+            _agent = LiteClawAgent(profile="subagent")
+        return _agent
 
-# Platform-specific endpoint mappings
-# NOTE: The bridge uses a SINGLE endpoint (/whatsapp/send) for all platforms
-# and routes based on the "platform" field in the JSON body
-BRIDGE_SEND_ENDPOINT = "/whatsapp/send"
 
 class SubAgent:
-    def __init__(self, sub_agent_id: str, session_id: str, name: str, platform: str = "whatsapp"):
+    def __init__(self, sub_agent_id: str, session_id: str, name: str, platform: str = "whatsapp", status: str = "idle", last_result: Optional[str] = None):
         self.sub_agent_id = sub_agent_id
         self.session_id = session_id # This refers to the main user session
+        self.child_session_id = f"subagent-{sub_agent_id}" # The agent's own history, linked to the parent
         self.name = name
         self.platform = platform  # Track the platform for notifications
-        self.status = "idle"  # idle, working, completed, failed
-        self.last_result = None
-        self.task_history = []
-        self.message_queue = []
-        self._thread = None
-        self._agent = LiteClawAgent()
+        self.status = status  # idle, queued, working, completed, failed, terminated, interrupted
+        self.last_result = last_result
+        self._task_id: Optional[int] = None
+        self._cancel: Optional[CancelToken] = None # Token of the current task
+        self._agent = _subagent_llm()
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "SubAgent":
+        return cls(row["id"], row["session_id"], row["name"], row["platform"], row["status"], row["last_result"])
+
+    @property
+    def task_history(self) -> List[Dict[str, Any]]:
+        return store.task_history(self.sub_agent_id)
 
     def run_task(self, task: str):
-        self.status = "working"
-        self.task_history.append({"task": task, "start_time": time.time()})
+        """Queue the task on SUBAGENT_EXECUTOR. terminate() cancels it, queued or running."""
+        self.status = "queued"
+        self._task_id = store.start_task(self.sub_agent_id, task)
+        task_id = self._task_id
+        cancel = self._cancel = CancelToken()
 
         def _task_wrapper():
+            if cancel.cancelled or not store.begin_task(self.sub_agent_id, task_id):
+                return
+            self.status = "working"
             try:
                 # 1. Execute task
-                # CRITICAL: Use self.session_id (the parent session)
-                # and self.platform so browser questions route correctly
+                # The turn reads and writes the child session only; tools still
+                # message the parent chat (self.session_id, self.platform) so
+                # browser questions and media route correctly
+                create_session(self.child_session_id, parent_session_id=self.session_id)
                 result = self._agent.process_message(
                     f"BACKGROUND TASK: {task}. NOTE: You are the sub-agent '{self.name}'. Work in project root 'd:\\\\openclaw_lite'.",
-                    session_id=self.session_id,  # Use parent session
-                    platform=self.platform  # Use parent platform for correct routing
+                    session_id=self.child_session_id,
+                    platform=self.platform,  # Use parent platform for correct routing
+                    cancel=cancel,
+                    recipient=self.session_id
                 )
                 
                 # Check if we were terminated while working
@@ -46,35 +220,53 @@ class SubAgent:
 
                 self.last_result = result
                 self.status = "completed"
-                self.task_history[-1]["end_time"] = time.time()
-                self.task_history[-1]["result"] = result
+                store.finish_task(self.sub_agent_id, task_id, "completed", result=result)
 
-                # 2. Notify User regarding completion
+                # 2. Report back: a summary in the parent's history, a message to the user
+                self._post_summary(task, _compact_result(result))
                 self._notify_completion(result)
 
+            except TurnCancelled:
+                print(f"[Sub-Agent] '{self.name}' stopped: {cancel.reason}")
             except Exception as e:
+                if self.status == "terminated":
+                    return
                 self.status = "failed"
                 self.last_result = f"Error: {str(e)}"
-                self.task_history[-1]["error"] = str(e)
+                store.finish_task(self.sub_agent_id, task_id, "failed", error=str(e))
+                self._post_summary(task, f"Failed: {str(e)}")
                 self._notify_completion(f"❌ Sub-Agent '{self.name}' failed: {str(e)}")
 
-        self._thread = threading.Thread(target=_task_wrapper)
-        self._thread.start()
+        SUBAGENT_EXECUTOR.submit(_task_wrapper)
 
     def receive_message(self, sender: str, text: str):
         """Receive a message from another agent or session."""
         msg = f"FROM {sender}: {text}"
-        self.message_queue.append({"sender": sender, "text": text, "time": time.time()})
+        store.add_inbox(self.sub_agent_id, sender, text)
         print(f"[Sub-Agent] '{self.name}' received message from {sender}: {text[:50]}...")
         
-        # Inject into agent history if possible
-        from .memory import add_message
-        add_message(f"subagent-{self.sub_agent_id}", {"role": "user", "content": f"[INCOMING MESSAGE] {msg}"})
+        # Inject into the agent's own session; its next turn reads it
+        create_session(self.child_session_id, parent_session_id=self.session_id)
+        add_message(self.child_session_id, {"role": "user", "content": f"[INCOMING MESSAGE] {msg}"})
 
-    async def _notify_completion_async(self, message: str):
-        """Notification bridge back to the main user session via the correct platform."""
-        from .main import WHATSAPP_BRIDGE_URL
+    def terminate(self, reason: str):
+        """Stop the current task: its LLM stream and commands are aborted, a queued task never starts."""
+        self.status = "terminated"
+        self.last_result = reason
+        store.terminate(self.sub_agent_id, reason)
+        if self._cancel:
+            self._cancel.cancel(reason)
 
+    def _post_summary(self, task: str, summary: str):
+        """Add the task outcome to the parent session, the only trace of the task there."""
+        content = f"[Sub-Agent '{self.name}' result] Task: {task[:200]}{'...' if len(task) > 200 else ''}\n{summary}"
+        try:
+            add_message(self.session_id, {"role": "system", "content": content})
+        except Exception as e:
+            print(f"[Sub-Agent] Failed to post summary to {self.session_id}: {e}")
+
+    def _notify_completion(self, message: str):
+        """Notification bridge back to the main user session via the correct platform."""
         # Truncate if too long
         if len(message) > 1500:
             message = message[:1500] + "...[truncated]"
@@ -88,53 +280,63 @@ class SubAgent:
             return
 
         try:
-            # All platforms use the same endpoint - routing is based on "platform" field
-            bridge_url = f"{WHATSAPP_BRIDGE_URL}{BRIDGE_SEND_ENDPOINT}"
-
-            async with httpx.AsyncClient(timeout=15.0) as client:
-                response = await client.post(bridge_url, json={
-                    "to": self.session_id,
-                    "message": f"[LiteClaw] {final_text}",
-                    "platform": self.platform
-                })
-                if response.status_code == 200:
-                    print(f"[Sub-Agent] ✅ Completion notification sent successfully via {self.platform.title()}")
-                else:
-                    print(f"[Sub-Agent] ⚠️ Notification response ({self.platform.title()}): {response.status_code}")
-        except Exception as e:
-            print(f"[Sub-Agent] ❌ Failed to send completion notify via {self.platform.title()}: {e}")
-
-    def _notify_completion(self, message: str):
-        """Run the async notification in a safe way."""
-        try:
-            asyncio.run(self._notify_completion_async(message))
-        except RuntimeError:
-            # If we're already in a loop, create a task (though in a thread this shouldn't happen)
-            loop = asyncio.new_event_loop()
-            loop.run_until_complete(self._notify_completion_async(message))
+            # The outbox retries until the bridge accepts it
+            outbox.send_text(self.session_id, f"[LiteClaw] {final_text}", self.platform)
+            print(f"[Sub-Agent] ✅ Completion notification queued for {self.platform.title()}")
         except Exception as e:
-            print(f"[Sub-Agent] Notify Error: {e}")
+            print(f"[Sub-Agent] ❌ Failed to queue completion notify via {self.platform.title()}: {e}")
 
 class SubAgentManager:
+    """
+    Creates and finds sub-agents. State lives in SubAgentStore; this keeps the
+    live SubAgent objects, evicting idle and finished ones beyond
+    SUBAGENT_CACHE_SIZE (they are rebuilt from their row when needed again).
+    """
+
     def __init__(self, max_per_session: int = 5):
-        self.sessions: Dict[str, List[SubAgent]] = {}
         self.max_per_session = max_per_session
+        self._agents: "OrderedDict[str, SubAgent]" = OrderedDict()
+        self._lock = threading.Lock()
 
-    def get_or_create_sub_agent(self, session_id: str, name: str, platform: str = "whatsapp") -> Optional[SubAgent]:
-        if session_id not in self.sessions:
-            self.sessions[session_id] = []
+    def _cached(self, row: Dict[str, Any]) -> SubAgent:
+        with self._lock:
+            sa = self._agents.get(row["id"])
+            if sa is None:
+                sa = SubAgent.from_row(row)
+                self._agents[row["id"]] = sa
+            self._agents.move_to_end(row["id"])
+            self._evict()
+            return sa
+
+    def _evict(self):
+        surplus = len(self._agents) - settings.SUBAGENT_CACHE_SIZE
+        if surplus <= 0:
+            return
+        for sub_agent_id, sa in list(self._agents.items()):
+            if surplus <= 0:
+                break
+            # Active agents hold a task and must stay reachable for kill/message
+            if sa.status not in ACTIVE_STATUSES:
+                del self._agents[sub_agent_id]
+                surplus -= 1
+
+    def get_sub_agent(self, session_id: str, name: str) -> Optional[SubAgent]:
+        row = store.get(session_id, name)
+        return self._cached(row) if row else None
 
-        for sa in self.sessions[session_id]:
-            if sa.name == name:
+    def get_or_create_sub_agent(self, session_id: str, name: str, platform: str = "whatsapp") -> Optional[SubAgent]:
+        sa = self.get_sub_agent(session_id, name)
+        if sa:
+            if sa.platform != platform:
                 # Update platform in case it changed
                 sa.platform = platform
-                return sa
+                store.update(sa.sub_agent_id, platform=platform)
+            return sa
 
-        if len(self.sessions[session_id]) < self.max_per_session:
+        if store.count(session_id) < self.max_per_session:
             sub_agent_id = str(uuid.uuid4())[:8]
-            new_sa = SubAgent(sub_agent_id, session_id, name, platform=platform)
-            self.sessions[session_id].append(new_sa)
-            return new_sa
+            store.create(sub_agent_id, session_id, name, platform)
+            return self.get_sub_agent(session_id, name)
         return None
 
     def delegate_task(self, session_id: str, sub_agent_name: str, task: str, platform: str = "whatsapp") -> str:
@@ -142,69 +344,60 @@ class SubAgentManager:
         if not sa:
             return f"Error: Maximum of {self.max_per_session} sub-agents reached."
 
-        if sa.status == "working":
+        if sa.status in ACTIVE_STATUSES:
             return f"Error: Sub-agent '{sub_agent_name}' is busy."
 
         sa.run_task(task)
         return f"Task delegated to '{sub_agent_name}'. It will notify you via {platform.title()} when done."
 
     def list_sub_agents(self, session_id: str) -> List[Dict]:
-        if session_id not in self.sessions:
-            return []
-        return [
-            {
-                "name": sa.name,
-                "id": sa.sub_agent_id,
-                "status": sa.status,
-                "last_result": sa.last_result
-            } for sa in self.sessions[session_id]
-        ]
-    
-        return f"Error: Sub-agent '{sub_agent_name}' not found."
+        return store.list(session_id)
+
+    def any_working(self) -> bool:
+        return store.any_working()
+
+    def recover(self):
+        """Called at startup: tasks cut off by the last shutdown are marked interrupted."""
+        interrupted = store.recover()
+        if interrupted:
+            print(f"[Sub-Agent] {interrupted} sub-agent(s) were interrupted by the last shutdown.")
 
     def kill_sub_agent(self, session_id: str, sub_agent_name: str) -> str:
         """Gracefully terminate a sub-agent by name."""
-        if session_id not in self.sessions:
-            return f"Error: No sub-agents found for session {session_id}."
-        
-        for sa in self.sessions[session_id]:
-            if sa.name == sub_agent_name:
-                if sa.status == "working":
-                    sa.status = "terminated"
-                    sa.last_result = "Task was terminated by user request."
-                    
-                    # Kill associated browser session(s)
+        sa = self.get_sub_agent(session_id, sub_agent_name)
+        if sa:
+            if sa.status in ACTIVE_STATUSES:
+                sa.terminate("Task was terminated by user request.")
+                
+                # Kill associated browser session(s)
+                try:
+                    from .browser_utils import kill_browsers_for_session
+                    import asyncio
                     try:
-                        from .browser_utils import kill_browsers_for_session
-                        import asyncio
-                        try:
-                            loop = asyncio.get_event_loop()
-                            if loop.is_running():
-                                # We are in a running loop, create a task (fire and forget)
-                                asyncio.ensure_future(kill_browsers_for_session(session_id))
-                            else:
-                                loop.run_until_complete(kill_browsers_for_session(session_id))
-                        except Exception:
-                            # Fallback if get_event_loop fails or other issues
-                            asyncio.run(kill_browsers_for_session(session_id))
-                            
-                        return f"✅ Sub-agent '{sub_agent_name}' terminated and browser sessions killed."
-                    except Exception as e:
-                        return f"✅ Sub-agent '{sub_agent_name}' terminated, but browser kill failed: {e}"
-                else:
-                    return f"Sub-agent '{sub_agent_name}' is not currently working (status: {sa.status})."
+                        loop = asyncio.get_event_loop()
+                        if loop.is_running():
+                            # We are in a running loop, create a task (fire and forget)
+                            asyncio.ensure_future(kill_browsers_for_session(session_id))
+                        else:
+                            loop.run_until_complete(kill_browsers_for_session(session_id))
+                    except Exception:
+                        # Fallback if get_event_loop fails or other issues
+                        asyncio.run(kill_browsers_for_session(session_id))
+                        
+                    return f"✅ Sub-agent '{sub_agent_name}' terminated and browser sessions killed."
+                except Exception as e:
+                    return f"✅ Sub-agent '{sub_agent_name}' terminated, but browser kill failed: {e}"
+            else:
+                return f"Sub-agent '{sub_agent_name}' is not currently working (status: {sa.status})."
         
         return f"Error: Sub-agent '{sub_agent_name}' not found."
 
     def message_sub_agent(self, session_id: str, sub_agent_name: str, sender: str, text: str) -> str:
         """Send a message to a specific sub-agent."""
-        if session_id not in self.sessions:
-            return f"Error: No sub-agents found for session {session_id}."
-        
-        for sa in self.sessions[session_id]:
-            if sa.name == sub_agent_name:
-                sa.receive_message(sender, text)
-                return f"Message delivered to '{sub_agent_name}'."
+        sa = self.get_sub_agent(session_id, sub_agent_name)
+        if sa:
+            sa.receive_message(sender, text)
+            return f"Message delivered to '{sub_agent_name}'."
         
         # Check if target is 'vision' (special handling)
         if sub_agent_name.lower() == "vision":
@@ -217,14 +410,15 @@ class SubAgentManager:
     
     def kill_all_sub_agents(self, session_id: str) -> str:
         """Terminate all sub-agents for a session."""
-        if session_id not in self.sessions:
-            return "No active sub-agents."
+        working = store.list(session_id, ACTIVE_STATUSES)
+        if not working:
+            return "No working sub-agents found to terminate."
         
         killed = 0
-        for sa in self.sessions[session_id]:
-            if sa.status == "working":
-                sa.status = "terminated"
-                sa.last_result = "Task was terminated by user request."
+        for row in working:
+            sa = self.get_sub_agent(session_id, row["name"])
+            if sa:
+                sa.terminate("Task was terminated by user request.")
                 killed += 1
         
         if killed > 0:
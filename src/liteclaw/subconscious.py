@@ -11,7 +11,7 @@ class SubconsciousInnovator:
     def __init__(self):
         self._running = False
         self._thread = None
-        self._agent = LiteClawAgent()
+        self._agent = LiteClawAgent(profile="background")
         
     def start(self):
         if self._running:
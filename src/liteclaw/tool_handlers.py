@@ -0,0 +1,581 @@
+"""
+Built-in tools. Each handler declares its schema and execution policy with
+@tool and is registered when this module is imported (see tool_registry).
+
+Handlers are generators: they yield `>>> ` progress lines for the stream and
+return the tool output that goes back to the model.
+"""
+import json
+import random
+import threading
+import time
+
+import requests
+
+from . import agent as agent_module
+from .config import settings
+from .jobs import JOB_WAIT_MAX, job_manager
+from .memory import create_session
+from .meta_memory import update_soul_memory, update_personality_memory, update_subconscious_memory, update_learning_memory
+from .outbox import outbox
+from .scheduler import cron_manager
+from .subagent import sub_agent_manager
+from .tool_registry import tool
+from .tools import stream_command, get_system_info
+from .vision_agent import VisionAgent
+from .web_utils import fetch_url_content, download_skill, get_skill_content, list_skills
+
+
+def _content_param(description: str):
+    return {
+        "type": "object",
+        "properties": {
+            "content": {"type": "string", "description": description}
+        },
+        "required": ["content"]
+    }
+
+
+# --- System ---
+
+@tool(
+    "execute_command",
+    "Run a shell command on the host system (Windows PowerShell). Commands in a session share one shell, so the working directory, variables and activated environments carry over between calls.",
+    {
+        "type": "object",
+        "properties": {
+            "command": {"type": "string", "description": "The command to execute."},
+            "timeout": {"type": "number", "description": "Seconds before the command is killed. Raise it for builds, installs and downloads."}
+        },
+        "required": ["command"]
+    },
+    max_output_chars=20000
+)
+def handle_execute_command(args, ctx):
+    yield f">>> [Shell]: Executing command...\n"
+    tool_output = yield from stream_command(
+        args.get("command"), cancel=ctx.cancel, timeout=args.get("timeout"), session=ctx.session_id
+    )
+    display_output = (str(tool_output)[:500] + '...') if tool_output and len(str(tool_output)) > 500 else str(tool_output)
+    yield f">>> [Result]: {display_output}\n"
+    return tool_output
+
+
+def _describe_job(job):
+    line = f"{job['id']}: {job['status']}"
+    if job["exit_code"] is not None:
+        line += f" (exit code {job['exit_code']})"
+    elapsed = (job["ended_at"] or time.time()) - job["created_at"]
+    return f"{line}, {elapsed:.0f}s, $ {job['command'][:200]}"
+
+
+@tool(
+    "manage_background_job",
+    "Run a long shell command (build, install, download, scrape) in the background instead of execute_command, which is killed after its timeout. "
+    "'start' returns a job id at once and the user is notified when it ends; then use 'status', 'tail' (end of its log), 'wait' or 'kill'. "
+    "Jobs start in a fresh shell at the project root.",
+    {
+        "type": "object",
+        "properties": {
+            "action": {"type": "string", "enum": ["start", "status", "list", "tail", "wait", "kill"]},
+            "command": {"type": "string", "description": "The command to run (for start)"},
+            "job_id": {"type": "string", "description": "Job ID (for status, tail, wait, kill)"},
+            "lines": {"type": "integer", "description": "Log lines to show (for tail and wait; default 50)"},
+            "timeout": {"type": "number", "description": "Seconds to wait at most (for wait; default and max 30, then check again)"}
+        },
+        "required": ["action"]
+    },
+    parallel_safe={"status", "list", "tail"},
+    max_output_chars=20000
+)
+def handle_manage_background_job(args, ctx):
+    action = args.get("action")
+    lines = max(1, min(int(args.get("lines") or 50), 500))
+
+    if action == "start":
+        yield f">>> [Jobs]: Starting background job...\n"
+        try:
+            job_id = job_manager.start(ctx.recipient, args.get("command") or "", ctx.platform)
+        except Exception as e:
+            job_id = f"Failed to start job: {str(e)}"
+        job = job_manager.get(job_id)
+        tool_output = f"Job {job_id} started. Check it with action 'status' or 'tail'." if job else job_id
+        yield f">>> [Jobs]: {tool_output}\n"
+        return tool_output
+
+    if action == "list":
+        jobs = job_manager.list(ctx.recipient)
+        yield f">>> [Jobs]: {len(jobs)} jobs.\n"
+        return "\n".join(_describe_job(job) for job in jobs) or "No background jobs."
+
+    job = job_manager.get(args.get("job_id") or "", ctx.recipient)
+    if not job:
+        return f"Error: Job '{args.get('job_id')}' not found."
+
+    if action == "status":
+        tool_output = _describe_job(job)
+    elif action == "tail":
+        tool_output = job_manager.tail(job, lines) or "(no output yet)"
+    elif action == "wait":
+        timeout = min(float(args.get("timeout") or JOB_WAIT_MAX), JOB_WAIT_MAX)
+        yield f">>> [Jobs]: Waiting up to {timeout:g}s for {job['id']}...\n"
+        ended = job_manager.wait(job["id"], timeout, ctx.cancel)
+        job = job_manager.get(job["id"])
+        tool_output = _describe_job(job) if ended else f"Still running after {timeout:g}s. {_describe_job(job)}"
+        tool_output += f"\n{job_manager.tail(job, lines)}"
+    elif action == "kill":
+        killed = job_manager.kill(job["id"])
+        tool_output = f"Job {job['id']} killed." if killed else f"Job {job['id']} is not running (status: {job['status']})."
+    else:
+        tool_output = "Invalid action."
+    yield f">>> [Jobs]: {tool_output.splitlines()[0] if tool_output else action}\n"
+    return tool_output
+
+
+@tool(
+    "get_system_info",
+    "Discover system details, including available browsers and screen resolution. Use this before assuming specific software exists or for 'exploring' the machine.",
+    parallel_safe=True,
+    timeout=60
+)
+def handle_get_system_info(args, ctx):
+    yield f">>> [System]: Discovering environment...\n"
+    tool_output = get_system_info()
+    yield f">>> [Result]: {tool_output}\n"
+    return tool_output
+
+
+@tool(
+    "take_break",
+    "Take a rest for a specified duration to ensure system stability and mental clarity. Use this when tasks are completed or you need to pause.",
+    {
+        "type": "object",
+        "properties": {
+            "duration_minutes": {"type": "integer", "default": 30, "description": "Duration of the break in minutes (min 30)."}
+        },
+        "required": ["duration_minutes"]
+    }
+)
+def handle_take_break(args, ctx):
+    duration = max(30, args.get("duration_minutes", 30))
+    settings.BREAK_UNTIL = time.time() + (duration * 60)
+    tool_output = f"Break scheduled for {duration} minutes. I will be resting until {time.ctime(settings.BREAK_UNTIL)}."
+    yield f">>> [System]: {tool_output}\n"
+    return tool_output
+
+
+# --- Memory ---
+
+@tool(
+    "update_soul",
+    "Update persistent memory about the user (preferences, key details).",
+    _content_param("The new information to remember about the user.")
+)
+def handle_update_soul(args, ctx):
+    yield f">>> [Soul]: Updating user memory...\n"
+    tool_output = update_soul_memory(args.get("content"))
+    yield f">>> [Result]: {tool_output}\n"
+    return tool_output
+
+
+@tool(
+    "update_personality",
+    "Update your own persistent personality, emotional state, and internal rules based on interactions.",
+    _content_param("The updated PERSONALITY.md content including new traits, emotions, or rules.")
+)
+def handle_update_personality(args, ctx):
+    yield f">>> [Personality]: Evolving...\n"
+    tool_output = update_personality_memory(args.get("content"))
+    yield f">>> [Result]: {tool_output}\n"
+    return tool_output
+
+
+@tool(
+    "update_subconscious",
+    "Store innovative ideas, error patterns, technical realizations, or experimental computer tasks for future autonomous action. Use this to 'learn' from your environment.",
+    _content_param("The new content for your subconscious memory.")
+)
+def handle_update_subconscious(args, ctx):
+    yield f">>> [Subconscious]: Storing insight...\n"
+    tool_output = update_subconscious_memory(args.get("content"))
+    yield f">>> [Result]: {tool_output}\n"
+    return tool_output
+
+
+@tool(
+    "update_learning",
+    "Store best practices, refined workflows, lessons learned, and self-organization strategies evolved from your work. Use this to continuously improve your professional standards.",
+    _content_param("The new content for your learning memory.")
+)
+def handle_update_learning(args, ctx):
+    yield f">>> [Learning]: Evolving best practices...\n"
+    tool_output = update_learning_memory(args.get("content"))
+    yield f">>> [Result]: {tool_output}\n"
+    return tool_output
+
+
+# --- Sub-agents and sessions ---
+
+@tool(
+    "delegate_task",
+    "Delegate a complex, high-intensity, or background task to a sub-agent. Once delegated, YOU MUST STOP and wait; do not attempt the task yourself.",
+    {
+        "type": "object",
+        "properties": {
+            "sub_agent_name": {"type": "string"},
+            "task": {"type": "string"}
+        },
+        "required": ["sub_agent_name", "task"]
+    },
+    # STOP EXECUTION after delegation to prevent Redundant Work
+    stops_batch=True
+)
+def handle_delegate_task(args, ctx):
+    sub_agent_name = args.get("sub_agent_name")
+    task = args.get("task")
+    yield f">>> [Sub-Agent]: Delegating background task to '{sub_agent_name}'...\n"
+    tool_output = sub_agent_manager.delegate_task(ctx.recipient, sub_agent_name, task, platform=ctx.platform)
+    yield f"🔔 [System]: Background agent '{sub_agent_name}' has been started for task: {task[:100]}...\n"
+    yield f">>> [Status]: {tool_output}\n"
+
+    # Send immediate notification to user via their platform
+    try:
+        outbox.send_text(
+            ctx.recipient,
+            f"[LiteClaw] 🤖 **Sub-Agent '{sub_agent_name}' Started**\n\n📋 Task: {task[:200]}{'...' if len(task) > 200 else ''}\n\n⏳ Working in the background... I'll notify you when it's done!",
+            ctx.platform
+        )
+        yield f">>> [Notification]: Queued 'sub-agent started' message to user via {ctx.platform.title()}\n"
+    except Exception as e:
+        yield f">>> [Notification Warning]: Could not notify user: {e}\n"
+    return tool_output
+
+
+@tool(
+    "list_sub_agents",
+    "List all sub-agents and their statuses.",
+    parallel_safe=True
+)
+def handle_list_sub_agents(args, ctx):
+    yield f">>> [Sub-Agent]: Listing background agents...\n"
+    sub_agents = sub_agent_manager.list_sub_agents(ctx.recipient)
+    tool_output = json.dumps(sub_agents, indent=2)
+    yield f">>> [Found]: {len(sub_agents)} sub-agents.\n"
+    return tool_output
+
+
+@tool(
+    "kill_sub_agent",
+    "Gracefully terminate a specific sub-agent by name. Use this instead of system commands to stop sub-agents.",
+    {
+        "type": "object",
+        "properties": {
+            "sub_agent_name": {"type": "string", "description": "Name of the sub-agent to terminate."}
+        },
+        "required": ["sub_agent_name"]
+    }
+)
+def handle_kill_sub_agent(args, ctx):
+    sub_agent_name = args.get("sub_agent_name")
+    yield f">>> [Sub-Agent]: Terminating '{sub_agent_name}'...\n"
+    tool_output = sub_agent_manager.kill_sub_agent(ctx.recipient, sub_agent_name)
+    yield f">>> [Result]: {tool_output}\n"
+    return tool_output
+
+
+@tool(
+    "message_sub_agent",
+    "Send a message or instruction to another active sub-agent (including the Vision agent).",
+    {
+        "type": "object",
+        "properties": {
+            "sub_agent_name": {"type": "string", "description": "Name of the target sub-agent or 'vision'."},
+            "message": {"type": "string", "description": "The message or new goal to send."}
+        },
+        "required": ["sub_agent_name", "message"]
+    }
+)
+def handle_message_sub_agent(args, ctx):
+    sub_agent_name = args.get("sub_agent_name")
+    text = args.get("message")
+    # Identify sender
+    sender = getattr(ctx.agent, "name", "Session Agent")
+    yield f">>> [Comm]: Sending message to '{sub_agent_name}'...\n"
+    tool_output = sub_agent_manager.message_sub_agent(ctx.recipient, sub_agent_name, sender, text)
+    yield f">>> [Result]: {tool_output}\n"
+    return tool_output
+
+
+@tool(
+    "kill_all_sub_agents",
+    "Terminate all active sub-agents in the current session."
+)
+def handle_kill_all_sub_agents(args, ctx):
+    yield f">>> [Sub-Agent]: Terminating all sub-agents...\n"
+    tool_output = sub_agent_manager.kill_all_sub_agents(ctx.recipient)
+    yield f">>> [Result]: {tool_output}\n"
+    return tool_output
+
+
+@tool(
+    "create_session",
+    "Create a new independent session.",
+    {
+        "type": "object",
+        "properties": {
+            "session_id": {"type": "string"}
+        },
+        "required": ["session_id"]
+    }
+)
+def handle_create_session(args, ctx):
+    new_sid = args.get("session_id")
+    success = create_session(new_sid, parent_session_id=ctx.session_id)
+    tool_output = f"Session '{new_sid}' created." if success else "Error creating session."
+    yield f">>> [Session]: {tool_output}\n"
+    return tool_output
+
+
+# --- Web, skills and scheduling ---
+
+@tool(
+    "fetch_url_content",
+    "Fetch text content from a URL.",
+    {
+        "type": "object",
+        "properties": {
+            "url": {"type": "string"}
+        },
+        "required": ["url"]
+    },
+    parallel_safe=True,
+    timeout=30,
+    max_output_chars=10000
+)
+def handle_fetch_url_content(args, ctx):
+    tool_output = fetch_url_content(args.get("url"))
+    yield f">>> [Web]: Fetched {len(tool_output)} chars.\n"
+    return tool_output
+
+
+@tool(
+    "manage_skills",
+    "Download, read, or list community skills.",
+    {
+        "type": "object",
+        "properties": {
+            "action": {"type": "string", "enum": ["download", "read", "list"]},
+            "skill_name": {"type": "string", "description": "Name of the skill module."},
+            "url": {"type": "string", "description": "URL for download action."}
+        },
+        "required": ["action"]
+    },
+    parallel_safe={"read", "list"},
+    timeout=30
+)
+def handle_manage_skills(args, ctx):
+    action = args.get("action")
+    tool_output = "Invalid action."
+    if action == "download":
+        tool_output = download_skill(args.get("url"), args.get("skill_name"))
+    elif action == "read":
+        tool_output = get_skill_content(args.get("skill_name"))
+    elif action == "list":
+        tool_output = ", ".join(list_skills())
+    yield f">>> [Skills]: {action} complete.\n"
+    return tool_output
+
+
+@tool(
+    "manage_cron_job",
+    "Create, list, or delete scheduled cron jobs.",
+    {
+        "type": "object",
+        "properties": {
+            "action": {"type": "string", "enum": ["create", "list", "delete"]},
+            "name": {"type": "string", "description": "Name of the job (for create)"},
+            "schedule_type": {"type": "string", "enum": ["cron", "interval", "webhook"], "description": "Type of schedule"},
+            "schedule_value": {"type": "string", "description": "Cron string (e.g. '* * * * *') or seconds (e.g. '60')"},
+            "task": {"type": "string", "description": "The prompt/task for the agent to execute"},
+            "cacheable": {"type": "boolean", "description": "Reuse cached LLM answers when the same task repeats (for deterministic reports; default false)"},
+            "job_id": {"type": "string", "description": "Job ID (for delete)"}
+        },
+        "required": ["action"]
+    },
+    parallel_safe={"list"}
+)
+def handle_manage_cron_job(args, ctx):
+    action = args.get("action")
+
+    if action == "create":
+        yield f">>> [Cron]: Creating job '{args.get('name')}'...\n"
+        job_id = cron_manager.create_job(
+            args.get("name"),
+            args.get("schedule_type"),
+            args.get("schedule_value"),
+            args.get("task"),
+            bool(args.get("cacheable", False))
+        )
+        tool_output = f"Job created with ID: {job_id}. Type: {args.get('schedule_type')}"
+        if args.get('schedule_type') == 'webhook':
+            tool_output += f"\nWebhook URL: /cron/webhook/{job_id}"
+
+    elif action == "list":
+        yield f">>> [Cron]: Listing jobs...\n"
+        jobs = cron_manager.list_jobs()
+        tool_output = json.dumps(jobs, indent=2, default=str)
+        yield f">>> [Found]: {len(jobs)} jobs.\n"
+
+    elif action == "delete":
+        yield f">>> [Cron]: Deleting job '{args.get('job_id')}'...\n"
+        cron_manager.delete_job(args.get("job_id"))
+        tool_output = "Job deleted."
+    else:
+        tool_output = "Invalid action."
+    return tool_output
+
+
+# --- Media ---
+
+@tool(
+    "send_media",
+    "Send an image, video, gif, or document to the user.",
+    {
+        "type": "object",
+        "properties": {
+            "url_or_path": {"type": "string", "description": "Absolute local path or remote URL of the media file."},
+            "caption": {"type": "string", "description": "Optional caption for the media."},
+            "type": {"type": "string", "enum": ["image", "video", "gif", "document", "audio"], "description": "Type of media."}
+        },
+        "required": ["url_or_path", "type"]
+    },
+    timeout=120
+)
+def handle_send_media(args, ctx):
+    media_type = args.get('type')
+    yield f">>> [Media]: Sending {media_type}...\n"
+
+    caption = args.get("caption") or ""
+    if caption:
+        caption = f"[LiteClaw] {caption}"
+    else:
+        caption = "[LiteClaw]"
+
+    try:
+        outbox.send_media(ctx.recipient, args.get("url_or_path"), media_type, caption, ctx.platform)
+        tool_output = "Media queued for delivery."
+    except Exception as e:
+        tool_output = f"Failed to queue media: {str(e)}"
+    yield f">>> [Media Result]: {tool_output}\n"
+    return tool_output
+
+
+@tool(
+    "search_and_send_gif",
+    "Search for a hilarious GIF on Giphy and send it to the user.",
+    {
+        "type": "object",
+        "properties": {
+            "query": {"type": "string", "description": "The search term (e.g., 'hilarious cat', 'victory dance')."},
+            "caption": {"type": "string", "description": "Optional caption for the GIF."}
+        },
+        "required": ["query"]
+    },
+    timeout=60
+)
+def handle_search_and_send_gif(args, ctx):
+    yield f">>> [GIF]: Searching for '{args.get('query')}'...\n"
+
+    query = args.get("query")
+    caption = args.get("caption") or ""
+    giphy_key = settings.GIPHY_API_KEY
+
+    if not giphy_key:
+        tool_output = "GIPHY_API_KEY is not configured. Ask the user to run onboarding or set it in config.json."
+    else:
+        try:
+            # Search Giphy
+            giphy_url = "https://api.giphy.com/v1/gifs/search"
+            params = {
+                "api_key": giphy_key,
+                "q": query,
+                "limit": 20,
+                "rating": "pg"
+            }
+            r = requests.get(giphy_url, params=params)
+            data = r.json()
+            gifs = data.get('data', [])
+
+            if not gifs:
+                tool_output = f"No GIFs found for '{query}'"
+            else:
+                best_gif = random.choice(gifs)['images']['original']['url']
+
+                # Tag caption
+                final_caption = f"[LiteClaw] {caption}" if caption else "[LiteClaw]"
+
+                outbox.send_media(ctx.recipient, best_gif, "gif", final_caption, ctx.platform)
+                tool_output = f"Hilarious GIF sent! (Query: {query})"
+        except Exception as e:
+            tool_output = f"Giphy Search Error: {str(e)}"
+
+    yield f">>> [GIF Result]: {tool_output}\n"
+    return tool_output
+
+
+# --- Vision ---
+
+@tool(
+    "vision_task",
+    "PRIMARY tool for controlling the computer. Use this to click, type, and interact with ANY application on the screen (Windows, Apps, Browsers). Use this when asked to 'open a browser', 'use VS Code', 'check my email', etc.",
+    {
+        "type": "object",
+        "properties": {
+            "goal": {"type": "string", "description": "The goal or instruction for the vision agent."},
+            "max_steps": {"type": "integer", "default": 40, "description": "Maximum steps allowed."},
+            "is_correction": {"type": "boolean", "default": False, "description": "If true, this goal is treated as an immediate correction/feedback for the CURRENTLY running task."}
+        },
+        "required": ["goal"]
+    }
+)
+def handle_vision_task(args, ctx):
+    goal = args.get("goal")
+    vision = agent_module.GLOBAL_VISION_AGENT
+
+    if vision and vision.is_running:
+        if args.get("is_correction"):
+            # IMMEDIATE FEEDBACK
+            yield f">>> [Vision]: Injecting immediate correction...\n"
+            vision.add_feedback(goal)
+            tool_output = f"Correction injected: '{goal}'"
+        else:
+            # QUEUE GOAL
+            yield f">>> [Vision]: Agent busy. Injecting goal into active queue...\n"
+            vision.add_goal(goal)
+            tool_output = f"Goal '{goal}' queued. Position in queue: {len(vision.goal_queue)}"
+        yield f">>> [Result]: {tool_output}\n"
+        return tool_output
+
+    # START NEW AGENT
+    yield f">>> [Vision]: Starting new Vision Agent for goal: {goal}...\n"
+
+    # Create & Register Singleton
+    vision = VisionAgent(
+        goal=goal,
+        session_id=ctx.recipient,
+        platform=ctx.platform,
+        max_steps=args.get("max_steps", 15)
+    )
+    agent_module.GLOBAL_VISION_AGENT = vision
+
+    # Run in Background Thread (Daemon-like)
+    def run_vision_bg():
+        result = vision.run()
+        print(f"[Vision Thread] Finished. Result: {result}")
+
+    t = threading.Thread(target=run_vision_bg, daemon=True)
+    t.start()
+
+    tool_output = f"Vision Agent started. Goal '{goal}' is processing in background."
+    yield f">>> [Result]: {tool_output}\n"
+    return tool_output
@@ -0,0 +1,205 @@
+import asyncio
+import importlib
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Callable, Dict, Generator, List, Optional, Set, Tuple, Union
+
+from .config import settings
+
+# Modules whose import registers tools (via @tool). Imported once, on first
+# lookup or by warm_tools() at startup, so the agent loop never pays for it.
+TOOL_MODULES = (".tool_handlers",)
+
+# Pool for the read-only calls of a step that run concurrently
+TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=settings.TOOL_MAX_WORKERS, thread_name_prefix="liteclaw-tool")
+# Handlers with a timeout run here, so a parallel group never waits on its own pool
+_TIMED_EXECUTOR = ThreadPoolExecutor(max_workers=settings.TOOL_MAX_WORKERS, thread_name_prefix="liteclaw-tool-timed")
+# Event-loop turns run their other (serial) tools here. Those may block for
+# minutes (commands, job waits), so they must not hold TOOL_EXECUTOR threads
+# that other chats' read-only calls are waiting for.
+SERIAL_TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=settings.TOOL_SERIAL_MAX_WORKERS, thread_name_prefix="liteclaw-tool-serial")
+
+
+@dataclass
+class ToolContext:
+    """
+    What a handler knows about the call: the calling agent, its session, where
+    to reply and the run's CancelToken. `recipient` is the chat that messages
+    and questions go to; it differs from `session_id` only for sub-agents,
+    which keep their own history but report to the parent's chat.
+    """
+    agent: Any
+    session_id: str
+    platform: str
+    cancel: Any = None
+    recipient: Optional[str] = None
+
+    def __post_init__(self):
+        if self.recipient is None:
+            self.recipient = self.session_id
+
+
+@dataclass
+class ToolSpec:
+    """
+    Declarative description of one tool.
+
+    `handler(args, ctx)` is a generator: it yields progress lines and returns the
+    tool output. `parallel_safe` may be a bool or a set of `action` values that
+    are read-only (for multi-action tools like manage_cron_job).
+    """
+    name: str
+    description: str
+    handler: Callable[[Dict[str, Any], ToolContext], Generator[str, None, Any]]
+    parameters: Dict[str, Any] = field(default_factory=lambda: {"type": "object", "properties": {}})
+    parallel_safe: Union[bool, Set[str]] = False
+    timeout: Optional[float] = None # Seconds; the call is answered with an error after this
+    max_output_chars: Optional[int] = None # Output beyond this is cut (head and tail kept)
+    stops_batch: bool = False # Skip the rest of the step's tool calls after this one
+
+    def schema(self) -> Dict[str, Any]:
+        return {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": self.parameters
+            }
+        }
+
+    def is_parallel_safe(self, args: Dict[str, Any]) -> bool:
+        if isinstance(self.parallel_safe, bool):
+            return self.parallel_safe
+        return args.get("action") in self.parallel_safe
+
+
+_registry: Dict[str, ToolSpec] = {}
+_schemas: Optional[List[Dict[str, Any]]] = None
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def register_tool(spec: ToolSpec) -> ToolSpec:
+    global _schemas
+    if spec.name in _registry:
+        raise ValueError(f"Tool '{spec.name}' is already registered.")
+    _registry[spec.name] = spec
+    _schemas = None
+    return spec
+
+
+def tool(name: str, description: str, parameters: Optional[Dict[str, Any]] = None, **options):
+    """Decorator form of register_tool for handler functions."""
+    def decorator(handler):
+        spec = ToolSpec(name=name, description=description, handler=handler, **options)
+        if parameters is not None:
+            spec.parameters = parameters
+        register_tool(spec)
+        return handler
+    return decorator
+
+
+def warm_tools():
+    """Import every tool module once. Cheap after the first call."""
+    global _loaded
+    if _loaded:
+        return
+    with _load_lock:
+        if _loaded:
+            return
+        start = time.perf_counter()
+        for module in TOOL_MODULES:
+            importlib.import_module(module, __package__)
+        _loaded = True
+        print(f"[Tools] Registered {len(_registry)} tools in {(time.perf_counter() - start) * 1000:.0f} ms.")
+
+
+def get_tool(name: str) -> Optional[ToolSpec]:
+    warm_tools()
+    return _registry.get(name)
+
+
+def get_tool_schemas() -> List[Dict[str, Any]]:
+    """The `tools=` list for litellm, built once per registry change."""
+    global _schemas
+    warm_tools()
+    if _schemas is None:
+        _schemas = [spec.schema() for spec in _registry.values()]
+    return _schemas
+
+
+def cap_output(output: Any, max_chars: Optional[int]) -> Any:
+    """Keep the head and tail of an output longer than max_chars."""
+    if not max_chars or not isinstance(output, str) or len(output) <= max_chars:
+        return output
+    head = max_chars * 3 // 4
+    tail = max_chars - head
+    omitted = len(output) - head - tail
+    return f"{output[:head]}\n...[{omitted} chars truncated]...\n{output[-tail:]}"
+
+
+def _pump(gen: Generator, put: Callable[[Tuple[str, Any]], None]):
+    try:
+        while True:
+            put(("line", next(gen)))
+    except StopIteration as stop:
+        put(("done", stop.value))
+    except BaseException as e:
+        put(("error", e))
+
+
+def _run_with_timeout(spec: ToolSpec, gen: Generator) -> Generator[str, None, Any]:
+    # The handler runs on a pool thread; its progress is relayed live until the deadline.
+    # A handler that overruns keeps its thread until it finishes on its own.
+    lines = queue.Queue()
+    _TIMED_EXECUTOR.submit(_pump, gen, lines.put)
+    deadline = time.monotonic() + spec.timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        try:
+            kind, value = lines.get(timeout=max(remaining, 0))
+        except queue.Empty:
+            yield f">>> [Timeout]: {spec.name} did not finish within {spec.timeout:g}s.\n"
+            return f"Error: {spec.name} timed out after {spec.timeout:g} seconds."
+        if kind == "line":
+            yield value
+        elif kind == "done":
+            return value
+        else:
+            raise value
+
+
+def run_tool(spec: ToolSpec, args: Dict[str, Any], ctx: ToolContext) -> Generator[str, None, Any]:
+    """Run a tool's handler under its timeout and output cap. Yields progress, returns the output."""
+    if ctx.cancel:
+        ctx.cancel.raise_if_cancelled()
+    gen = spec.handler(args, ctx)
+    if spec.timeout:
+        output = yield from _run_with_timeout(spec, gen)
+    else:
+        output = yield from gen
+    return cap_output(output, spec.max_output_chars)
+
+
+async def arun_tool(spec: ToolSpec, args: Dict[str, Any], ctx: ToolContext) -> AsyncGenerator[Tuple[str, Any], None]:
+    """
+    Event-loop counterpart of run_tool. The blocking handler runs on
+    TOOL_EXECUTOR if the call is read-only, else on SERIAL_TOOL_EXECUTOR;
+    yields ("line", text) as it progresses, then ("done", output). The
+    handler keeps running if the caller goes away; cancel `ctx.cancel` to stop it.
+    """
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    put = lambda item: loop.call_soon_threadsafe(items.put_nowait, item)
+    executor = TOOL_EXECUTOR if spec.is_parallel_safe(args) else SERIAL_TOOL_EXECUTOR
+    loop.run_in_executor(executor, _pump, run_tool(spec, args, ctx), put)
+    while True:
+        kind, value = await items.get()
+        if kind == "error":
+            raise value
+        yield kind, value
+        if kind == "done":
+            return
@@ -4,6 +4,27 @@ import os
 import tempfile
 import uuid
 import re
+import signal
+import codecs
+import locale
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Generator, List, Optional, Tuple
+
+from .cancel import TurnCancelled
+from .config import settings
+
+# Bytes read from a command's pipe at a time
+COMMAND_READ_SIZE = 65536
+# Output chunks waiting to be consumed; a faster producer blocks on its pipe
+COMMAND_QUEUE_CHUNKS = 64
+# Latest output lines shown in each progress update, and their max length
+COMMAND_PROGRESS_LINES = 5
+COMMAND_LINE_PREVIEW = 200
+# Seconds to wait for the pipes after the shell exited or was killed
+COMMAND_EXIT_GRACE = 2.0
 
 # === CRITICAL SECURITY LAYER ===
 # Commands that would terminate the agent itself or damage the system
@@ -47,15 +68,245 @@ def is_command_safe(command: str) -> tuple[bool, str]:
     
     return True, ""
 
-def execute_command(command: str) -> str:
+def _kill_tree(proc: subprocess.Popen):
+    """Kill a command and everything it started (a shell's children would otherwise keep running)."""
+    if proc.poll() is not None:
+        return
+    try:
+        if platform.system() == "Windows":
+            subprocess.run(["taskkill", "/T", "/F", "/PID", str(proc.pid)], capture_output=True)
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except Exception:
+        proc.kill()
+
+class HeadTailBuffer:
+    """
+    Keeps the first `head` and last `tail` characters written to it, so what is
+    retained of a command's output stays the same size however much it prints.
+    """
+
+    def __init__(self, head: int, tail: int):
+        self.head_max = head
+        self.tail_max = tail
+        self.total = 0
+        self._head: List[str] = []
+        self._head_len = 0
+        self._tail: Deque[str] = deque()
+        self._tail_len = 0
+
+    def write(self, text: str):
+        self.total += len(text)
+        if self._head_len < self.head_max:
+            taken = text[:self.head_max - self._head_len]
+            self._head.append(taken)
+            self._head_len += len(taken)
+            text = text[len(taken):]
+        if not text or self.tail_max <= 0:
+            return
+        self._tail.append(text)
+        self._tail_len += len(text)
+        # Drop whole chunks from the left while the rest still fills the tail
+        while self._tail_len - len(self._tail[0]) >= self.tail_max:
+            self._tail_len -= len(self._tail.popleft())
+
+    def getvalue(self) -> str:
+        head = "".join(self._head)
+        tail = "".join(self._tail)[-self.tail_max:] if self.tail_max > 0 else ""
+        omitted = self.total - len(head) - len(tail)
+        if omitted > 0:
+            return f"{head}\n...[{omitted} chars omitted]...\n{tail}"
+        return head + tail
+
+def _read_stream(pipe, name: str, chunks: "queue.Queue"):
+    """Reader thread: decoded chunks of one pipe go to `chunks`, then (name, None) at EOF."""
+    decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace")
+    try:
+        while True:
+            data = pipe.read1(COMMAND_READ_SIZE)
+            if not data:
+                break
+            chunks.put((name, decoder.decode(data)))
+    except (OSError, ValueError):
+        pass # Pipe closed under us (process killed)
+    finally:
+        rest = decoder.decode(b"", final=True)
+        if rest:
+            chunks.put((name, rest))
+        chunks.put((name, None))
+
+def _command_timeout(timeout: Optional[float]) -> float:
+    """The per-call timeout, defaulting to COMMAND_TIMEOUT and capped at COMMAND_MAX_TIMEOUT."""
+    try:
+        timeout = float(timeout) if timeout else 0.0
+    except (TypeError, ValueError):
+        timeout = 0.0
+    if timeout <= 0:
+        timeout = settings.COMMAND_TIMEOUT
+    return min(timeout, settings.COMMAND_MAX_TIMEOUT)
+
+class CommandOutput:
+    """
+    The output of one command: stdout and stderr in HeadTailBuffers (stderr gets
+    a quarter of the budget, its useful part is usually the last error) plus
+    its latest lines for progress updates.
+    """
+
+    def __init__(self):
+        self.streams = {
+            "stdout": HeadTailBuffer(settings.COMMAND_OUTPUT_HEAD_CHARS, settings.COMMAND_OUTPUT_TAIL_CHARS),
+            "stderr": HeadTailBuffer(settings.COMMAND_OUTPUT_HEAD_CHARS // 4, settings.COMMAND_OUTPUT_TAIL_CHARS // 4),
+        }
+        self._partial = {"stdout": "", "stderr": ""}
+        self._recent: Deque[str] = deque(maxlen=COMMAND_PROGRESS_LINES)
+        self._unseen = 0
+        self._last_flush = time.monotonic()
+
+    def write(self, name: str, text: str):
+        self.streams[name].write(text)
+        lines = (self._partial[name] + text).split("\n")
+        self._partial[name] = lines.pop()[-COMMAND_LINE_PREVIEW:]
+        for line in lines:
+            if line.strip():
+                self._recent.append(line.rstrip()[:COMMAND_LINE_PREVIEW])
+                self._unseen += 1
+
+    def progress(self) -> List[str]:
+        """`>>> ` lines with output not shown yet, at most every COMMAND_PROGRESS_INTERVAL seconds."""
+        if not self._unseen or time.monotonic() - self._last_flush < settings.COMMAND_PROGRESS_INTERVAL:
+            return []
+        lines = []
+        if self._unseen > len(self._recent):
+            lines.append(f">>> [Shell]: ...{self._unseen - len(self._recent)} more lines\n")
+        lines.extend(f">>> [Shell]: {line}\n" for line in self._recent)
+        self._recent.clear()
+        self._unseen = 0
+        self._last_flush = time.monotonic()
+        return lines
+
+    def getvalue(self) -> str:
+        output = self.streams["stdout"].getvalue()
+        errors = self.streams["stderr"].getvalue()
+        if errors:
+            output += f"\nError:\n{errors}"
+        return output
+
+def _stream_process(args, timeout: float, cancel=None, **kwargs) -> Generator[str, None, str]:
+    """
+    Run a process, yielding `>>> ` progress lines with its latest output and
+    returning what CommandOutput retained of it, so memory stays constant. On
+    timeout or cancel the whole process group is killed.
     """
-    Executes a shell command on the local system.
+    if platform.system() != "Windows":
+        kwargs["start_new_session"] = True # Own process group, so _kill_tree reaches the children
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+    unregister = cancel.on_cancel(lambda: _kill_tree(proc)) if cancel else None
+
+    output = CommandOutput()
+    chunks: "queue.Queue" = queue.Queue(maxsize=COMMAND_QUEUE_CHUNKS)
+    for name, pipe in (("stdout", proc.stdout), ("stderr", proc.stderr)):
+        threading.Thread(target=_read_stream, args=(pipe, name, chunks), name=f"liteclaw-cmd-{name}", daemon=True).start()
+
+    open_streams = 2
+    timed_out = False
+    deadline = time.monotonic() + timeout
+    exited_at = None
+    try:
+        while open_streams:
+            if cancel:
+                cancel.raise_if_cancelled()
+            now = time.monotonic()
+            if now >= deadline:
+                timed_out = True
+                _kill_tree(proc)
+                break
+            if proc.poll() is not None:
+                exited_at = exited_at or now
+                if now - exited_at > COMMAND_EXIT_GRACE:
+                    break # Exited, but something it started in the background still holds the pipes
+            try:
+                name, text = chunks.get(timeout=0.2)
+                if text is None:
+                    open_streams -= 1
+                else:
+                    output.write(name, text)
+            except queue.Empty:
+                pass
+            yield from output.progress()
+
+        if timed_out:
+            # The killed group closes its pipes; keep what was still in flight
+            drain_until = time.monotonic() + COMMAND_EXIT_GRACE
+            while open_streams and time.monotonic() < drain_until:
+                try:
+                    name, text = chunks.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                if text is None:
+                    open_streams -= 1
+                else:
+                    output.write(name, text)
+    finally:
+        if unregister:
+            unregister()
+        if proc.poll() is None:
+            _kill_tree(proc) # Cancelled, or the caller stopped consuming
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+    if cancel:
+        cancel.raise_if_cancelled()
+
+    result = output.getvalue()
+    if timed_out:
+        result += f"\n[Command timed out after {timeout:g}s; it and its child processes were killed.]"
+    return result
+
+def _shell_args(command: str, project_root: str) -> Tuple[Any, Dict[str, Any], Optional[str]]:
+    """Popen args and kwargs for `command`, plus the temp script to delete afterwards (if any)."""
+    if platform.system() == "Windows":
+        # Detect complex commands that will fail with WinError 267
+        complexity_indicators = [
+            '@{',           # PowerShell hashtables
+            '| ConvertTo-Json',  # JSON conversion
+            'Invoke-RestMethod', # Web requests
+            'Invoke-WebRequest',
+            'try {',        # Try-catch blocks
+            len(command) > 200,  # Very long commands
+            command.count('"') > 4,  # Many nested quotes
+            command.count("'") > 4,
+        ]
+        
+        is_complex = any(complexity_indicators)
+        
+        if is_complex:
+            # Write to temp file and execute
+            temp_script = os.path.join(project_root, f"temp_{uuid.uuid4().hex[:8]}.ps1")
+            with open(temp_script, 'w', encoding='utf-8') as f:
+                f.write(command)
+            return ["powershell", "-ExecutionPolicy", "Bypass", "-File", temp_script], {"cwd": project_root}, temp_script
+        # Simple command - execute inline
+        return ["powershell", "-Command", command], {"cwd": project_root}, None
+    # Linux/Mac - use shell=True
+    return command, {"shell": True, "cwd": project_root}, None
+
+def stream_command(command: str, cancel=None, timeout: Optional[float] = None, session: Optional[str] = None) -> Generator[str, None, str]:
+    """
+    Executes a shell command on the local system, yielding `>>> ` progress lines
+    with its latest output while it runs. Returns the output (head and tail of
+    stdout and stderr).
     Automatically detects complex commands and writes them to temp files to avoid WinError 267.
     
     SECURITY: Commands that would terminate the agent or damage the system are blocked.
     
     Args:
         command: The command to execute.
+        cancel: Optional CancelToken; cancelling it kills the command.
+        timeout: Seconds before the command's process group is killed
+            (default COMMAND_TIMEOUT, at most COMMAND_MAX_TIMEOUT).
+        session: Agent session whose persistent shell runs the command
+            (see shell_sessions.py); None runs it in a fresh process.
         
     Returns:
         The output of the command or error message.
@@ -65,73 +316,41 @@ def execute_command(command: str) -> str:
     if not is_safe:
         return block_reason
     
+    temp_script = None
     try:
-        system = platform.system()
         project_root = r"d:\openclaw_lite"
         
         # Create project_root if it doesn't exist
         os.makedirs(project_root, exist_ok=True)
         
-        if system == "Windows":
-            # Detect complex commands that will fail with WinError 267
-            complexity_indicators = [
-                '@{',           # PowerShell hashtables
-                '| ConvertTo-Json',  # JSON conversion
-                'Invoke-RestMethod', # Web requests
-                'Invoke-WebRequest',
-                'try {',        # Try-catch blocks
-                len(command) > 200,  # Very long commands
-                command.count('"') > 4,  # Many nested quotes
-                command.count("'") > 4,
-            ]
-            
-            is_complex = any(complexity_indicators)
-            
-            if is_complex:
-                # Write to temp file and execute
-                temp_script = os.path.join(project_root, f"temp_{uuid.uuid4().hex[:8]}.ps1")
-                with open(temp_script, 'w', encoding='utf-8') as f:
-                    f.write(command)
-                
-                result = subprocess.run(
-                    ["powershell", "-ExecutionPolicy", "Bypass", "-File", temp_script],
-                    capture_output=True,
-                    text=True,
-                    timeout=60,
-                    cwd=project_root
-                )
-                
-                # Clean up temp file
-                try:
-                    os.remove(temp_script)
-                except:
-                    pass
-            else:
-                # Simple command - execute inline
-                result = subprocess.run(
-                    ["powershell", "-Command", command],
-                    capture_output=True,
-                    text=True,
-                    timeout=60,
-                    cwd=project_root
-                )
-        else:
-            # Linux/Mac - use shell=True
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=60,
-                cwd=project_root
-            )
-        
-        output = result.stdout
-        if result.stderr:
-            output += f"\nError:\n{result.stderr}"
-        return output
+        if session and settings.SHELL_SESSIONS:
+            from .shell_sessions import shell_pool
+            output = yield from shell_pool.run(session, command, _command_timeout(timeout), project_root, cancel)
+            if output is not None:
+                return output
+
+        args, kwargs, temp_script = _shell_args(command, project_root)
+        return (yield from _stream_process(args, _command_timeout(timeout), cancel, **kwargs))
+    except TurnCancelled:
+        raise
     except Exception as e:
         return f"Failed to execute command: {str(e)}"
+    finally:
+        if temp_script:
+            # Clean up temp file
+            try:
+                os.remove(temp_script)
+            except:
+                pass
+
+def execute_command(command: str, cancel=None, timeout: Optional[float] = None, session: Optional[str] = None) -> str:
+    """stream_command without the progress lines: runs the command and returns its output."""
+    gen = stream_command(command, cancel, timeout, session)
+    while True:
+        try:
+            next(gen)
+        except StopIteration as stop:
+            return stop.value
 
 def get_system_info() -> str:
     """
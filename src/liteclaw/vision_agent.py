@@ -4,13 +4,15 @@ import os
 import time
 import sys
 import uuid
-import requests
 from io import BytesIO
 from typing import Optional, Dict, Any, List, Tuple
 from collections import deque
 import threading
 from .config import settings
 from .llm import get_full_model_name, configure_bedrock_env
+from .outbox import outbox
+from .llm_cache import llm_cache
+from .ratelimit import llm_admission
 
 # Third-party imports
 pyautogui = None
@@ -36,6 +38,9 @@ except Exception as e:
 
 import litellm
 
+# Rough prompt cost of one screenshot, for tokens-per-minute admission
+VISION_IMAGE_TOKENS = 1500
+
 class VisionAgent:
     def __init__(self, goal: str, session_id: str, platform: str = "whatsapp", max_steps: int = 15):
         self.goal = goal
@@ -301,24 +306,13 @@ Do not return markdown code blocks. Just the raw JSON string.
         return f"Unknown action: {action_type}"
 
     def _send_screenshot_to_user(self, image: Any, caption: str):
-        """Save and send screenshot via bridge."""
+        """Save and queue the screenshot for the bridge."""
         filename = f"vision_{uuid.uuid4().hex[:8]}.png"
         path = os.path.join(self.screenshot_dir, filename)
         image.save(path)
         
         try:
-            from .main import WHATSAPP_BRIDGE_URL
-            import requests
-            
-            requests.post(f"{WHATSAPP_BRIDGE_URL}/whatsapp/send", json={
-                "to": self.session_id,
-                "message": f"[LiteClaw] 📸 {caption}",
-                "url_or_path": path,
-                "type": "image",
-                "caption": caption,
-                "is_media": True,
-                "platform": self.platform
-            })
+            outbox.send_media(self.session_id, path, "image", caption, self.platform, message=f"[LiteClaw] 📸 {caption}")
         except Exception as e:
             print(f"Failed to send screenshot: {e}")
 
@@ -343,9 +337,7 @@ Do not return markdown code blocks. Just the raw JSON string.
             pass
 
     def _notify_main_session(self, message: str):
-        """Send a notification message back to the main session via bridge."""
-        from .main import WHATSAPP_BRIDGE_URL
-        
+        """Queue a notification message back to the main session."""
         if len(message) > 1500:
             message = message[:1500] + "...[truncated]"
             
@@ -353,11 +345,7 @@ Do not return markdown code blocks. Just the raw JSON string.
         print(f"[Vision] Sending notification to {self.session_id}: {message[:50]}...")
         
         try:
-            requests.post(f"{WHATSAPP_BRIDGE_URL}/whatsapp/send", json={
-                "to": self.session_id,
-                "message": final_text,
-                "platform": self.platform
-            })
+            outbox.send_text(self.session_id, final_text, self.platform)
             
             try:
                 from .memory import add_message
@@ -406,7 +394,7 @@ Do not return markdown code blocks. Just the raw JSON string.
             # Process in background to avoid blocking
             def run_main_agent():
                 try:
-                    agent = LiteClawAgent()
+                    agent = LiteClawAgent(profile="vision_followup")
                     agent.process_message(follow_up_message, self.session_id, self.platform)
                 except Exception as e:
                     print(f"[Vision] Failed to trigger Main Agent: {e}")
@@ -465,21 +453,36 @@ Do not return markdown code blocks. Just the raw JSON string.
                         }
                     ]
 
-                    response = litellm.completion(
-                        model=self.full_model_name,
-                        messages=messages,
-                        api_key=self.api_key,
-                        base_url=self.base_url,
-                    )
-
-                    # LiteLLM returns OpenAI-style responses
-                    content = response.choices[0].message["content"]
+                    # Same goal, history and (perceptually) the same screen: reuse the decision
+                    cache_key = llm_cache.key(self.full_model_name, messages) if settings.LLM_CACHE_VISION and llm_cache.enabled else None
+                    cached = llm_cache.get(cache_key) if cache_key else None
+                    if cached:
+                        print("[Vision] Reusing cached decision for this screen.")
+                        content = cached["content"]
+                    else:
+                        started = time.monotonic()
+                        # A user is waiting on this task: admitted as interactive
+                        tokens = len(user_content_str) // 4 + VISION_IMAGE_TOKENS
+                        with llm_admission.slot(f"{self.provider}:{self.model_name}", "interactive", tokens):
+                            response = litellm.completion(
+                                model=self.full_model_name,
+                                messages=messages,
+                                api_key=self.api_key,
+                                base_url=self.base_url,
+                            )
+
+                        # LiteLLM returns OpenAI-style responses
+                        content = response.choices[0].message["content"]
                     actions = self.parse_response(content)
                     
                     if not actions:
                         print("[Vision] Failed to parse response. Retrying...")
                         time.sleep(2)
                         continue
+
+                    # Only decisions that parsed are worth replaying
+                    if cache_key and not cached:
+                        llm_cache.put(cache_key, self.full_model_name, {"content": content}, time.monotonic() - started)
                     
                     # 3. Act (Single Action)
                     action_data = actions[0]